@@ -1,16 +1,19 @@
 const express = require('express');
-const { exec } = require('child_process');
 const fs = require('fs');
 const path = require('path');
+const compareJobs = require('../utils/compareJobs');
+const compareMetrics = require('../utils/compareMetrics');
+const { protect, authorize } = require('../middleware/auth');
 
 const router = express.Router();
 
-// Endpoint to compare two PDFs
-router.post('/compare-pdfs', async (req, res) => {
+// Validate the two document paths of a request, relative to the backend directory
+function resolveDocuments(req, res) {
     const { pdf1Path, pdf2Path } = req.body;
 
     if (!pdf1Path || !pdf2Path) {
-        return res.status(400).json({ success: false, message: 'Both PDF paths are required' });
+        res.status(400).json({ success: false, message: 'Both PDF paths are required' });
+        return null;
     }
 
     const outputDir = path.join(__dirname, '../temp');
@@ -20,52 +23,107 @@ router.post('/compare-pdfs', async (req, res) => {
         fs.mkdirSync(outputDir, { recursive: true });
     }
 
-    const command = `python3 ${path.join(__dirname, '../utils/pdf_compare.py')} ${path.join(__dirname, "../", pdf1Path)} ${path.join(__dirname, "../", pdf2Path)}`;
+    const file1 = path.join(__dirname, "../", pdf1Path);
+    const file2 = path.join(__dirname, "../", pdf2Path);
+    return [file1, file2];
+}
 
-    console.log("Executing command: ", command);
-    exec(command, (error, stdout, stderr) => {
-        if (error) {
-            console.error('Error executing pdf_compare.py:', error);
-            console.error('stderr:', stderr);
-            return res.status(500).json({ success: false, message: 'Error comparing PDFs' });
-        }
+// Submit a comparison job, or reply with the queue-full error
+function submitJob(res, file1, file2) {
+    console.log("Comparing documents: ", file1, file2);
+    try {
+        // Runs on the long-lived pdf_compare.py worker pool
+        return compareJobs.submit(file1, file2);
+    } catch (error) {
+        res.set('Retry-After', '30');
+        res.status(error.statusCode || 500).json({ success: false, message: error.message });
+        return null;
+    }
+}
 
-        // Extract the report path from Python script output
-        // The Python script returns the full path to comparison_report.html
-        const reportPathMatch = stdout.match(/Report saved: (.+)/);
-        if (!reportPathMatch) {
-            console.error('Could not find report path in Python output');
-            return res.status(500).json({ success: false, message: 'Could not locate comparison report' });
-        }
+// Endpoint to compare two PDFs, replying once the comparison is done
+router.post('/compare-pdfs', async (req, res) => {
+    const files = resolveDocuments(req, res);
+    if (!files) {
+        return;
+    }
+    const job = submitJob(res, ...files);
+    if (!job) {
+        return;
+    }
 
-        const fullReportPath = reportPathMatch[1].trim();
-        console.log('Full report path:', fullReportPath);
-        
-        // Extract the relative path from backend/temp/
-        const tempDir = path.join(__dirname, '../temp');
-        const relativePath = path.relative(tempDir, fullReportPath);
-        const htmlPath = `/temp/${relativePath.replace(/\\/g, '/')}`;  // Ensure forward slashes for URL
-        
-        console.log('Serving HTML at:', htmlPath);
-
-        // Serve the generated HTML file
-        res.json({ success: true, htmlPath: htmlPath });
-
-        // Delete the directory after a delay (10 minutes)
-        setTimeout(() => {
-            const comparisonDir = path.dirname(fullReportPath);
-            if (fs.existsSync(comparisonDir)) {
-                // Remove directory recursively
-                fs.rm(comparisonDir, { recursive: true, force: true }, (err) => {
-                    if (err) {
-                        console.error('Error deleting temporary folder:', err);
-                    } else {
-                        console.log('Deleted temporary folder:', comparisonDir);
-                    }
-                });
-            }
-        }, 10 * 60 * 1000); // 10 minutes
+    await compareJobs.wait(job);
+    if (job.status === 'failed') {
+        return res.status(500).json({ success: false, message: 'Error comparing PDFs' });
+    }
+    if (!compareJobs.resultAvailable(job)) {
+        return res.status(404).json({ success: false, message: 'Comparison report is no longer available' });
+    }
+
+    // Serve the generated HTML file (and differences.json) from backend/temp/
+    console.log('Serving HTML at:', job.result.htmlPath);
+    res.json({ success: true, ...job.result });
+});
+
+// Submit a comparison job; its status is polled at /compare-jobs/:id or streamed from /compare-jobs/:id/events
+router.post('/compare-jobs', (req, res) => {
+    const files = resolveDocuments(req, res);
+    if (!files) {
+        return;
+    }
+    const job = submitJob(res, ...files);
+    if (!job) {
+        return;
+    }
+    res.status(202).json({ success: true, job: compareJobs.view(job) });
+});
+
+// Status, stage and progress of a comparison job (with the report URLs once done)
+router.get('/compare-jobs/:id', (req, res) => {
+    const job = compareJobs.get(req.params.id);
+    if (!job) {
+        return res.status(404).json({ success: false, message: 'Comparison job not found' });
+    }
+    if (job.status === 'done' && !compareJobs.resultAvailable(job)) {
+        return res.status(404).json({ success: false, message: 'Comparison report is no longer available' });
+    }
+    res.json({ success: true, job: compareJobs.view(job) });
+});
+
+// Server-sent events: the job's status on connect and on every change, until it is done or failed
+router.get('/compare-jobs/:id/events', (req, res) => {
+    const job = compareJobs.get(req.params.id);
+    if (!job) {
+        return res.status(404).json({ success: false, message: 'Comparison job not found' });
+    }
+
+    res.set({
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive'
     });
+    res.flushHeaders();
+
+    const send = (view) => {
+        if (view.id !== job.id) {
+            return;
+        }
+        res.write(`data: ${JSON.stringify(view)}\n\n`);
+        if (view.status === 'done' || view.status === 'failed') {
+            compareJobs.off('update', send);
+            res.end();
+        }
+    };
+    compareJobs.on('update', send);
+    req.on('close', () => compareJobs.off('update', send));
+    send(compareJobs.view(job));
+});
+
+// Comparison job and per-stage metrics (timings, CPU, peak RSS, page/block counts) in the Prometheus text format.
+// Admin only: they expose the server's load and memory use.
+router.get('/metrics', protect, authorize('admin', 'superadmin'), (req, res) => {
+    res.type('text/plain; version=0.0.4');
+    res.send(compareMetrics.render({ queueDepth: compareJobs.queue.length, running: compareJobs.running }));
 });
 
-module.exports = router;
\ No newline at end of file
+module.exports = router;
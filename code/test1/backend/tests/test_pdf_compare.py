@@ -0,0 +1,649 @@
+"""Unit tests for utils/pdf_compare.py."""
+
+import random
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+
+import pdf_compare  # noqa: E402
+
+
+def lcs_length(seq1, seq2) -> int:
+    """Length of the longest common subsequence, by plain dynamic programming."""
+    previous = [0] * (len(seq2) + 1)
+    for item1 in seq1:
+        current = [0]
+        for j, item2 in enumerate(seq2):
+            current.append(previous[j] + 1 if item1 == item2 else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def assert_valid_opcodes(opcodes, seq1, seq2):
+    """Opcodes cover both sequences in order, and 'equal' ranges really are equal."""
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        assert tag in ('equal', 'replace', 'delete', 'insert')
+        if tag == 'equal':
+            assert seq1[i1:i2] == seq2[j1:j2]
+        if tag == 'delete':
+            assert j1 == j2 and i1 < i2
+        if tag == 'insert':
+            assert i1 == i2 and j1 < j2
+        i, j = i2, j2
+    assert (i, j) == (len(seq1), len(seq2))
+
+
+def matched(opcodes) -> int:
+    return sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_diff_engines_against_lcs(seed):
+    rng = random.Random(seed)
+    alphabet = [f'line {n}' for n in range(rng.randint(1, 8))]
+    seq1 = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+    seq2 = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+    best = lcs_length(seq1, seq2)
+
+    for engine in pdf_compare.DIFF_ENGINES:
+        opcodes = pdf_compare.diff_opcodes(seq1, seq2, engine)
+        assert_valid_opcodes(opcodes, seq1, seq2)
+        assert matched(opcodes) <= best
+    # Myers finds a shortest edit script, so it matches a longest common subsequence
+    assert matched(pdf_compare.diff_opcodes(seq1, seq2, 'myers')) == best
+
+
+def test_patience_keeps_unique_lines_anchored():
+    seq1 = ['a', 'x', 'x', 'unique', 'x', 'b']
+    seq2 = ['x', 'unique', 'x', 'x', 'b']
+
+    opcodes = pdf_compare.diff_opcodes(seq1, seq2, 'patience')
+
+    assert_valid_opcodes(opcodes, seq1, seq2)
+    # 'unique' (seq1[3], seq2[1]) is matched to itself
+    assert any(tag == 'equal' and i1 <= 3 < i2 and j1 + 3 - i1 == 1 for tag, i1, i2, j1, _ in opcodes)
+
+
+@pytest.mark.parametrize('seq1, seq2', [([], []), ([], ['a']), (['a'], []), (['a', 'b'], ['a', 'b'])])
+def test_diff_engines_edge_cases(seq1, seq2):
+    for engine in pdf_compare.DIFF_ENGINES:
+        opcodes = pdf_compare.diff_opcodes(seq1, seq2, engine)
+        assert_valid_opcodes(opcodes, seq1, seq2)
+        assert matched(opcodes) == lcs_length(seq1, seq2)
+
+
+def test_diff_opcodes_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        pdf_compare.diff_opcodes(['a'], ['b'], 'unknown')
+
+
+def page(content: int) -> frozenset:
+    """Signature of a page with its own text: pages with the same content are identical."""
+    return frozenset(range(content * 10, content * 10 + 10))
+
+
+def assert_valid_alignment(rows, n, m):
+    """Every page of both documents appears exactly once, in reading order."""
+    pages1 = [page1 for page1, _ in rows if page1 is not None]
+    pages2 = [page2 for _, page2 in rows if page2 is not None]
+    assert pages1 == list(range(n))
+    assert pages2 == list(range(m))
+    assert all(row != (None, None) for row in rows)
+
+
+@pytest.mark.parametrize('n, m, expected', [
+    (0, 0, []),
+    (0, 2, [(None, 0), (None, 1)]),
+    (2, 0, [(0, None), (1, None)]),
+])
+def test_align_pages_empty_sides(n, m, expected):
+    assert pdf_compare.align_pages([page(k) for k in range(n)], [page(k) for k in range(m)]) == expected
+
+
+def test_align_pages_all_equal():
+    signatures = [page(k) for k in range(30)]
+
+    assert pdf_compare.align_pages(signatures, list(signatures)) == [(k, k) for k in range(30)]
+
+
+def test_align_pages_identical_pages_pair_in_order():
+    rows = pdf_compare.align_pages([page(0)] * 5, [page(0)] * 3)
+
+    assert_valid_alignment(rows, 5, 3)
+    assert sum(1 for page1, page2 in rows if page1 is not None and page2 is not None) == 3
+
+
+def test_align_pages_without_text_pair_in_order():
+    assert pdf_compare.align_pages([frozenset()] * 3, [frozenset()] * 3) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_align_pages_finds_inserted_and_deleted_pages():
+    signatures1 = [page(k) for k in range(10)]
+    signatures2 = signatures1[:3] + [page(100)] + signatures1[3:7] + signatures1[8:]
+
+    rows = pdf_compare.align_pages(signatures1, signatures2)
+
+    assert_valid_alignment(rows, 10, 10)
+    assert (None, 3) in rows
+    assert (7, None) in rows
+    assert (9, 9) in rows
+
+
+def test_align_pages_follows_shifts_inside_the_band():
+    shift = pdf_compare.PAGE_ALIGNMENT_BAND - 5
+    signatures1 = [page(k) for k in range(60)]
+    signatures2 = [page(1000 + k) for k in range(shift)] + signatures1
+
+    rows = pdf_compare.align_pages(signatures1, signatures2)
+
+    assert_valid_alignment(rows, 60, 60 + shift)
+    assert all((k, k + shift) in rows for k in range(60))
+
+
+def test_align_pages_shift_beyond_the_band_stays_valid():
+    # The same length on both sides, with every page moved further than the band allows
+    shift = pdf_compare.PAGE_ALIGNMENT_BAND + 10
+    signatures1 = [page(k) for k in range(60)]
+    signatures2 = [page(1000 + k) for k in range(shift)] + signatures1[:60 - shift]
+
+    rows = pdf_compare.align_pages(signatures1, signatures2)
+
+    assert_valid_alignment(rows, 60, 60)
+    assert not any((k, k + shift) in rows for k in range(60 - shift))
+
+
+
+def test_align_pages_page_count_difference_beyond_the_band():
+    extra = 3 * pdf_compare.PAGE_ALIGNMENT_BAND
+    signatures1 = [page(k) for k in range(10)]
+    signatures2 = [page(1000 + k) for k in range(extra)] + signatures1
+
+    rows = pdf_compare.align_pages(signatures1, signatures2)
+
+    assert_valid_alignment(rows, 10, 10 + extra)
+    assert all((k, k + extra) in rows for k in range(10))
+
+def block_table(pages) -> pdf_compare.BlockTable:
+    """A BlockTable with one row per line, 100 points apart down each page, and words 50 points apart."""
+    blocks = pdf_compare.BlockTable(len(pages))
+    for page_num, lines in enumerate(pages):
+        for k, line in enumerate(lines):
+            y0, y1 = 100.0 * k, 100.0 * k + 12
+            word_bboxes = [coord for i in range(len(line.split()))
+                           for coord in (72.0 + 50 * i, y0, 112.0 + 50 * i, y1)]
+            blocks.append(line, (72.0, y0, 300.0, y1), page_num, word_bboxes)
+    return blocks
+
+
+def test_find_text_differences_reports_changed_repeat_of_a_line():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    blocks1 = block_table([['Total due', 'Terms apply', 'Total due', 'Signed']])
+    blocks2 = block_table([['Total due', 'Terms apply', 'Total paid', 'Signed']])
+
+    differences = comparator.find_text_differences(blocks1, blocks2)
+
+    assert not differences['deletions'] and not differences['insertions']
+    assert [(side, block.text, block.bbox) for side, block in differences['modifications']] == [
+        ('old', 'Total due', (72.0, 200.0, 300.0, 212.0)),
+        ('new', 'Total paid', (72.0, 200.0, 300.0, 212.0)),
+    ]
+
+
+def test_find_text_differences_reports_changed_repeat_on_a_later_page():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    blocks1 = block_table([['Total due', 'Page one'], ['Total due', 'Page two']])
+    blocks2 = block_table([['Total due', 'Page one'], ['Total paid', 'Page two']])
+
+    differences = comparator.find_text_differences(blocks1, blocks2, [(0, 0), (1, 1)])
+
+    assert [(side, block.text, block.page_num) for side, block in differences['modifications']] == [
+        ('old', 'Total due', 1), ('new', 'Total paid', 1)]
+
+
+PAGES = [['Title', 'Intro'], ['Terms', 'Price'], ['Notes', 'Signed']]
+
+
+def line_regions(pages1, pages2, pairs):
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    blocks1, blocks2 = block_table(pages1), block_table(pages2)
+    lines1, rows1 = comparator.flatten_blocks(blocks1)
+    lines2, rows2 = comparator.flatten_blocks(blocks2)
+    return comparator.differing_regions(blocks1, rows1, lines1, blocks2, rows2, lines2, pairs)
+
+
+def test_differing_regions_skips_identical_pages():
+    assert line_regions(PAGES, PAGES, [(0, 0), (1, 1), (2, 2)]) == []
+
+
+def test_differing_regions_covers_only_the_changed_page():
+    pages2 = [PAGES[0], ['Terms', 'New price'], PAGES[2]]
+
+    assert line_regions(PAGES, pages2, [(0, 0), (1, 1), (2, 2)]) == [((2, 4), (2, 4))]
+
+
+def test_differing_regions_joins_consecutive_changed_pages():
+    pages2 = [['Title', 'Preface'], ['Terms', 'New price'], PAGES[2]]
+
+    assert line_regions(PAGES, pages2, [(0, 0), (1, 1), (2, 2)]) == [((0, 4), (0, 4))]
+
+
+def test_differing_regions_with_page_count_mismatch():
+    # A page removed from the middle, and one added at the end
+    assert line_regions(PAGES, [PAGES[0], PAGES[2]], [(0, 0), (1, None), (2, 1)]) == [((2, 4), (2, 2))]
+    assert line_regions(PAGES, PAGES + [['Appendix']], [(0, 0), (1, 1), (2, 2), (None, 3)]) == [((6, 6), (6, 7))]
+
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    differences = comparator.find_text_differences(block_table(PAGES), block_table(PAGES + [['Appendix']]),
+                                                   [(0, 0), (1, 1), (2, 2), (None, 3)])
+    assert [(block.text, block.page_num) for block in differences['insertions']] == [('Appendix', 3)]
+    assert not differences['deletions'] and not differences['modifications']
+
+
+def test_merge_rectangles_merges_overlapping_and_touching():
+    rects = [[0, 0, 10, 10], [5, 5, 15, 15], [15, 0, 20, 5], [40, 40, 50, 50]]
+
+    assert sorted(pdf_compare.merge_rectangles(rects)) == [(0, 0, 20, 15), (40, 40, 50, 50)]
+
+
+def test_merge_rectangles_gap():
+    rects = [[0, 0, 10, 10], [12, 0, 20, 10]]
+
+    assert len(pdf_compare.merge_rectangles(rects)) == 2
+    assert pdf_compare.merge_rectangles(rects, gap=2) == [(0, 0, 20, 10)]
+
+
+def test_merge_rectangles_chains_through_later_rectangles():
+    # The first and last only touch through the middle one, which starts lower
+    rects = [[0, 0, 10, 10], [30, 0, 40, 10], [8, 8, 32, 20]]
+
+    assert pdf_compare.merge_rectangles(rects) == [(0, 0, 40, 20)]
+
+
+def test_merge_rectangles_empty():
+    assert pdf_compare.merge_rectangles([]) == []
+
+
+def blank_page(size=(200, 200)) -> Image.Image:
+    return Image.new('RGB', size, 'white')
+
+
+def page_with_box(box, size=(200, 200)) -> Image.Image:
+    image = blank_page(size)
+    ImageDraw.Draw(image).rectangle(box, fill='black')
+    return image
+
+
+def test_pixel_diff_regions_identical_pages():
+    pytest.importorskip("numpy")
+    image = page_with_box((50, 50, 100, 100))
+
+    assert pdf_compare.pixel_diff_regions(image, image.copy()) == []
+
+
+def test_pixel_diff_regions_insertion_and_deletion():
+    pytest.importorskip("numpy")
+    blank, boxed = blank_page(), page_with_box((50, 50, 100, 100))
+
+    (kind, (x0, y0, x1, y1)), = pdf_compare.pixel_diff_regions(blank, boxed)
+    assert kind == 'insertion'
+    assert x0 <= 50 and y0 <= 50 and x1 >= 100 and y1 >= 100
+
+    (kind, _), = pdf_compare.pixel_diff_regions(boxed, blank)
+    assert kind == 'deletion'
+
+
+def test_pixel_diff_regions_modification():
+    pytest.importorskip("numpy")
+    # Horizontal strokes replaced by vertical ones in the same place: ink both added and removed
+    before, after = blank_page(), blank_page()
+    for offset in range(50, 100, 10):
+        ImageDraw.Draw(before).rectangle((50, offset, 100, offset + 3), fill='black')
+        ImageDraw.Draw(after).rectangle((offset, 50, offset + 3, 100), fill='black')
+
+    assert [kind for kind, _ in pdf_compare.pixel_diff_regions(before, after)] == ['modification']
+
+
+def test_pixel_diff_regions_tolerates_small_shifts():
+    pytest.importorskip("numpy")
+    before = page_with_box((50, 50, 52, 100))
+    after = page_with_box((51, 51, 53, 101))
+
+    assert pdf_compare.pixel_diff_regions(before, after) == []
+
+
+def test_pixel_diff_regions_pads_smaller_page():
+    pytest.importorskip("numpy")
+    small = blank_page((100, 100))
+    large = page_with_box((120, 120, 180, 180), size=(200, 200))
+
+    (kind, (x0, y0, x1, y1)), = pdf_compare.pixel_diff_regions(small, large)
+    assert kind == 'insertion'
+    assert x0 >= 100 and y0 >= 100 and x1 <= 200 and y1 <= 200
+
+
+def test_count_differences_keeps_visual_regions_apart():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    block = pdf_compare.TextBlock('changed line', (0, 0, 10, 10), 0)
+    differences = {
+        'deletions': [block], 'insertions': [], 'modifications': [],
+        'visual': [('insertion', 1, 1, (0, 0, 5, 5)), ('modification', 1, 1, (10, 10, 20, 20))],
+        'pages': [(0, 0), (1, 1)],
+    }
+
+    counts = comparator.count_differences(differences)
+
+    assert (counts['deletions'], counts['insertions'], counts['modifications']) == (1, 0, 0)
+    assert counts['visual'] == 2
+    assert counts['total'] == 3
+
+
+def write_stale_dimension_workbook(path: Path, rows: int) -> Path:
+    """Write a workbook whose <dimension> tag claims a single cell ("A1")."""
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.append(['ID', 'Name'])
+    for i in range(1, rows):
+        worksheet.append([i, f'name {i}'])
+    full = path.with_name('full_' + path.name)
+    workbook.save(full)
+
+    with zipfile.ZipFile(full) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename.startswith('xl/worksheets/'):
+                data = re.sub(rb'<dimension ref="[^"]*"/>', b'<dimension ref="A1"/>', data)
+            target.writestr(item, data)
+    return path
+
+
+def test_read_xlsx_sheets_ignores_stale_dimension(tmp_path):
+    path = write_stale_dimension_workbook(tmp_path / 'stale.xlsx', 500)
+
+    sheet, = pdf_compare.read_xlsx_sheets(str(path))
+
+    assert len(sheet) == 500
+    assert sheet.row_cells(0) == ['ID', 'Name']
+    assert sheet.row_cells(499) == ['499', 'name 499']
+
+
+def test_xlsx_conversion_ignores_stale_dimension(tmp_path, monkeypatch):
+    platypus = pytest.importorskip("reportlab.platypus")
+    path = write_stale_dimension_workbook(tmp_path / 'stale.xlsx', 500)
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    comparator.temp_conversion_dir = tmp_path
+
+    # Small chunks, so the first ones hold narrower values ('name 9') than the last ('name 499')
+    monkeypatch.setattr(pdf_compare, 'XLSX_CHUNK_ROWS', 50)
+    chunk_widths = []
+
+    class RecordingTable(platypus.Table):
+        def __init__(self, rows, colWidths=None, **kwargs):
+            chunk_widths.append(list(colWidths))
+            super().__init__(rows, colWidths=colWidths, **kwargs)
+
+    monkeypatch.setattr(platypus, 'Table', RecordingTable)
+
+    pdf_path = comparator.convert_xlsx_to_pdf(str(path))
+
+    with pdf_compare.fitz.open(pdf_path) as document:
+        text = ''.join(page.get_text() for page in document)
+    assert 'name 499' in text
+    # Every chunk of the sheet (and every part of a chunk split across pages) has the same columns
+    assert len(chunk_widths) >= 10
+    assert all(widths == chunk_widths[0] for widths in chunk_widths)
+
+
+
+SHEET = [['ID', 'Name', 'Qty'], ['1', 'apple', '3'], ['2', 'pear', '5'], ['3', 'plum', '7'], ['4', 'fig', '9']]
+
+
+def sheet_table(rows, name='Sheet1'):
+    sheet = pdf_compare.SheetTable(name)
+    for row_number, cells in enumerate(rows, 1):
+        sheet.append(row_number, cells)
+    return sheet
+
+
+def sheet_changes(rows1, rows2, sheet_key=None):
+    """(type, old location and text, new location and text) of each change between two sheets."""
+    pytest.importorskip("openpyxl")
+    comparator = pdf_compare.DocumentComparator(use_cache=False, sheet_key=sheet_key)
+    differences = comparator.diff_xlsx_sheets([sheet_table(rows1)], [sheet_table(rows2)])
+    return [(kind, old and (old.location, old.text), new and (new.location, new.text))
+            for kind, old, new in differences['changes']]
+
+
+def test_diff_sheet_reports_inserted_row():
+    rows2 = SHEET[:2] + [['9', 'kiwi', '1']] + SHEET[2:]
+
+    assert sheet_changes(SHEET, rows2) == [('insertion', None, ('Row 3', '9 | kiwi | 1'))]
+
+
+def test_diff_sheet_reports_deleted_row():
+    rows2 = SHEET[:2] + SHEET[3:]
+
+    assert sheet_changes(SHEET, rows2) == [('deletion', ('Row 3', '2 | pear | 5'), None)]
+
+
+def test_diff_sheet_reports_inserted_column_once():
+    rows2 = [row[:1] + [color] + row[1:] for row, color in zip(SHEET, ['Color', 'red', 'green', 'blue', 'black'])]
+
+    assert sheet_changes(SHEET, rows2) == [('insertion', None, ('Column B', 'Color'))]
+
+
+def test_diff_sheet_does_not_report_moved_row():
+    rows2 = [SHEET[0], SHEET[3], SHEET[1], SHEET[2], SHEET[4]]
+
+    assert sheet_changes(SHEET, rows2) == []
+    assert sheet_changes(SHEET, rows2, sheet_key='ID') == []
+
+
+def test_diff_sheet_pairs_moved_and_edited_row_on_key():
+    rows2 = [SHEET[0], SHEET[3], SHEET[1], ['2', 'pear', '6'], SHEET[4]]
+
+    assert sheet_changes(SHEET, rows2) == [('deletion', ('Row 3', '2 | pear | 5'), None),
+                                          ('insertion', None, ('Row 4', '2 | pear | 6'))]
+    for sheet_key in ('ID', 'a'):
+        assert sheet_changes(SHEET, rows2, sheet_key=sheet_key) == [('modification', ('C3', '5'), ('C4', '6'))]
+
+
+def test_diff_sheet_falls_back_to_content_for_unknown_key():
+    rows2 = SHEET[:2] + SHEET[3:]
+
+    assert sheet_changes(SHEET, rows2, sheet_key='Price') == sheet_changes(SHEET, rows2)
+
+
+@pytest.mark.parametrize('sheet_key', [None, 'ID'])
+def test_diff_sheet_pairs_duplicate_keys_on_content(sheet_key):
+    rows1 = [SHEET[0], ['1', 'a', '1'], ['1', 'b', '2'], ['2', 'c', '3']]
+
+    assert sheet_changes(rows1, [SHEET[0], ['1', 'b', '2'], ['2', 'c', '3']], sheet_key) == \
+        [('deletion', ('Row 2', '1 | a | 1'), None)]
+    assert sheet_changes(rows1, [SHEET[0], ['1', 'a', '1'], ['1', 'b', '5'], ['2', 'c', '3']], sheet_key) == \
+        [('modification', ('C3', '2'), ('C3', '5'))]
+
+
+def test_align_sheet_columns_pairs_headers():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    sheet1 = sheet_table([['ID', 'Name', 'Qty'], ['1', 'apple', '3', 'extra']])
+    sheet2 = sheet_table([['ID', 'Qty', 'Price'], ['1', '3', '2.5', 'extra']])
+
+    assert comparator.align_sheet_columns(sheet1, sheet2) == [(0, 0), (1, None), (2, 1), (None, 2), (3, 3)]
+
+
+def test_align_sheet_rows_pairs_moved_rows():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    sheet1, sheet2 = sheet_table(SHEET), sheet_table([SHEET[0], SHEET[4], SHEET[1], SHEET[2], SHEET[3]])
+    common = [(0, 0), (1, 1), (2, 2)]
+
+    rows = comparator.align_sheet_rows(sheet1, sheet2, common, comparator.sheet_row_hashes(sheet1, sheet2, common))
+
+    assert sorted(rows) == [(0, 0), (1, 2), (2, 3), (3, 4), (4, 1)]
+
+
+def test_changed_row_pairs_keeps_pairs_with_different_hashes():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    hashes = ([10, 20, 30], [10, 21, 30])
+
+    assert comparator.changed_row_pairs([(0, 0), (1, 1), (2, 2)], hashes) == [(1, 1)]
+    assert comparator.changed_row_pairs([], hashes) == []
+
+
+def test_sheet_key_columns_by_header_name_or_letter():
+    pytest.importorskip("openpyxl")
+    sheet1 = sheet_table([['Name', 'ID'], ['apple', '1']])
+    sheet2 = sheet_table([['ID', 'Name'], ['1', 'apple']])
+    common = [(0, 1), (1, 0)]
+
+    def key_columns(sheet_key):
+        comparator = pdf_compare.DocumentComparator(use_cache=False, sheet_key=sheet_key)
+        return comparator._sheet_key_columns(sheet1, sheet2, common)
+
+    assert key_columns(None) is None
+    assert key_columns('id') == (1, 0)
+    assert key_columns('B') == (1, 0)
+    assert key_columns('C') is None
+
+@pytest.mark.parametrize('job', [7, [], 'x', None, {'file1': 'a', 'file2': 'b'},
+                                 {'id': 5, 'file1': 'a', 'file2': 'b'}, {'id': '1', 'file1': 'a'}])
+def test_validate_job_rejects_malformed_lines(job):
+    assert pdf_compare._validate_job(job)
+
+
+def test_validate_job_accepts_job():
+    assert pdf_compare._validate_job({'id': '1', 'file1': 'a.pdf', 'file2': 'b.pdf'}) is None
+
+
+def test_result_key_depends_on_file_names(tmp_path):
+    cache = pdf_compare.ComparisonCache(tmp_path)
+
+    key = cache.result_key('hash1', 'hash2', {}, ('a.pdf', 'b.pdf'))
+
+    assert key == cache.result_key('hash1', 'hash2', {}, ('a.pdf', 'b.pdf'))
+    assert key != cache.result_key('hash1', 'hash2', {}, ('c.pdf', 'b.pdf'))
+
+
+def test_evict_skips_entries_in_use_by_another_cache(tmp_path):
+    reader = pdf_compare.ComparisonCache(tmp_path, max_bytes=0)
+    writer = pdf_compare.ComparisonCache(tmp_path, max_bytes=0)
+    used = reader.document_dir('used')
+    (used / 'blocks.json').write_text('[]')
+    unused = writer.document_dir('unused')
+    (unused / 'blocks.json').write_text('[]')
+    writer.release()
+
+    writer.evict()
+    assert used.is_dir()
+    assert not unused.exists()
+
+    reader.release()
+    writer.evict()
+    assert not used.exists()
+
+
+def test_lookup_result_drops_entry_missing_an_output(tmp_path):
+    cache = pdf_compare.ComparisonCache(tmp_path)
+    entry = cache.results_dir / 'key'
+    entry.mkdir()
+    (entry / pdf_compare.SUMMARY_NAME).write_text('{}')
+
+    assert cache.lookup_result('key', [pdf_compare.SUMMARY_NAME]) == entry
+    assert cache.lookup_result('key', [pdf_compare.SUMMARY_NAME, pdf_compare.REPORT_NAME]) is None
+    assert not entry.exists()
+
+
+def write_pdf(path: Path, lines) -> str:
+    """Write a PDF with one page per line of text."""
+    document = pdf_compare.fitz.open()
+    for line in lines:
+        document.new_page().insert_text((72, 72), line)
+    document.save(str(path))
+    document.close()
+    return str(path)
+
+
+def test_serve_worker_renders_on_a_pool_of_its_own(tmp_path):
+    pages = [f'Page {n} of the policy' for n in range(8)]
+    file1 = write_pdf(tmp_path / 'a.pdf', pages)
+    file2 = write_pdf(tmp_path / 'b.pdf', pages[:-1] + ['Page 7 of the new policy'])
+    job = {'id': '1', 'file1': file1, 'file2': file2}
+    kwargs = {'use_cache': False, 'render_workers': 2, 'pipeline': True, 'output_format': 'json'}
+
+    # Like --serve: the job runs in a pool worker, which starts (and stops) a render pool for it
+    with ProcessPoolExecutor(max_workers=1, initializer=pdf_compare._init_worker) as pool:
+        result = pool.submit(pdf_compare.run_comparison_job, job, kwargs).result(timeout=120)
+
+    assert result['success'], result
+    assert result['counts']['modifications'] == 1
+    assert any(record.get('worker') for record in result['metrics']['stages'])
+
+
+def test_differences_to_json_schema():
+    comparator = pdf_compare.DocumentComparator(use_cache=False)
+    differences = comparator.find_text_differences(block_table([['Total due now']]),
+                                                   block_table([['Total paid now']]))
+    differences['deletions'].append(pdf_compare.TextBlock('Old clause', (72.0, 0.0, 300.0, 12.0), 1))
+    differences['insertions'].append(pdf_compare.TextBlock('New page', (72.0, 0.0, 300.0, 12.0), 1))
+    differences['pages'] = [(0, 0), (1, None), (None, 1)]
+    differences['visual'] = [('modification', 0, 0, (10.0, 20.0, 30.0, 40.0))]
+
+    diff_json = comparator.differences_to_json('/docs/a.pdf', '/docs/b.pdf', differences,
+                                               ['original_page_1.png', 'original_page_2.png'],
+                                               ['modified_page_1.png', None])
+
+    assert set(diff_json) == {'original', 'modified', 'dpi', 'summary', 'pages'}
+    assert (diff_json['original'], diff_json['modified'], diff_json['dpi']) == ('a.pdf', 'b.pdf', 150)
+    assert diff_json['summary'] == comparator.count_differences(differences)
+    assert [(page['original'], page['modified'], page['status']) for page in diff_json['pages']] == [
+        (1, 1, 'changed'), (2, None, 'deleted'), (None, 2, 'inserted')]
+    assert [(page['original_image'], page['modified_image']) for page in diff_json['pages']] == [
+        ('original_page_1.png', 'modified_page_1.png'), ('original_page_2.png', None), (None, None)]
+
+    changed = diff_json['pages'][0]
+    assert set(changed) == {'original', 'modified', 'status', 'original_image', 'modified_image', 'changes'}
+    old, visual_old, new, visual_new = changed['changes']
+    assert old == {'type': 'modification', 'side': 'original', 'bbox': [72.0, 0.0, 300.0, 12.0],
+                   'text': 'Total due now', 'words': [
+                       {'type': 'modification', 'index': 1, 'text': 'due', 'bbox': [122.0, 0.0, 162.0, 12.0]}]}
+    assert new['side'] == 'modified' and new['text'] == 'Total paid now'
+    assert visual_old == {'type': 'modification', 'side': 'original', 'bbox': [10.0, 20.0, 30.0, 40.0], 'text': ''}
+    assert visual_new == dict(visual_old, side='modified')
+    assert diff_json['pages'][1]['changes'] == [
+        {'type': 'deletion', 'side': 'original', 'bbox': [72.0, 0.0, 300.0, 12.0], 'text': 'Old clause'}]
+    assert diff_json['pages'][2]['changes'][0]['type'] == 'insertion'
+
+
+@pytest.mark.parametrize('embed_images', [False, True])
+def test_differences_json_references_page_images(tmp_path, embed_images):
+    file1 = write_pdf(tmp_path / 'a.pdf', ['Page one', 'Page two'])
+    file2 = write_pdf(tmp_path / 'b.pdf', ['Page one', 'Page two changed'])
+    comparator = pdf_compare.DocumentComparator(use_cache=False, embed_images=embed_images)
+    comparator.temp_dir = tmp_path
+
+    comparator.compare_pdfs(file1, file2)
+
+    with open(comparator.diff_path, encoding='utf-8') as f:
+        diff_json = pdf_compare.json.load(f)
+    report = comparator.report_path.read_text(encoding='utf-8')
+    images = [(page['original_image'], page['modified_image']) for page in diff_json['pages']]
+    if embed_images:
+        # The report inlines the pages; there are no files for the JSON to link
+        assert images == [(None, None), (None, None)]
+        assert report.count('src="data:image/png;base64,') == 4
+        assert not list(comparator.comparison_dir.glob('*.png'))
+    else:
+        assert images == [('original_page_1.png', 'modified_page_1.png'),
+                          ('original_page_2.png', 'modified_page_2.png')]
+        for pair in images:
+            assert all((comparator.comparison_dir / name).is_file() for name in pair)
+            assert all(f'src="{name}"' in report for name in pair)
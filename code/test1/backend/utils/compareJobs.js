@@ -0,0 +1,218 @@
+const EventEmitter = require('events');
+const fs = require('fs');
+const path = require('path');
+const { v4: uuidv4 } = require('uuid');
+const compareWorker = require('./compareWorker');
+const compareMetrics = require('./compareMetrics');
+const ErrorResponse = require('./errorResponse');
+
+// Jobs waiting for a worker beyond this are rejected (the client should retry later)
+const MAX_QUEUE = parseInt(process.env.PDF_COMPARE_MAX_QUEUE, 10) || 20;
+// Finished jobs stay queryable (and deduplicate identical submissions) for this long
+const JOB_TTL_MS = (parseInt(process.env.PDF_COMPARE_JOB_TTL_S, 10) || 600) * 1000;
+
+const tempDir = path.join(__dirname, '../temp');
+
+// URL under /temp of a file written by the comparison worker (null if not written)
+function toTempUrl(fullPath) {
+    if (!fullPath) {
+        return null;
+    }
+    const relativePath = path.relative(tempDir, fullPath);
+    return `/temp/${relativePath.replace(/\\/g, '/')}`;  // Ensure forward slashes for URL
+}
+
+/**
+ * Comparison jobs with an ID, run at most `compareWorker.workers` at a time on
+ * the pdf_compare.py worker pool. A job is `queued`, `running`, `done` or
+ * `failed`; running jobs report their stage (convert, render, extract, diff,
+ * annotate, report) and how many of its items are done. Every change of a job
+ * is emitted as an `update` event with the job's public view.
+ *
+ * Submitting the same two files (same paths, sizes and modification times)
+ * while an earlier job for them is queued, running or recently done (with its
+ * reports still on disk) returns that job instead of starting another.
+ */
+class CompareJobs extends EventEmitter {
+    constructor() {
+        super();
+        this.setMaxListeners(0); // One listener per open event stream
+        this.jobs = new Map();   // job id -> job
+        this.byKey = new Map();  // dedup key -> job id
+        this.queue = [];         // ids of queued jobs, oldest first
+        this.running = 0;
+    }
+
+    /**
+     * Submit a comparison of file1 against file2. Returns the (possibly existing)
+     * job; throws an ErrorResponse (503) when MAX_QUEUE jobs are already waiting.
+     */
+    submit(file1, file2) {
+        const key = this.dedupKey(file1, file2);
+        const existing = this.jobs.get(this.byKey.get(key));
+        // A done job is only reused while its reports exist; the cache may have evicted them
+        if (existing && existing.status !== 'failed' && (existing.status !== 'done' || this.resultAvailable(existing))) {
+            return existing;
+        }
+
+        if (this.queue.length >= MAX_QUEUE) {
+            throw new ErrorResponse(`Comparison queue is full (${MAX_QUEUE} jobs waiting)`, 503);
+        }
+
+        const job = {
+            id: uuidv4(),
+            key,
+            file1,
+            file2,
+            status: 'queued',
+            stage: null,
+            done: null,
+            total: null,
+            result: null,
+            error: null,
+            files: [],  // Full paths of the report files of a done job
+            createdAt: Date.now(),
+            startedAt: null,
+            finishedAt: null
+        };
+        this.jobs.set(job.id, job);
+        this.byKey.set(key, job.id);
+        this.queue.push(job.id);
+        this.update(job);
+        this.dispatch();
+        return job;
+    }
+
+    get(id) {
+        return this.jobs.get(id);
+    }
+
+    /** Resolves with the job once it is done or failed. */
+    wait(job) {
+        if (job.status === 'done' || job.status === 'failed') {
+            return Promise.resolve(job);
+        }
+        return new Promise((resolve) => {
+            const onUpdate = (view) => {
+                if (view.id === job.id && (view.status === 'done' || view.status === 'failed')) {
+                    this.off('update', onUpdate);
+                    resolve(job);
+                }
+            };
+            this.on('update', onUpdate);
+        });
+    }
+
+    /** Whether the report files of a done job still exist (the cache may have evicted them). */
+    resultAvailable(job) {
+        return job.status === 'done' && job.files.every((file) => fs.existsSync(file));
+    }
+
+    /** Public view of a job, as returned by the API and sent on event streams. */
+    view(job) {
+        const view = {
+            id: job.id,
+            status: job.status,
+            stage: job.stage,
+            done: job.done,
+            total: job.total,
+            createdAt: job.createdAt,
+            startedAt: job.startedAt,
+            finishedAt: job.finishedAt
+        };
+        if (job.status === 'queued') {
+            view.queuePosition = this.queue.indexOf(job.id) + 1;
+        }
+        if (job.status === 'done') {
+            view.result = job.result;
+        }
+        if (job.status === 'failed') {
+            view.error = job.error;
+        }
+        return view;
+    }
+
+    // Files are identified by path and version, so a file replaced in place is compared again
+    dedupKey(file1, file2) {
+        const version = (file) => {
+            try {
+                const stat = fs.statSync(file);
+                return `${file}:${stat.size}:${stat.mtimeMs}`;
+            } catch (err) {
+                return file;
+            }
+        };
+        return `${version(file1)}|${version(file2)}`;
+    }
+
+    dispatch() {
+        let started = 0;
+        while (this.running < compareWorker.workers && this.queue.length > 0) {
+            this.run(this.jobs.get(this.queue.shift()));
+            started++;
+        }
+        if (started > 0) {
+            // Positions of the jobs still waiting have moved up
+            for (const id of this.queue) {
+                this.update(this.jobs.get(id));
+            }
+        }
+    }
+
+    async run(job) {
+        this.running++;
+        job.status = 'running';
+        job.startedAt = Date.now();
+        this.update(job);
+
+        let metrics = null;
+        try {
+            const result = await compareWorker.compare(job.file1, job.file2, (progress) => {
+                job.stage = progress.stage;
+                job.done = progress.done;
+                job.total = progress.total;
+                this.update(job);
+            });
+            // URLs relative to backend/temp/, which is served statically. Reports live in the
+            // worker's content-addressed cache, which evicts least recently used reports.
+            job.result = {
+                htmlPath: toTempUrl(result.reportPath),
+                jsonPath: toTempUrl(result.diffPath),
+                counts: result.counts,
+                cached: result.cached,
+                metrics: result.metrics  // Wall time, CPU time, peak RSS and counts per stage
+            };
+            job.files = [result.reportPath, result.diffPath].filter(Boolean);
+            metrics = result.metrics;
+            job.status = 'done';
+        } catch (err) {
+            console.error(`Comparison job ${job.id} failed:`, err);
+            job.status = 'failed';
+            job.error = err.message;
+        }
+        job.finishedAt = Date.now();
+        this.running--;
+        compareMetrics.recordJob(job, metrics);
+        this.update(job);
+
+        // Failed jobs are retried by the next identical submission
+        if (job.status === 'failed' && this.byKey.get(job.key) === job.id) {
+            this.byKey.delete(job.key);
+        }
+        setTimeout(() => this.remove(job), JOB_TTL_MS).unref();
+        this.dispatch();
+    }
+
+    remove(job) {
+        this.jobs.delete(job.id);
+        if (this.byKey.get(job.key) === job.id) {
+            this.byKey.delete(job.key);
+        }
+    }
+
+    update(job) {
+        this.emit('update', this.view(job));
+    }
+}
+
+module.exports = new CompareJobs();
@@ -0,0 +1,146 @@
+// Upper bounds, in seconds, of the duration histogram buckets
+const DURATION_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300];
+
+// Escape a label value for the Prometheus text format
+function labelValue(value) {
+    return String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+// Sums of float samples, without the float noise of repeated additions
+function formatValue(value) {
+    return Number.isInteger(value) ? String(value) : String(Number(value.toFixed(6)));
+}
+
+function formatLabels(labels) {
+    const pairs = Object.entries(labels).map(([name, value]) => `${name}="${labelValue(value)}"`);
+    return pairs.length ? `{${pairs.join(',')}}` : '';
+}
+
+/**
+ * One metric family: samples by label set, rendered in the Prometheus text
+ * exposition format. Histograms keep cumulative bucket counts, sum and count.
+ */
+class Metric {
+    constructor(name, type, help) {
+        this.name = name;
+        this.type = type;
+        this.help = help;
+        this.samples = new Map(); // label set (JSON) -> value, or histogram state
+    }
+
+    inc(labels = {}, value = 1) {
+        const key = JSON.stringify(labels);
+        this.samples.set(key, (this.samples.get(key) || 0) + value);
+    }
+
+    set(labels = {}, value) {
+        this.samples.set(JSON.stringify(labels), value);
+    }
+
+    observe(labels = {}, value) {
+        const key = JSON.stringify(labels);
+        let state = this.samples.get(key);
+        if (!state) {
+            state = { buckets: DURATION_BUCKETS.map(() => 0), sum: 0, count: 0 };
+            this.samples.set(key, state);
+        }
+        DURATION_BUCKETS.forEach((bound, i) => {
+            if (value <= bound) {
+                state.buckets[i]++;
+            }
+        });
+        state.sum += value;
+        state.count++;
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} ${this.type}`];
+        for (const [key, value] of this.samples) {
+            const labels = JSON.parse(key);
+            if (this.type !== 'histogram') {
+                lines.push(`${this.name}${formatLabels(labels)} ${formatValue(value)}`);
+                continue;
+            }
+            DURATION_BUCKETS.forEach((bound, i) => {
+                lines.push(`${this.name}_bucket${formatLabels({ ...labels, le: bound })} ${value.buckets[i]}`);
+            });
+            lines.push(`${this.name}_bucket${formatLabels({ ...labels, le: '+Inf' })} ${value.count}`);
+            lines.push(`${this.name}_sum${formatLabels(labels)} ${formatValue(value.sum)}`);
+            lines.push(`${this.name}_count${formatLabels(labels)} ${value.count}`);
+        }
+        return lines.join('\n');
+    }
+}
+
+/**
+ * Metrics of the comparison jobs of this backend process, built from the
+ * per-stage timings pdf_compare.py returns with every result (wall time, CPU
+ * time, peak RSS and page/block counts of each stage) and exposed in the
+ * Prometheus text format at GET /api/metrics (admins only).
+ */
+class CompareMetrics {
+    constructor() {
+        this.jobs = new Metric('pdf_compare_jobs_total', 'counter',
+            'Finished comparison jobs by status (done or failed)');
+        this.cacheHits = new Metric('pdf_compare_cache_hits_total', 'counter',
+            'Comparison jobs answered from the report cache');
+        this.queueWait = new Metric('pdf_compare_queue_wait_seconds', 'histogram',
+            'Time comparison jobs waited in the queue before running');
+        this.jobDuration = new Metric('pdf_compare_job_duration_seconds', 'histogram',
+            'Wall time of comparison jobs, from start to finish');
+        this.stageDuration = new Metric('pdf_compare_stage_duration_seconds', 'histogram',
+            'Wall time of comparison stages');
+        this.stageCpu = new Metric('pdf_compare_stage_cpu_seconds_total', 'counter',
+            'CPU time of comparison stages (of the process that ran the stage)');
+        this.stagePeakRss = new Metric('pdf_compare_stage_peak_rss_bytes', 'gauge',
+            'Peak RSS of the last run of each comparison stage');
+        this.stagePages = new Metric('pdf_compare_stage_pages_total', 'counter',
+            'Pages processed by comparison stages');
+        this.stageBlocks = new Metric('pdf_compare_stage_blocks_total', 'counter',
+            'Text blocks processed by comparison stages');
+        this.queueDepth = new Metric('pdf_compare_queue_depth', 'gauge',
+            'Comparison jobs waiting for a worker');
+        this.running = new Metric('pdf_compare_running_jobs', 'gauge',
+            'Comparison jobs currently running');
+    }
+
+    /** Record a finished job (see compareJobs); metrics is the job's stage timings, if any. */
+    recordJob(job, metrics) {
+        this.jobs.inc({ status: job.status });
+        this.queueWait.observe({}, (job.startedAt - job.createdAt) / 1000);
+        this.jobDuration.observe({}, (job.finishedAt - job.startedAt) / 1000);
+        if (job.result && job.result.cached) {
+            this.cacheHits.inc();
+        }
+        if (!metrics) {
+            return;
+        }
+
+        for (const record of metrics.stages) {
+            const labels = { stage: record.stage };
+            this.stageDuration.observe(labels, record.wall_s);
+            this.stageCpu.inc(labels, record.cpu_s);
+            if (record.peak_rss_mb !== null && record.peak_rss_mb !== undefined) {
+                this.stagePeakRss.set(labels, Math.round(record.peak_rss_mb * 1024 * 1024));
+            }
+            if (record.pages) {
+                this.stagePages.inc(labels, record.pages);
+            }
+            if (record.blocks) {
+                this.stageBlocks.inc(labels, record.blocks);
+            }
+        }
+    }
+
+    /** All metrics in the Prometheus text format, with the current queue state. */
+    render({ queueDepth, running }) {
+        this.queueDepth.set({}, queueDepth);
+        this.running.set({}, running);
+        return [
+            this.jobs, this.cacheHits, this.queueWait, this.jobDuration, this.queueDepth, this.running,
+            this.stageDuration, this.stageCpu, this.stagePeakRss, this.stagePages, this.stageBlocks
+        ].map((metric) => metric.render()).join('\n') + '\n';
+    }
+}
+
+module.exports = new CompareMetrics();
@@ -0,0 +1,168 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+const path = require('path');
+
+const SCRIPT_PATH = path.join(__dirname, 'pdf_compare.py');
+// Comparisons the Python side runs at once, each in its own worker process
+const WORKERS = parseInt(process.env.PDF_COMPARE_WORKERS, 10) || 2;
+// Processes each comparison may use to render pages and load both documents concurrently;
+// unset, the CPUs are split between the WORKERS comparisons
+const RENDER_WORKERS = parseInt(process.env.PDF_COMPARE_RENDER_WORKERS, 10) || 0;
+// Size limit of the report cache in backend/temp/cache (least recently used reports are evicted)
+const CACHE_SIZE_MB = parseInt(process.env.PDF_COMPARE_CACHE_MB, 10) || 512;
+// 'all' renders every page; 'changed' renders only pages with differences
+const RENDER_MODE = process.env.PDF_COMPARE_RENDER_MODE || 'all';
+// Format of the page images linked from the report: png, webp or jpeg
+const IMAGE_FORMAT = process.env.PDF_COMPARE_IMAGE_FORMAT || 'png';
+// Colorspace pages are rendered in: rgb or gray (pages with changes are still annotated in color)
+const COLORSPACE = process.env.PDF_COMPARE_COLORSPACE || 'rgb';
+// Pixel diff of page images: auto (pages without text, e.g. scans), on or off
+const VISUAL_DIFF = process.env.PDF_COMPARE_VISUAL_DIFF || 'auto';
+// Render, annotate and write pages one at a time (bounded memory for very large documents)
+const STREAMING = process.env.PDF_COMPARE_STREAMING === '1';
+// Outputs of each comparison: html (report), json (differences.json) or both
+const OUTPUT_FORMAT = process.env.PDF_COMPARE_OUTPUT_FORMAT || 'both';
+// Office files: render (convert to PDF and compare pages) or structural (compare paragraphs, cells, shapes)
+const OFFICE_MODE = process.env.PDF_COMPARE_OFFICE_MODE || 'render';
+// Structural spreadsheet diff: key column (letter or header name) rows are aligned on; by content if unset
+const SHEET_KEY = process.env.PDF_COMPARE_SHEET_KEY || '';
+
+/**
+ * Keeps a single long-lived `pdf_compare.py --serve` process and hands it
+ * comparison jobs over its stdin/stdout JSON-lines protocol. The Python side
+ * runs the jobs on a bounded pool of warm worker processes.
+ */
+class CompareWorker {
+    constructor() {
+        this.child = null;
+        this.pending = new Map(); // job id -> { resolve, reject, onProgress }
+        this.nextId = 1;
+        this.workers = WORKERS; // Comparisons the Python side runs at once
+    }
+
+    start() {
+        if (this.child) {
+            return this.child;
+        }
+
+        const args = [
+            SCRIPT_PATH, '--serve',
+            '--workers', String(WORKERS),
+            '--render-mode', RENDER_MODE,
+            '--image-format', IMAGE_FORMAT,
+            '--colorspace', COLORSPACE,
+            '--visual-diff', VISUAL_DIFF,
+            '--output-format', OUTPUT_FORMAT,
+            '--office-mode', OFFICE_MODE,
+            '--cache-size-mb', String(CACHE_SIZE_MB)
+        ];
+        if (RENDER_WORKERS) {
+            args.push('--render-workers', String(RENDER_WORKERS));
+        }
+        if (STREAMING) {
+            args.push('--streaming');
+        }
+        if (SHEET_KEY) {
+            args.push('--sheet-key', SHEET_KEY);
+        }
+        const child = spawn('python3', args, {
+            stdio: ['pipe', 'pipe', 'pipe']
+        });
+        this.child = child;
+
+        readline.createInterface({ input: child.stdout }).on('line', (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (err) {
+                console.error('Invalid message from pdf_compare worker:', line);
+                return;
+            }
+
+            if (message.event === 'ready') {
+                console.log(`pdf_compare worker ready with ${message.workers} process(es)`);
+                return;
+            }
+
+            const job = this.pending.get(message.id);
+            if (!job) {
+                return;
+            }
+
+            if (message.event === 'progress') {
+                if (job.onProgress) {
+                    job.onProgress({ stage: message.stage, done: message.done, total: message.total });
+                }
+                return;
+            }
+            this.pending.delete(message.id);
+
+            if (message.success) {
+                job.resolve(message);
+            } else {
+                job.reject(new Error(message.error || 'Comparison failed'));
+            }
+        });
+
+        // Worker progress and tracebacks are logged as-is
+        child.stderr.on('data', (data) => {
+            process.stderr.write(data);
+        });
+
+        child.on('error', (err) => this.stopped(child, err.message));
+        child.on('exit', (code, signal) => this.stopped(child, signal || `exit code ${code}`));
+        // Writing to a worker that just died fails with EPIPE; unhandled, it would take the server down
+        child.stdin.on('error', (err) => {
+            this.stopped(child, `stdin ${err.code || err.message}`);
+            child.kill();
+        });
+
+        return child;
+    }
+
+    // Forget a worker that exited or lost its pipe, failing its in-flight jobs;
+    // the next request restarts the worker
+    stopped(child, reason) {
+        if (this.child !== child) {
+            return;
+        }
+        console.error('pdf_compare worker stopped:', reason);
+        this.child = null;
+        for (const job of this.pending.values()) {
+            job.reject(new Error('Comparison worker stopped'));
+        }
+        this.pending.clear();
+    }
+
+    // Whether jobs can still be written to a worker
+    usable(child) {
+        return child.exitCode === null && child.signalCode === null && child.stdin.writable;
+    }
+
+    /**
+     * Compare two documents. Resolves with `{ reportPath, diffPath, comparisonDir, counts, cached }`;
+     * reportPath or diffPath is null when that output is disabled by PDF_COMPARE_OUTPUT_FORMAT.
+     * onProgress, if given, is called with `{ stage, done, total }` as the comparison advances
+     * (stage is one of convert, render, extract, diff, annotate, report; done/total may be null).
+     */
+    compare(file1, file2, onProgress = null) {
+        let child = this.start();
+        if (!this.usable(child)) {
+            // Died before its exit event arrived: replace it once
+            this.stopped(child, 'pipe closed');
+            child = this.start();
+        }
+        const id = String(this.nextId++);
+
+        return new Promise((resolve, reject) => {
+            if (!this.usable(child)) {
+                reject(new Error('Comparison worker is not running'));
+                return;
+            }
+            this.pending.set(id, { resolve, reject, onProgress });
+            child.stdin.write(JSON.stringify({ id, file1, file2 }) + '\n');
+        });
+    }
+}
+
+module.exports = new CompareWorker();
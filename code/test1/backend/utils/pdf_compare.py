@@ -7,22 +7,41 @@ Converts various document formats (PDF, DOCX, XLSX, PPTX) to images, extracts te
 import sys
 import os
 import argparse
-import fitz  # PyMuPDF
+try:
+    # Importing the module as `fitz` prints a deprecation warning to stdout, which
+    # would corrupt the --serve protocol; older PyMuPDF releases only have `fitz`
+    import pymupdf as fitz
+except ImportError:
+    import fitz  # PyMuPDF
 import difflib
 from pathlib import Path
 from datetime import datetime
-from typing import List, Tuple, Dict, Optional, Set
+from typing import List, Tuple, Dict, Optional, Set, FrozenSet, Sequence, Iterator, Iterable, Callable
 import re
 import html
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import base64
 import io
 import tempfile
 import shutil
+from array import array
+from bisect import bisect_left, bisect_right
+import json
+import time
+import hashlib
+import zlib
+import threading
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Document format conversion imports
 try:
     from docx import Document
+    from docx.oxml.ns import qn
+    from docx.table import Table as DocxTable
+    from docx.text.paragraph import Paragraph as DocxParagraph
 except ImportError:
     Document = None
 
@@ -43,41 +62,1425 @@ try:
 except ImportError:
     Presentation = None
 
+# Raster comparison of image-only pages
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Peak memory of comparison stages (Unix only)
+try:
+    import resource
+except ImportError:
+    resource = None
+
 
 class TextBlock:
     """Represents a text block with position and content."""
     
-    def __init__(self, text: str, bbox: Tuple[float, float, float, float], page_num: int):
+    __slots__ = ('text', 'bbox', 'page_num', 'word_bboxes')
+    
+    def __init__(self, text: str, bbox: Tuple[float, float, float, float], page_num: int,
+                 word_bboxes: Sequence[Tuple[float, float, float, float]] = ()):
         self.text = text.strip()
-        self.bbox = bbox  # (x0, y0, x1, y1)
+        self.bbox = tuple(bbox)  # (x0, y0, x1, y1)
         self.page_num = page_num
-        self.x0, self.y0, self.x1, self.y1 = bbox
-        self.center_x = (self.x0 + self.x1) / 2
-        self.center_y = (self.y0 + self.y1) / 2
+        self.word_bboxes = tuple(word_bboxes)  # Glyph bbox of each word of text.split()
+    
+    @property
+    def x0(self) -> float:
+        return self.bbox[0]
+    
+    @property
+    def y0(self) -> float:
+        return self.bbox[1]
+    
+    @property
+    def x1(self) -> float:
+        return self.bbox[2]
+    
+    @property
+    def y1(self) -> float:
+        return self.bbox[3]
+    
+    @property
+    def center_x(self) -> float:
+        return (self.bbox[0] + self.bbox[2]) / 2
+    
+    @property
+    def center_y(self) -> float:
+        return (self.bbox[1] + self.bbox[3]) / 2
     
     def __str__(self):
         return f"TextBlock('{self.text[:20]}...', page={self.page_num}, bbox={self.bbox})"
 
 
+class BlockTable:
+    """Columnar store of the text lines of one document.
+    
+    Texts (interned, so repeated lines share one string), page numbers and
+    bounding boxes are kept in flat arrays instead of one object per line.
+    The glyph bounding box of every word is kept as well: the words of row r
+    are word_starts[r]:word_starts[r + 1] in word_bboxes.
+    Rows are in page order. TextBlock objects are only created, once per row,
+    for the rows a caller asks for (typically the lines that changed).
+    """
+    
+    def __init__(self, page_count: int = 0):
+        self.texts: List[str] = []
+        self.page_nums = array('i')
+        self.bboxes = array('d')  # x0, y0, x1, y1 of each row
+        self.word_starts = array('i', [0])
+        self.word_bboxes = array('f')  # x0, y0, x1, y1 of each word
+        self.page_count = page_count
+        self._blocks: Dict[int, TextBlock] = {}
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def append(self, text: str, bbox: Tuple[float, float, float, float], page_num: int,
+               word_bboxes: Sequence[float] = ()):
+        """Add a line; lines must be appended in page order.
+        
+        word_bboxes is the flat x0, y0, x1, y1 sequence of the words of the line.
+        """
+        self.texts.append(sys.intern(text.strip()))
+        self.page_nums.append(page_num)
+        self.bboxes.extend(bbox)
+        self.word_bboxes.extend(word_bboxes)
+        self.word_starts.append(len(self.word_bboxes) // 4)
+        self.page_count = max(self.page_count, page_num + 1)
+    
+    def bbox(self, row: int) -> Tuple[float, float, float, float]:
+        """Bounding box of a row in PDF points."""
+        return tuple(self.bboxes[4 * row:4 * row + 4])
+    
+    def row_word_bboxes(self, row: int) -> List[Tuple[float, float, float, float]]:
+        """Bounding boxes of the words of a row, in PDF points."""
+        start, stop = self.word_starts[row], self.word_starts[row + 1]
+        flat = self.word_bboxes[4 * start:4 * stop]
+        return [tuple(flat[i:i + 4]) for i in range(0, len(flat), 4)]
+    
+    def block(self, row: int) -> TextBlock:
+        """TextBlock for a row (the same object on every call)."""
+        block = self._blocks.get(row)
+        if block is None:
+            block = TextBlock(self.texts[row], self.bbox(row), self.page_nums[row],
+                              self.row_word_bboxes(row))
+            self._blocks[row] = block
+        return block
+    
+    def page_rows(self, page_num: int) -> range:
+        """Rows that belong to a page."""
+        return range(bisect_left(self.page_nums, page_num), bisect_right(self.page_nums, page_num))
+    
+    def to_json(self) -> Dict:
+        return {
+            'page_count': self.page_count,
+            'texts': self.texts,
+            'page_nums': self.page_nums.tolist(),
+            'bboxes': self.bboxes.tolist(),
+            'word_starts': self.word_starts.tolist(),
+            'word_bboxes': self.word_bboxes.tolist(),
+        }
+    
+    @classmethod
+    def from_json(cls, data: Dict) -> 'BlockTable':
+        table = cls(data['page_count'])
+        table.texts = [sys.intern(text) for text in data['texts']]
+        table.page_nums = array('i', data['page_nums'])
+        table.bboxes = array('d', data['bboxes'])
+        table.word_starts = array('i', data['word_starts'])
+        table.word_bboxes = array('f', data['word_bboxes'])
+        return table
+
+
+# Bump when the report output or cached artifacts change so stale entries are not reused
+CACHE_VERSION = 5
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+# In-use marks older than this are left over from a crashed worker and ignored by eviction
+IN_USE_TTL_S = 3600
+
+REPORT_NAME = "comparison_report.html"
+DIFF_NAME = "differences.json"
+SUMMARY_NAME = "summary.json"
+
+
+def hash_file(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of all files below a directory."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed concurrently
+    return total
+
+
+class ComparisonCache:
+    """Content-addressed comparison results with a size limit and LRU eviction.
+    
+    Each entry is a finished comparison folder under temp/cache/results/<key>,
+    where the key covers the content hashes of both inputs and the comparison
+    options. Per-document artifacts (rendered pages per DPI and extracted text
+    blocks) are kept under temp/cache/documents/<key> so a document that was
+    already seen in another comparison is not rendered or parsed again.
+    Folder mtimes are refreshed on every hit and used as the LRU order; both
+    kinds of entries share one size limit.
+    
+    Several processes (serve workers, document workers) share one cache, so
+    every entry a cache object uses is marked in use under temp/cache/inuse
+    until release() is called at the end of its job; eviction skips marked
+    entries. Entries are marked before they are looked at, so an entry is
+    either seen marked by eviction or already gone when it is looked up.
+    """
+    
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.results_dir = root / "results"
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        self.documents_dir = root / "documents"
+        self.documents_dir.mkdir(parents=True, exist_ok=True)
+        self.in_use_dir = root / "inuse"
+        self.in_use_dir.mkdir(parents=True, exist_ok=True)
+        self.owner = f"{os.getpid()}-{id(self)}"  # Suffix of the in-use marks of this object
+        self.marks: Set[Path] = set()
+    
+    def __setstate__(self, state: Dict):
+        # A copy sent to a document worker marks and releases entries on its own
+        self.__dict__.update(state)
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self.marks = set()
+    
+    def result_key(self, file1_hash: str, file2_hash: str, options: Dict, names: Tuple[str, str]) -> str:
+        """Build the cache key for comparing two documents with the given options.
+        
+        The file names are part of the key because the report and
+        differences.json show them.
+        """
+        payload = json.dumps({
+            'version': CACHE_VERSION,
+            'file1': file1_hash,
+            'file2': file2_hash,
+            'names': names,
+            'options': options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def lookup_result(self, key: str, outputs: Sequence[str] = ()) -> Optional[Path]:
+        """Return the cached comparison folder for a key, or None on a miss.
+        
+        outputs are the names of the files the caller needs from the folder;
+        an entry that lost any of them is removed and reported as a miss.
+        """
+        entry = self.results_dir / key
+        self.mark_in_use(entry)
+        # The summary is written last, once every output of the comparison exists
+        if not (entry / SUMMARY_NAME).exists():
+            return None
+        if not all((entry / name).exists() for name in outputs):
+            print(f"Cached comparison {entry.name} is incomplete; comparing again")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        self.touch(entry)
+        return entry
+    
+    def store_result(self, key: str, comparison_dir: Path) -> Path:
+        """Move a finished comparison folder into the cache and return its new location."""
+        entry = self.results_dir / key
+        self.mark_in_use(entry)
+        try:
+            os.rename(comparison_dir, entry)
+        except OSError:
+            # Another worker finished the same comparison first; keep theirs
+            shutil.rmtree(comparison_dir, ignore_errors=True)
+        self.touch(entry)
+        self.evict(keep={entry})
+        return entry
+    
+    def document_dir(self, file_hash: str) -> Path:
+        """Return the artifact folder for a document, creating it if needed."""
+        key = hashlib.sha256(f"{CACHE_VERSION}:{file_hash}".encode('utf-8')).hexdigest()
+        entry = self.documents_dir / key
+        self.mark_in_use(entry)
+        entry.mkdir(exist_ok=True)
+        self.touch(entry)
+        return entry
+    
+    def pages_dir(self, file_hash: str, dpi: int, colorspace: str) -> Path:
+        """Folder of the rendered pages of a document at a DPI and colorspace."""
+        return self.document_dir(file_hash) / f"pages_{dpi}dpi_{colorspace}"
+    
+    def load_pages(self, file_hash: str, dpi: int, colorspace: str = 'rgb',
+                   page_numbers: Optional[List[int]] = None) -> Optional[List[Image.Image]]:
+        """Return the cached page images of a document at a DPI, or None on a miss.
+        
+        page_numbers selects (0-based) pages; by default all pages are loaded.
+        """
+        pages_dir = self.pages_dir(file_hash, dpi, colorspace)
+        if not pages_dir.is_dir():
+            return None
+        
+        if page_numbers is None:
+            page_paths = sorted(pages_dir.glob("page_*.png"))
+        else:
+            page_paths = [self.page_path(pages_dir, page_num) for page_num in page_numbers]
+        return [self.load_page(page_path) for page_path in page_paths]
+    
+    @staticmethod
+    def page_path(pages_dir: Path, page_num: int) -> Path:
+        """File of a (0-based) page in a folder of rendered pages, see pages_dir."""
+        return pages_dir / f"page_{page_num+1:05d}.png"
+    
+    @staticmethod
+    def load_page(page_path: Path) -> Image.Image:
+        """Read one cached page image."""
+        image = Image.open(page_path)
+        image.load()  # Read now so no file handle stays open per page
+        return image
+    
+    def store_pages(self, file_hash: str, dpi: int, colorspace: str, images: List[Image.Image]):
+        """Cache the page images of a document at a DPI and colorspace."""
+        pages_dir = self.pages_dir(file_hash, dpi, colorspace)
+        if pages_dir.is_dir():
+            return
+        
+        # Write to a private folder and rename it, so readers never see a partial set
+        staging_dir = pages_dir.with_name(f"{pages_dir.name}.{os.getpid()}.tmp")
+        staging_dir.mkdir(exist_ok=True)
+        for i, image in enumerate(images):
+            # Fast compression: these are re-read locally, not served
+            image.save(self.page_path(staging_dir, i), compress_level=1)
+        try:
+            os.rename(staging_dir, pages_dir)
+        except OSError:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def load_blocks(self, file_hash: str) -> Optional[BlockTable]:
+        """Return the cached text blocks of a document, or None on a miss."""
+        blocks_path = self.document_dir(file_hash) / "blocks.json"
+        if not blocks_path.exists():
+            return None
+        
+        with open(blocks_path, 'r', encoding='utf-8') as f:
+            return BlockTable.from_json(json.load(f))
+    
+    def store_blocks(self, file_hash: str, blocks: BlockTable):
+        """Cache the text blocks of a document."""
+        blocks_path = self.document_dir(file_hash) / "blocks.json"
+        
+        staging_path = blocks_path.with_name(f"blocks.{os.getpid()}.tmp")
+        with open(staging_path, 'w', encoding='utf-8') as f:
+            json.dump(blocks.to_json(), f)
+        os.replace(staging_path, blocks_path)
+    
+    def touch(self, entry: Path):
+        """Mark an entry as recently used."""
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+    
+    def _mark_prefix(self, entry: Path) -> str:
+        return f"{entry.parent.name}-{entry.name}."
+    
+    def mark_in_use(self, entry: Path):
+        """Protect an entry from eviction until release() is called."""
+        if entry in self.marks:
+            return
+        (self.in_use_dir / (self._mark_prefix(entry) + self.owner)).touch()
+        self.marks.add(entry)
+    
+    def release(self):
+        """Remove the in-use marks of this object."""
+        for entry in self.marks:
+            try:
+                os.remove(self.in_use_dir / (self._mark_prefix(entry) + self.owner))
+            except OSError:
+                pass
+        self.marks.clear()
+    
+    def in_use_entries(self) -> Set[str]:
+        """Mark prefixes of the entries any process has marked in use."""
+        prefixes = set()
+        now = time.time()
+        for mark in self.in_use_dir.iterdir():
+            try:
+                fresh = now - mark.stat().st_mtime < IN_USE_TTL_S
+            except OSError:
+                continue  # Released concurrently
+            if fresh:
+                prefixes.add(mark.name.rsplit('.', 1)[0] + '.')
+        return prefixes
+    
+    def evict(self, keep: Set[Path] = frozenset()):
+        """Remove least recently used entries until the cache fits its size limit.
+        
+        Entries in keep and entries marked in use by any process are kept.
+        """
+        entries = []
+        total = 0
+        for entry in [*self.results_dir.iterdir(), *self.documents_dir.iterdir()]:
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = directory_size(entry)
+            entries.append((mtime, size, entry))
+            total += size
+        
+        for mtime, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if entry in keep or entry in self.marks:
+                continue
+            # Re-read the marks for every entry: another worker may have started using it
+            if self._mark_prefix(entry) in self.in_use_entries():
+                continue
+            print(f"Evicting cached {entry.parent.name}: {entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+# Parallel page rendering: below this many pages per worker a pool is not worth starting
+MIN_PAGES_PER_RENDER_WORKER = 4
+
+# The process-wide pool and its worker count, kept alive across comparisons. It
+# is shared by document loading and page rendering. The process running the
+# comparison starts it: the main process, or a --serve worker for the length of
+# one job (see run_comparison_job). Its workers never start pools of their own,
+# so pools nest at most one level below serve.
+_process_pool: Optional[Tuple[ProcessPoolExecutor, int]] = None
+# Set in the workers of that pool (see _init_pool_worker)
+_is_pool_worker = False
+
+
+def _init_pool_worker():
+    """Initialize a render or document worker of the process-wide pool."""
+    global _is_pool_worker
+    _is_pool_worker = True
+
+
+def _in_pool_worker() -> bool:
+    """Whether this process is a render or document worker of a process-wide pool."""
+    return _is_pool_worker
+
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the process-wide pool, (re)creating it for a worker count."""
+    global _process_pool
+    if _in_pool_worker():
+        raise RuntimeError("Render and document workers must not start process pools of their own")
+    pool, pool_workers = _process_pool or (None, 0)
+    if pool is None or pool_workers != workers:
+        if pool is not None:
+            pool.shutdown(wait=False)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker)
+        _process_pool = (pool, workers)
+    return pool
+
+
+def _shutdown_process_pool():
+    """Stop the process-wide pool, if one was started, and wait for its workers."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool[0].shutdown()
+        _process_pool = None
+
+
+# Colorspaces pages can be rendered in: name -> (fitz colorspace, PIL mode).
+# Grayscale is about three times cheaper to render, hold and encode.
+RENDER_COLORSPACES = {
+    'rgb': (fitz.csRGB, 'RGB'),
+    'gray': (fitz.csGRAY, 'L'),
+}
+
+
+def _render_pixmap(page, dpi: int, colorspace: str):
+    """Rasterize a loaded fitz page without an alpha channel."""
+    # Convert to image with high DPI for quality
+    mat = fitz.Matrix(dpi/72, dpi/72)
+    return page.get_pixmap(matrix=mat, colorspace=RENDER_COLORSPACES[colorspace][0], alpha=False) # type: ignore
+
+
+def _render_page(page, dpi: int, colorspace: str = 'rgb') -> Image.Image:
+    """Render a loaded fitz page to a PIL Image.
+    
+    The image wraps the pixmap's sample buffer directly instead of going
+    through an encoded PNG.
+    """
+    pix = _render_pixmap(page, dpi, colorspace)
+    mode = RENDER_COLORSPACES[colorspace][1]
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples, 'raw', mode, pix.stride, 1)
+
+
+class PdfDocument:
+    """A PDF opened once for both text extraction and rendering.
+    
+    Each page is loaded once and serves both consumers, so the xref, fonts and
+    content streams of a large document are parsed a single time. iter_pages()
+    streams the pages in order; render_page() renders one page on demand.
+    """
+    
+    def __init__(self, pdf_path: str, dpi: int, colorspace: str = 'rgb'):
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.colorspace = colorspace
+        self.doc = fitz.open(pdf_path)
+    
+    def __len__(self) -> int:
+        return len(self.doc)
+    
+    def __enter__(self) -> 'PdfDocument':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        self.doc.close()
+    
+    def render_page(self, page_num: int) -> Image.Image:
+        """Render one page at the document's DPI and colorspace."""
+        return _render_page(self.doc.load_page(page_num), self.dpi, self.colorspace)
+    
+    def iter_pages(self, blocks: Optional[BlockTable] = None, render: bool = True,
+                   page_numbers: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, Optional[Image.Image]]]:
+        """Yield (page_num, image or None) for each page, in order.
+        
+        If blocks is given, the text lines of every page are appended to it as
+        the page goes by (all pages must then be visited, in order).
+        """
+        if page_numbers is None:
+            page_numbers = range(len(self.doc))
+        for page_num in page_numbers:
+            page = self.doc.load_page(page_num)
+            if blocks is not None:
+                self.extract_page(page, page_num, blocks)
+            yield page_num, _render_page(page, self.dpi, self.colorspace) if render else None
+    
+    @staticmethod
+    def extract_page(page, page_num: int, blocks: BlockTable):
+        """Append the text lines of a loaded page to a block table."""
+        # Words with glyph-accurate positions, in reading order; a line is
+        # the run of words sharing (block_no, line_no)
+        words = page.get_text("words") # type: ignore
+        line_key = None
+        line_words: List[str] = []
+        word_bboxes: List[float] = []
+        for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+            if (block_no, line_no) != line_key:
+                if line_words:
+                    PdfDocument._append_line(blocks, line_words, word_bboxes, page_num)
+                line_key = (block_no, line_no)
+                line_words, word_bboxes = [], []
+            line_words.append(word)
+            word_bboxes.extend((x0, y0, x1, y1))
+        if line_words:
+            PdfDocument._append_line(blocks, line_words, word_bboxes, page_num)
+    
+    @staticmethod
+    def _append_line(blocks: BlockTable, words: List[str], word_bboxes: List[float], page_num: int):
+        """Add one extracted line; its bbox is the union of its word boxes."""
+        line_bbox = (min(word_bboxes[0::4]), min(word_bboxes[1::4]),
+                     max(word_bboxes[2::4]), max(word_bboxes[3::4]))
+        blocks.append(" ".join(words), line_bbox, page_num, word_bboxes)
+
+
+def _render_page_range(pdf_path: str, dpi: int, colorspace: str, start: int, stop: int) -> List[Tuple[str, Tuple[int, int], bytes]]:
+    """Render pages [start, stop) of a PDF in a pool worker.
+    
+    The document is opened once for the whole range. Pages are returned as raw
+    (mode, size, pixels) tuples taken straight from the pixmaps, which are
+    cheaper to send back than PIL images.
+    """
+    mode = RENDER_COLORSPACES[colorspace][1]
+    pages = []
+    with PdfDocument(pdf_path, dpi, colorspace) as document:
+        for page_num in range(start, stop):
+            pix = _render_pixmap(document.doc.load_page(page_num), dpi, colorspace)
+            pages.append((mode, (pix.width, pix.height), pix.samples))
+    return pages
+
+
+def _tokenize_lines(lines1: List[str], lines2: List[str]) -> Tuple[List[int], List[int]]:
+    """Replace lines by integer tokens (equal lines get equal tokens) for fast comparison."""
+    tokens: Dict[str, int] = {}
+    a = [tokens.setdefault(line, len(tokens)) for line in lines1]
+    b = [tokens.setdefault(line, len(tokens)) for line in lines2]
+    return a, b
+
+
+def _middle_snake(a: List[int], a_lo: int, a_hi: int,
+                  b: List[int], b_lo: int, b_hi: int) -> Tuple[int, int, int, int]:
+    """Find the middle snake of a shortest edit script between a[a_lo:a_hi] and b[b_lo:b_hi].
+
+    Linear-space Myers search from both ends at once. Returns the snake as
+    absolute (x_start, y_start, x_end, y_end). Both ranges must be non-empty.
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 != 0
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        # Forward search from the top-left corner
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            # Reached the backward path on the same diagonal?
+            if odd and -(d - 1) <= delta - k <= d - 1:
+                if x + backward[offset + delta - k] >= n:
+                    return a_lo + x_start, b_lo + y_start, a_lo + x, b_lo + y
+
+        # Backward search from the bottom-right corner (diagonals of the reversed sequences)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + forward[offset + delta - k] >= n:
+                    return a_hi - x, b_hi - y, a_hi - x_start, b_hi - y_start
+
+    raise RuntimeError("No middle snake found")  # Unreachable for non-empty ranges
+
+
+def _myers_matches(a: List[int], a_lo: int, a_hi: int, b: List[int], b_lo: int, b_hi: int,
+                   matches: List[Tuple[int, int]]):
+    """Append the matching (i, j) pairs of a shortest edit script, in order (Myers, O((N+M)D))."""
+    # A common prefix and suffix need no search
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        matches.append((a_lo, b_lo))
+        a_lo += 1
+        b_lo += 1
+    suffix = []
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        suffix.append((a_hi, b_hi))
+
+    if a_lo < a_hi and b_lo < b_hi:
+        x_start, y_start, x_end, y_end = _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+        _myers_matches(a, a_lo, x_start, b, b_lo, y_start, matches)
+        matches.extend((x_start + i, y_start + i) for i in range(x_end - x_start))
+        _myers_matches(a, x_end, a_hi, b, y_end, b_hi, matches)
+
+    matches.extend(reversed(suffix))
+
+
+def _patience_matches(a: List[int], a_lo: int, a_hi: int, b: List[int], b_lo: int, b_hi: int,
+                      matches: List[Tuple[int, int]]):
+    """Append matching (i, j) pairs using patience diff, falling back to Myers.
+
+    Lines that occur exactly once on each side are used as anchors (their longest
+    increasing run), so repeated lines such as headers or table rows cannot pull
+    the alignment out of place; the gaps between anchors are diffed recursively.
+    """
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        matches.append((a_lo, b_lo))
+        a_lo += 1
+        b_lo += 1
+    suffix = []
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        suffix.append((a_hi, b_hi))
+
+    if a_lo < a_hi and b_lo < b_hi:
+        # Lines unique on both sides: token -> index (None once seen twice)
+        unique_a: Dict[int, Optional[int]] = {}
+        for i in range(a_lo, a_hi):
+            unique_a[a[i]] = None if a[i] in unique_a else i
+        unique_b: Dict[int, Optional[int]] = {}
+        for j in range(b_lo, b_hi):
+            unique_b[b[j]] = None if b[j] in unique_b else j
+        candidates = [(i, unique_b[token]) for token, i in unique_a.items()
+                      if i is not None and unique_b.get(token) is not None]
+        candidates.sort()
+
+        anchors = _longest_increasing_run(candidates)
+        if not anchors:
+            _myers_matches(a, a_lo, a_hi, b, b_lo, b_hi, matches)
+        else:
+            i_prev, j_prev = a_lo, b_lo
+            for i, j in anchors:
+                _patience_matches(a, i_prev, i, b, j_prev, j, matches)
+                matches.append((i, j))
+                i_prev, j_prev = i + 1, j + 1
+            _patience_matches(a, i_prev, a_hi, b, j_prev, b_hi, matches)
+
+    matches.extend(reversed(suffix))
+
+
+def _longest_increasing_run(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest subsequence of (i, j) pairs (sorted by i) with increasing j (patience sorting)."""
+    tails: List[int] = []  # tails[k]: index into pairs of the smallest tail of a run of length k+1
+    previous: List[int] = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pairs[tails[mid]][1] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0:
+            previous[index] = tails[lo - 1]
+        if lo == len(tails):
+            tails.append(index)
+        else:
+            tails[lo] = index
+
+    run = []
+    index = tails[-1] if tails else -1
+    while index != -1:
+        run.append(pairs[index])
+        index = previous[index]
+    run.reverse()
+    return run
+
+
+def _matches_to_opcodes(matches: List[Tuple[int, int]], len_a: int, len_b: int) -> List[Tuple[str, int, int, int, int]]:
+    """Turn ordered matching pairs into difflib-style (tag, i1, i2, j1, j2) opcodes."""
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches + [(len_a, len_b)]:
+        if i < match_i and j < match_j:
+            opcodes.append(('replace', i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append(('delete', i, match_i, j, j))
+        elif j < match_j:
+            opcodes.append(('insert', i, i, j, match_j))
+
+        if match_i < len_a:
+            # Extend the previous equal run or start a new one
+            if opcodes and opcodes[-1][0] == 'equal' and opcodes[-1][2] == match_i and opcodes[-1][4] == match_j:
+                tag, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = (tag, i1, match_i + 1, j1, match_j + 1)
+            else:
+                opcodes.append(('equal', match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    return opcodes
+
+
+def diff_opcodes(seq1: List, seq2: List, engine: str = 'patience') -> List[Tuple[str, int, int, int, int]]:
+    """Align two sequences of hashable items and return difflib-style opcodes.
+
+    engine is one of DIFF_ENGINES: 'difflib' (SequenceMatcher, the original
+    behaviour), 'myers' or 'patience' (Myers with unique-line anchors).
+    """
+    if engine == 'difflib':
+        return difflib.SequenceMatcher(None, seq1, seq2).get_opcodes()
+
+    a, b = _tokenize_lines(seq1, seq2)
+    matches: List[Tuple[int, int]] = []
+    if engine == 'myers':
+        _myers_matches(a, 0, len(a), b, 0, len(b), matches)
+    elif engine == 'patience':
+        _patience_matches(a, 0, len(a), b, 0, len(b), matches)
+    else:
+        raise ValueError(f"Unsupported diff engine: {engine}")
+    return _matches_to_opcodes(matches, len(a), len(b))
+
+
+DIFF_ENGINES = ('patience', 'myers', 'difflib')
+
+
+def merge_rectangles(rects: List[List[float]], gap: float = 0.0) -> List[Tuple[float, float, float, float]]:
+    """Merge rectangles (x0, y0, x1, y1) that overlap or are within gap of each other.
+    
+    Overlapping groups are found with a sweep over rectangles sorted by y0 and a
+    union-find; each group is replaced by its bounding box.
+    """
+    order = sorted(range(len(rects)), key=lambda i: rects[i][1])
+    parent = list(range(len(rects)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for position, i in enumerate(order):
+        x0, y0, x1, y1 = rects[i]
+        for j in order[position + 1:]:
+            other = rects[j]
+            if other[1] > y1 + gap:
+                break  # Sorted by y0: no later rectangle can touch this one
+            if other[0] <= x1 + gap and other[2] >= x0 - gap and other[3] >= y0 - gap:
+                parent[find(j)] = find(i)
+    
+    groups: Dict[int, List[float]] = {}
+    for i, (x0, y0, x1, y1) in enumerate(rects):
+        box = groups.setdefault(find(i), [x0, y0, x1, y1])
+        box[0], box[1] = min(box[0], x0), min(box[1], y0)
+        box[2], box[3] = max(box[2], x1), max(box[3], y1)
+    return [tuple(box) for box in groups.values()]
+
+
+# Page alignment: pages are paired by the similarity of their text so that an
+# inserted or deleted page does not shift every later page out of place
+PAGE_SHINGLE_SIZE = 3          # Words per shingle
+PAGE_SIGNATURE_SIZE = 64       # Smallest shingle hashes kept per page (bottom-k MinHash)
+PAGE_MATCH_THRESHOLD = 0.3     # Pages less similar than this are not paired on their own
+PAGE_EMPTY_SIMILARITY = 0.5    # Two pages without text (scans) pair up in order
+PAGE_ALIGNMENT_BAND = 20       # Pages a page may move by, beyond the page count difference
+
+# Moves into a cell of the page alignment table (see align_pages)
+_PAIR, _DELETE, _INSERT = 1, 2, 3
+
+
+def page_similarity(signature1: FrozenSet[int], signature2: FrozenSet[int]) -> float:
+    """Estimated Jaccard similarity of two pages from their bottom-k signatures."""
+    if not signature1 and not signature2:
+        return PAGE_EMPTY_SIMILARITY
+    sample = sorted(signature1 | signature2)[:PAGE_SIGNATURE_SIZE]
+    return sum(1 for h in sample if h in signature1 and h in signature2) / len(sample)
+
+
+def align_pages(signatures1: List[FrozenSet[int]], signatures2: List[FrozenSet[int]]) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Align the pages of two documents from their page signatures.
+    
+    Dynamic programming maximizes the summed similarity above
+    PAGE_MATCH_THRESHOLD of the paired pages, within a band around the
+    diagonal. Unpaired pages left between two pairs are then paired in order,
+    as rewritten pages, as far as both sides have some. Returns the rows
+    (page1, page2) in reading order; page1 is None for an inserted page and
+    page2 is None for a deleted one.
+    """
+    n, m = len(signatures1), len(signatures2)
+    low = min(0, m - n) - PAGE_ALIGNMENT_BAND
+    high = max(0, m - n) + PAGE_ALIGNMENT_BAND
+    unreachable = float('-inf')
+    
+    # Only the band is stored: row i covers j in starts[i]..starts[i] + len(score[i]) - 1.
+    # score[i][j - starts[i]]: best alignment of the first i and j pages;
+    # step[i][j - starts[i]]: move taken into (i, j)
+    starts = [max(0, i + low) for i in range(n + 1)]
+    score: List[array] = []
+    step: List[bytearray] = []
+    
+    def band_score(i: int, j: int) -> float:
+        offset = j - starts[i]
+        return score[i][offset] if 0 <= offset < len(score[i]) else unreachable
+    
+    for i in range(n + 1):
+        start = starts[i]
+        row_score = array('d', [unreachable]) * (min(m, i + high) + 1 - start)
+        row_step = bytearray(len(row_score))
+        score.append(row_score)
+        step.append(row_step)
+        for j in range(start, start + len(row_score)):
+            if i == 0 and j == 0:
+                row_score[0] = 0.0
+                continue
+            best, move = unreachable, 0
+            if i > 0 and j > 0:
+                diagonal = band_score(i - 1, j - 1)
+                if diagonal > unreachable:
+                    best = diagonal + page_similarity(signatures1[i - 1], signatures2[j - 1]) - PAGE_MATCH_THRESHOLD
+                    move = _PAIR
+            if i > 0:
+                above = band_score(i - 1, j)
+                if above > best:
+                    best, move = above, _DELETE
+            if j > start and row_score[j - 1 - start] > best:
+                best, move = row_score[j - 1 - start], _INSERT
+            row_score[j - start], row_step[j - start] = best, move
+    
+    steps = []
+    i, j = n, m
+    while i or j:
+        move = step[i][j - starts[i]]
+        steps.append(move)
+        if move != _INSERT:
+            i -= 1
+        if move != _DELETE:
+            j -= 1
+    steps.reverse()
+    
+    rows: List[Tuple[Optional[int], Optional[int]]] = []
+    deleted: List[int] = []
+    inserted: List[int] = []
+    
+    def flush():
+        paired = min(len(deleted), len(inserted))
+        rows.extend(zip(deleted[:paired], inserted[:paired]))
+        rows.extend((page1, None) for page1 in deleted[paired:])
+        rows.extend((None, page2) for page2 in inserted[paired:])
+        deleted.clear()
+        inserted.clear()
+    
+    i = j = 0
+    for move in steps:
+        if move == _PAIR:
+            flush()
+            rows.append((i, j))
+        elif move == _DELETE:
+            deleted.append(i)
+        else:
+            inserted.append(j)
+        if move != _INSERT:
+            i += 1
+        if move != _DELETE:
+            j += 1
+    flush()
+    return rows
+
+
+# Pixel diff of page images: 'auto' for pages without a text layer on either side
+# (scans), 'on' for every page, 'off' to compare text only
+VISUAL_DIFF_MODES = ('auto', 'on', 'off')
+VISUAL_DIFF_TOLERANCE = 64    # Gray-level difference ignored as scan noise
+VISUAL_DIFF_BLUR = 1          # Box blur radius in pixels, applied first to smooth grain
+VISUAL_DIFF_SHIFT = 2         # Misregistration in pixels tolerated between the two scans
+VISUAL_DIFF_CELL = 8          # Side in pixels of the grid cells regions are built from
+VISUAL_DIFF_THRESHOLD = 0.02  # Fraction of changed pixels that marks a cell as changed
+VISUAL_DIFF_MIN_CELLS = 2     # Smaller regions are dropped as specks
+
+
+def pixel_diff_regions(image1: Image.Image, image2: Image.Image,
+                       tolerance: int = VISUAL_DIFF_TOLERANCE, blur: int = VISUAL_DIFF_BLUR,
+                       shift: int = VISUAL_DIFF_SHIFT, threshold: float = VISUAL_DIFF_THRESHOLD,
+                       cell: int = VISUAL_DIFF_CELL,
+                       min_cells: int = VISUAL_DIFF_MIN_CELLS) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+    """Find the regions that differ between two page images.
+    
+    Both pages are compared in grayscale (the smaller one padded with white)
+    after a light blur. A pixel counts as added when image2 is darker, by more
+    than tolerance, than every pixel of image1 within shift pixels, and as
+    removed the other way round, so a scan that moved by a pixel or two does
+    not light up every stroke. Changed pixels are counted per grid cell with
+    numpy and changed cells are grouped into 8-connected components.
+    Returns (kind, pixel bbox) per region, where kind is 'insertion' (only
+    added ink), 'deletion' (only removed ink) or 'modification'.
+    """
+    if np is None:
+        raise ImportError("numpy is required for the visual diff. Install with: pip install numpy")
+    
+    width = max(image1.width, image2.width)
+    height = max(image1.height, image2.height)
+    # Pad to whole grid cells so the cell view below is a plain reshape
+    grid_w, grid_h = -(-width // cell), -(-height // cell)
+    
+    def prepare(image: Image.Image) -> Tuple['np.ndarray', 'np.ndarray']:
+        """Blurred gray pixels, and the darkest value within shift pixels of each."""
+        canvas = Image.new('L', (grid_w * cell, grid_h * cell), 255)
+        canvas.paste(image.convert('L'), (0, 0))
+        if blur > 0:
+            canvas = canvas.filter(ImageFilter.BoxBlur(blur))
+        pixels = np.asarray(canvas, dtype=np.int16)
+        return pixels, _darkest_within(pixels, shift)
+    
+    pixels1, darkest1 = prepare(image1)
+    pixels2, darkest2 = prepare(image2)
+    added = (darkest1 - pixels2) > tolerance
+    removed = (darkest2 - pixels1) > tolerance
+    
+    def per_cell(mask: 'np.ndarray') -> 'np.ndarray':
+        return mask.reshape(grid_h, cell, grid_w, cell).mean(axis=(1, 3))
+    
+    added_cells, removed_cells = per_cell(added), per_cell(removed)
+    changed_cells = (added_cells + removed_cells) > threshold
+    
+    regions = []
+    for rows, cols in _connected_cells(changed_cells):
+        if len(rows) < min_cells:
+            continue
+        added_share = added_cells[rows, cols].sum()
+        removed_share = removed_cells[rows, cols].sum()
+        if removed_share <= added_share / 10:
+            kind = 'insertion'
+        elif added_share <= removed_share / 10:
+            kind = 'deletion'
+        else:
+            kind = 'modification'
+        y0, y1 = min(rows) * cell, min((max(rows) + 1) * cell, height)
+        x0, x1 = min(cols) * cell, min((max(cols) + 1) * cell, width)
+        regions.append((kind, (x0, y0, x1, y1)))
+    return regions
+
+
+def _darkest_within(pixels: 'np.ndarray', radius: int) -> 'np.ndarray':
+    """Minimum of each pixel's (2 * radius + 1) square neighbourhood (separable, vectorized)."""
+    result = pixels.copy()
+    for axis in (0, 1):
+        source = result.copy()
+        for offset in range(1, radius + 1):
+            lead = [slice(None)] * 2
+            trail = [slice(None)] * 2
+            lead[axis], trail[axis] = slice(offset, None), slice(None, -offset)
+            np.minimum(result[tuple(lead)], source[tuple(trail)], out=result[tuple(lead)])
+            np.minimum(result[tuple(trail)], source[tuple(lead)], out=result[tuple(trail)])
+    return result
+
+
+def _connected_cells(grid: 'np.ndarray') -> Iterator[Tuple[List[int], List[int]]]:
+    """Yield the (rows, cols) of each 8-connected component of True cells in a 2-D grid."""
+    remaining = set(zip(*(axis.tolist() for axis in np.nonzero(grid))))
+    while remaining:
+        stack = [remaining.pop()]
+        rows, cols = [], []
+        while stack:
+            row, col = stack.pop()
+            rows.append(row)
+            cols.append(col)
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    neighbour = (row + d_row, col + d_col)
+                    if neighbour in remaining:
+                        remaining.remove(neighbour)
+                        stack.append(neighbour)
+        yield rows, cols
+
+
+# Structural comparison of Office documents: paragraphs, cells and slide shapes
+# are read with python-docx, openpyxl and python-pptx and compared directly,
+# without converting either file to PDF. 'render' keeps the PDF conversion.
+OFFICE_MODES = ('render', 'structural')
+OFFICE_FILE_TYPES = ('docx', 'xlsx', 'pptx')
+STRUCTURAL_REPORT_MAX_CHANGES = 5000  # Further changes are only in the JSON differences
+XLSX_CHUNK_ROWS = 200  # Rows laid out at a time when converting a sheet to PDF
+
+
+class OfficeItem:
+    """A paragraph, table cell, spreadsheet cell or slide shape of an Office document."""
+    
+    __slots__ = ('section', 'location', 'text')
+    
+    def __init__(self, section: str, location: str, text: str):
+        self.section = section    # Part of the document, e.g. 'Document', a sheet name or 'Slide 3'
+        self.location = location  # Position within the section, e.g. 'Paragraph 12' or 'B7'
+        self.text = text
+
+
+def docx_items(docx_path: str) -> List[OfficeItem]:
+    """Non-empty paragraphs and table cells of a DOCX file, in body order."""
+    if Document is None:
+        raise ImportError("python-docx package is required for DOCX support. Install with: pip install python-docx")
+    
+    doc = Document(docx_path)
+    items = []
+    paragraph_count = table_count = 0
+    for child in doc.element.body.iterchildren():
+        if child.tag == qn('w:p'):
+            text = DocxParagraph(child, doc).text
+            if text.strip():
+                paragraph_count += 1
+                items.append(OfficeItem('Document', f"Paragraph {paragraph_count}", text))
+        elif child.tag == qn('w:tbl'):
+            table_count += 1
+            for row_idx, row in enumerate(DocxTable(child, doc).rows, 1):
+                seen = set()  # Merged cells are repeated in row.cells
+                for cell_idx, cell in enumerate(row.cells, 1):
+                    if cell._tc in seen or not cell.text.strip():
+                        continue
+                    seen.add(cell._tc)
+                    items.append(OfficeItem('Document', f"Table {table_count}, row {row_idx}, cell {cell_idx}", cell.text))
+    return items
+
+
+def pptx_items(pptx_path: str) -> List[OfficeItem]:
+    """Text of the shapes (text frames and table cells) of every slide of a PPTX file."""
+    if Presentation is None:
+        raise ImportError("python-pptx package is required for PPTX support. Install with: pip install python-pptx")
+    
+    def shape_items(section, shapes):
+        for shape in shapes:
+            if hasattr(shape, 'shapes'):
+                yield from shape_items(section, shape.shapes)  # Group shape
+            elif getattr(shape, 'has_table', False):
+                for row_idx, row in enumerate(shape.table.rows, 1):
+                    for cell_idx, cell in enumerate(row.cells, 1):
+                        if cell.text.strip():
+                            yield OfficeItem(section, f"{shape.name}, row {row_idx}, cell {cell_idx}", cell.text)
+            elif getattr(shape, 'has_text_frame', False) and shape.text_frame.text.strip():
+                yield OfficeItem(section, shape.name, shape.text_frame.text)
+    
+    items = []
+    for slide_idx, slide in enumerate(Presentation(pptx_path).slides, 1):
+        items.extend(shape_items(f"Slide {slide_idx}", slide.shapes))
+    return items
+
+
+class SheetTable:
+    """Rows of one worksheet, read in a single streaming pass.
+    
+    Like BlockTable, rows are stored column-wise: row numbers and 64-bit row
+    hashes in arrays, and the cell texts of each row joined by CELL_SEPARATOR
+    into one string, so a sheet costs a few objects per row instead of one
+    per cell. Empty rows are skipped and trailing empty cells dropped. The
+    digest covers every row, so identical sheets are found without
+    comparing a single cell.
+    """
+    
+    CELL_SEPARATOR = '\x1f'  # ASCII unit separator
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.row_numbers = array('i')  # 1-based worksheet row of each stored row
+        self.row_hashes = array('q')
+        self.rows: List[str] = []
+        self._digest = hashlib.blake2b(digest_size=16)
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def append(self, row_number: int, cells: Sequence[str]):
+        """Add a row given its cell texts; rows without any text are skipped."""
+        cells = list(cells)
+        while cells and not cells[-1].strip():
+            cells.pop()
+        if not cells:
+            return
+        text = self.CELL_SEPARATOR.join(cells)
+        encoded = text.encode('utf-8')
+        self.row_numbers.append(row_number)
+        self.row_hashes.append(int.from_bytes(
+            hashlib.blake2b(encoded, digest_size=8).digest(), 'little', signed=True))
+        self.rows.append(text)
+        self._digest.update(row_number.to_bytes(4, 'little') + encoded + b'\n')
+    
+    def row_cells(self, index: int) -> List[str]:
+        """Cell texts of a stored row (index into rows, not a worksheet row number)."""
+        return self.rows[index].split(self.CELL_SEPARATOR)
+    
+    @property
+    def digest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def _cell_text(value) -> str:
+    """Text of a worksheet cell value as shown in a comparison."""
+    return '' if value is None else str(value)
+
+
+def iter_xlsx_rows(worksheet) -> Iterator[Tuple[int, List[str]]]:
+    """Stream (row number, cell texts) of a read-only worksheet, values only.
+    
+    Read-only worksheets trust the <dimension> tag stored in the file, which
+    writers other than Excel often leave stale (e.g. "A1" for a full sheet),
+    silently cutting the sheet short; it is ignored, so every stored row is
+    read. Rows then only extend to their last stored cell.
+    """
+    worksheet.reset_dimensions()
+    for row_number, row in enumerate(worksheet.iter_rows(values_only=True), 1):
+        yield row_number, [_cell_text(value) for value in row]
+
+
+def read_xlsx_sheets(xlsx_path: str) -> List[SheetTable]:
+    """Read every sheet of an XLSX file into SheetTables, streaming its rows.
+    
+    The workbook is opened read-only, so openpyxl parses rows as they are
+    iterated instead of building every cell object up front. Formulas are
+    compared as written, like the PDF conversion shows them.
+    """
+    if openpyxl is None:
+        raise ImportError("openpyxl package is required for XLSX support. Install with: pip install openpyxl")
+    
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True)
+    try:
+        sheets = []
+        for worksheet in workbook.worksheets:
+            sheet = SheetTable(worksheet.title)
+            for row_number, cells in iter_xlsx_rows(worksheet):
+                sheet.append(row_number, cells)
+            sheets.append(sheet)
+        return sheets
+    finally:
+        workbook.close()
+
+
+RENDER_MODES = ('all', 'changed')
+
+# Outputs of a comparison: the HTML report with annotated page images, the
+# machine-readable differences (DIFF_NAME) without any page rendering, or both
+OUTPUT_FORMATS = ('html', 'json', 'both')
+
+# Stages reported to a comparator's progress_callback, in pipeline order. A
+# stage may be reported more than once ('render' after 'diff' in 'changed' mode).
+PROGRESS_STAGES = ('convert', 'render', 'extract', 'diff', 'annotate', 'report')
+PROGRESS_INTERVAL = 0.5  # Minimum seconds between two reports of the same stage
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of this process where the OS allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak RSS of this process in MB since the last reset, or None if unknown."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # Lifetime peak: kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class StageMetrics:
+    """Wall time, CPU time, peak RSS and item counts of the stages of one comparison run.
+    
+    Stages are recorded in the order they finish and may repeat (a 'read' per
+    document). CPU time and peak RSS are those of the recording process: pages
+    rendered on the render pool only count towards wall time, and documents
+    loaded by document workers are recorded there and merged in (see
+    DocumentComparator.load_documents_concurrently). Peak RSS is reset at
+    the start of every stage on Linux; elsewhere it is the process peak.
+    """
+    
+    def __init__(self):
+        self.stages: List[Dict] = []
+        self.total: Dict = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+    
+    @contextmanager
+    def stage(self, name: str, **counts) -> Iterator[Dict]:
+        """Record the enclosed block as a stage; counts can be added to the yielded record."""
+        record = {'stage': name, **counts}
+        _reset_peak_rss()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            record['peak_rss_mb'] = _peak_rss_mb()
+            self.stages.append(record)
+    
+    def finish(self):
+        """Record the totals of the run, from creation until now."""
+        peaks = [record['peak_rss_mb'] for record in self.stages if record['peak_rss_mb'] is not None]
+        self.total = {
+            'wall_s': round(time.perf_counter() - self._wall, 4),
+            'cpu_s': round(time.process_time() - self._cpu, 4),
+            'peak_rss_mb': max(peaks, default=_peak_rss_mb()),
+        }
+    
+    def to_json(self) -> Dict:
+        return {'stages': self.stages, 'total': self.total}
+
+
+# Annotation styles: name -> (RGBA fill, outline color, outline width, outline padding in pixels).
+# Light fills keep the underlying text readable.
+ANNOTATION_STYLES = {
+    'deletion': ((255, 200, 200, 120), 'darkred', 3, 2),
+    'insertion': ((0, 255, 0, 80), 'green', 3, 2),
+    'modification': ((255, 165, 0, 80), 'orange', 3, 2),
+    'word_deletion': ((255, 200, 200, 150), 'darkred', 2, 1),
+    'word_insertion': ((200, 255, 200, 120), 'green', 2, 1),
+    'word_modification': ((255, 220, 180, 120), 'orange', 2, 1),
+}
+
+# Boxes of the same style closer than this (in PDF points) are drawn as one
+ANNOTATION_MERGE_GAP = 2.0
+
+# Output image formats: file extension -> (PIL format, save options).
+# PNG compress_level 3 is both faster and smaller than the default 6 on document pages.
+IMAGE_FORMATS = {
+    'png': ('PNG', {'compress_level': 3}),
+    'webp': ('WEBP', {'quality': 80, 'method': 2}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True}),
+}
+
+
 class DocumentComparator:
     """Advanced document comparison with visual annotations. Supports PDF, DOCX, XLSX, PPTX formats."""
     
-    def __init__(self):
+    def __init__(self, use_cache: bool = True, cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 render_workers: int = 1, pipeline: bool = False, render_mode: str = 'all',
+                 image_format: str = 'png', embed_images: bool = False, diff_engine: str = 'patience',
+                 streaming: bool = False, colorspace: str = 'rgb', visual_diff: str = 'auto',
+                 output_format: str = 'both', office_mode: str = 'render', sheet_key: Optional[str] = None,
+                 progress_callback: Optional[Callable[[str, Optional[int], Optional[int]], None]] = None):
         self.dpi = 150  # Resolution for document to image conversion
         
+        # Colorspace pages are rendered in; annotated pages are always color
+        if colorspace not in RENDER_COLORSPACES:
+            raise ValueError(f"Unsupported colorspace: {colorspace}")
+        self.colorspace = colorspace
+        # Worker budget: processes a comparison may use to render pages and to
+        # load documents concurrently (per job with --serve; see pool_workers)
+        self.render_workers = max(1, render_workers)
+        self.pipeline = pipeline  # Load both documents concurrently in separate processes
+        
+        # 'all' renders every page; 'changed' diffs the text first and only renders
+        # pages with changes, collapsing runs of unchanged pages in the report
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unsupported render mode: {render_mode}")
+        self.render_mode = render_mode
+        
+        # Page images are encoded once in this format and linked from the report,
+        # unless embed_images inlines them as base64 data URIs
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.image_format = image_format
+        self.embed_images = embed_images
+        
+        # Diff the text first, then render, annotate, encode and write one page
+        # pair at a time so memory does not grow with the page count
+        if streaming and embed_images:
+            raise ValueError("Streaming mode links page images; it cannot embed them")
+        self.streaming = streaming
+        
+        # Line and word alignment algorithm, see diff_opcodes
+        if diff_engine not in DIFF_ENGINES:
+            raise ValueError(f"Unsupported diff engine: {diff_engine}")
+        self.diff_engine = diff_engine
+        
+        # Pages compared pixel by pixel, for scans without a text layer
+        if visual_diff not in VISUAL_DIFF_MODES:
+            raise ValueError(f"Unsupported visual diff mode: {visual_diff}")
+        self.visual_diff = visual_diff
+        
+        # HTML report, JSON differences, or both; 'json' skips rendering pages
+        # (except those compared as images)
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.output_format = output_format
+        
+        # 'structural' compares DOCX, XLSX and PPTX files item by item instead
+        # of converting both to PDF (see OFFICE_MODES)
+        if office_mode not in OFFICE_MODES:
+            raise ValueError(f"Unsupported office mode: {office_mode}")
+        self.office_mode = office_mode
+        # Column (letter or header name) spreadsheet rows are aligned on in
+        # structural mode; rows are aligned by content when not set
+        self.sheet_key = sheet_key
+        
+        # Called as progress_callback(stage, done, total) while a comparison
+        # runs (see report_progress); not carried into pool workers
+        self.progress_callback = progress_callback
+        self._progress_stage: Optional[str] = None
+        self._progress_time = 0.0
+        
         # Use the backend temp directory instead of current working directory
         script_dir = Path(__file__).parent.parent  # Go up to backend directory
         self.temp_dir = script_dir / "temp"
         self.temp_dir.mkdir(exist_ok=True)
         
-        # Create timestamped folder for this comparison
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        # Finished comparisons are cached by content hash under temp/cache
+        self.cache = ComparisonCache(self.temp_dir / "cache", cache_max_bytes) if use_cache else None
+        
+        # Per-comparison folders, created when a comparison actually runs
+        self.comparison_dir: Optional[Path] = None
+        self.temp_conversion_dir: Optional[Path] = None
+        
+        # Summary counts of the last comparison run, and whether it came from the cache
+        self.summary: Dict[str, int] = {}
+        self.cache_hit = False
+        
+        # Outputs of the last comparison run (None when not written)
+        self.report_path: Optional[Path] = None
+        self.diff_path: Optional[Path] = None
+        
+        # Content hashes of input files, computed once per path
+        self._file_hashes: Dict[str, str] = {}
+        
+        # Timings and memory of the stages of the last comparison run
+        self.metrics = StageMetrics()
+    
+    def __getstate__(self) -> Dict:
+        # Comparators are pickled into document workers; callbacks may be closures
+        state = self.__dict__.copy()
+        state['progress_callback'] = None
+        return state
+    
+    def report_progress(self, stage: str, done: Optional[int] = None, total: Optional[int] = None):
+        """Report the current stage (one of PROGRESS_STAGES) and how many of its items are done.
+        
+        Reports within a stage are throttled to one per PROGRESS_INTERVAL,
+        except the first and the last (done == total); a repeated stage
+        without counts is not reported again.
+        """
+        if self.progress_callback is None:
+            return
+        now = time.monotonic()
+        if stage == self._progress_stage and (
+                done is None or (done != total and now - self._progress_time < PROGRESS_INTERVAL)):
+            return
+        self._progress_stage = stage
+        self._progress_time = now
+        self.progress_callback(stage, done, total)
+    
+    def pool_workers(self) -> int:
+        """Worker processes this comparison may start; 0 inside a render or document worker."""
+        return 0 if _in_pool_worker() else self.render_workers
+    
+    def _create_comparison_dir(self):
+        """Create the timestamped folder (and conversion subfolder) for a new comparison."""
+        # Microseconds keep concurrent comparisons in a long-lived worker from colliding
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
         self.comparison_dir = self.temp_dir / f"compare_{timestamp}"
         self.comparison_dir.mkdir(exist_ok=True)
         
         # Create temp directory for intermediate files
         self.temp_conversion_dir = self.comparison_dir / "temp_conversions"
         self.temp_conversion_dir.mkdir(exist_ok=True)
+    
+    def file_hash(self, file_path: str) -> str:
+        """Return the (memoized) content hash of an input file."""
+        if file_path not in self._file_hashes:
+            self._file_hashes[file_path] = hash_file(file_path)
+        return self._file_hashes[file_path]
+    
+    def comparison_options(self) -> Dict:
+        """Options that change the comparison output; part of the result cache key."""
+        return {
+            'dpi': self.dpi,
+            'colorspace': self.colorspace,
+            'normalization': 'collapse-whitespace,lowercase',
+            'render_mode': self.render_mode,
+            'image_format': self.image_format,
+            'embed_images': self.embed_images,
+            'diff_engine': self.diff_engine,
+            'visual_diff': self.visual_diff,
+            'output_format': self.output_format,
+            'office_mode': self.office_mode,
+            'sheet_key': self.sheet_key,
+        }
         
     def get_file_type(self, file_path: str) -> str:
         """Determine the file type based on extension."""
@@ -95,6 +1498,15 @@ class DocumentComparator:
         else:
             raise ValueError(f"Unsupported file format: {extension}")
     
+    def _converted_pdf_path(self, file_path: str) -> Path:
+        """Path for the PDF converted from a document.
+        
+        Includes a digest of the source path so two inputs with the same file name
+        (converted one after the other or concurrently) never share an output file.
+        """
+        digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:8]
+        return self.temp_conversion_dir / f"{Path(file_path).stem}_{digest}_converted.pdf"
+    
     def convert_docx_to_pdf(self, docx_path: str) -> str:
         """Convert DOCX file to PDF."""
         if Document is None:
@@ -104,7 +1516,7 @@ class DocumentComparator:
         
         # Try using python-docx with reportlab for conversion
         doc = Document(docx_path)
-        pdf_path = self.temp_conversion_dir / f"{Path(docx_path).stem}_converted.pdf"
+        pdf_path = self._converted_pdf_path(docx_path)
         
         # Create PDF using reportlab
         from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
@@ -125,48 +1537,106 @@ class DocumentComparator:
         return str(pdf_path)
     
     def convert_xlsx_to_pdf(self, xlsx_path: str) -> str:
-        """Convert XLSX file to PDF."""
+        """Convert XLSX file to PDF, streaming the rows of every sheet.
+        
+        The workbook is read in read-only mode and each sheet is streamed
+        twice: once to measure the column widths that fit all of its rows, so
+        every chunk's columns line up, then to lay it out XLSX_CHUNK_ROWS rows
+        at a time. Every chunk is drawn onto the pages as soon as it is laid
+        out, so memory stays bounded by one chunk instead of growing with the
+        sheet.
+        """
         if openpyxl is None:
             raise ImportError("openpyxl and reportlab packages are required for XLSX support. Install with: pip install openpyxl reportlab")
         
         print(f"Converting XLSX to PDF: {xlsx_path}")
         
-        wb = openpyxl.load_workbook(xlsx_path)
-        pdf_path = self.temp_conversion_dir / f"{Path(xlsx_path).stem}_converted.pdf"
+        wb = openpyxl.load_workbook(xlsx_path, read_only=True)
+        pdf_path = self._converted_pdf_path(xlsx_path)
         
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+        from reportlab.platypus import Table, TableStyle
         from reportlab.lib.pagesizes import letter, landscape
         from reportlab.lib import colors
-        
-        doc = SimpleDocTemplate(str(pdf_path), pagesize=landscape(letter))
-        story = []
-        
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            
-            # Convert sheet data to list of lists
-            data = []
-            for row in ws.iter_rows(values_only=True):
-                data.append([str(cell) if cell is not None else '' for cell in row])
-            
-            if data:
-                # Create table
-                table = Table(data)
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 14),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                story.append(table)
-        
-        doc.build(story)
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        
+        page_width, page_height = landscape(letter)
+        margin = 72  # SimpleDocTemplate's default margins
+        pdf = canvas.Canvas(str(pdf_path), pagesize=(page_width, page_height))
+        header_style = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 14),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ]
+        body_style = [
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]
+        y = page_height - margin  # Top of the free space on the current page
+        
+        def draw_chunk(rows: List[List[str]], col_widths: List[float], first: bool):
+            nonlocal y
+            table = Table(rows, colWidths=col_widths)
+            table.setStyle(TableStyle(header_style + body_style if first
+                                      else [('BACKGROUND', (0, 0), (-1, -1), colors.beige)] + body_style))
+            while table is not None:
+                parts = table.split(page_width - 2 * margin, y - margin)
+                if not parts:
+                    if y == page_height - margin:
+                        parts = [table]  # Taller than a page: draw it anyway, as platypus would
+                    else:
+                        pdf.showPage()
+                        y = page_height - margin
+                        continue
+                part = parts[0]
+                width, height = part.wrap(page_width - 2 * margin, y - margin)
+                part.drawOn(pdf, (page_width - width) / 2, y - height)
+                y -= height
+                table = parts[1] if len(parts) > 1 else None
+                if table is not None:
+                    pdf.showPage()
+                    y = page_height - margin
+        
+        try:
+            for ws in wb.worksheets:
+                col_widths = self._xlsx_column_widths((cells for _, cells in iter_xlsx_rows(ws)), stringWidth)
+                chunk: List[List[str]] = []
+                first = True
+                for _, cells in iter_xlsx_rows(ws):
+                    chunk.append(cells)
+                    if len(chunk) == XLSX_CHUNK_ROWS:
+                        draw_chunk(self._pad_rows(chunk, len(col_widths)), col_widths, first)
+                        chunk, first = [], False
+                if chunk:
+                    draw_chunk(self._pad_rows(chunk, len(col_widths)), col_widths, first)
+        finally:
+            wb.close()
+        
+        pdf.save()
         return str(pdf_path)
     
+    @staticmethod
+    def _xlsx_column_widths(rows: Iterable[List[str]], string_width) -> List[float]:
+        """Column widths that fit every row of a sheet.
+        
+        The first row is measured in the bold 14 pt header font.
+        """
+        widths: List[float] = []
+        for row_idx, row in enumerate(rows):
+            font, size = ('Helvetica-Bold', 14) if row_idx == 0 else ('Helvetica', 10)
+            if len(row) > len(widths):
+                widths.extend([0.0] * (len(row) - len(widths)))
+            for col, text in enumerate(row):
+                widths[col] = max(widths[col], string_width(text, font, size) + 12)  # 6 pt padding each side
+        return [width or 12.0 for width in widths]
+    
+    @staticmethod
+    def _pad_rows(rows: List[List[str]], width: int) -> List[List[str]]:
+        """Pad rows with empty cells to a common width (streamed rows end at their last cell)."""
+        return [row + [''] * (width - len(row)) for row in rows]
+    
     def convert_pptx_to_pdf(self, pptx_path: str) -> str:
         """Convert PPTX file to PDF."""
         if Presentation is None:
@@ -175,7 +1645,7 @@ class DocumentComparator:
         print(f"Converting PPTX to PDF: {pptx_path}")
         
         prs = Presentation(pptx_path)
-        pdf_path = self.temp_conversion_dir / f"{Path(pptx_path).stem}_converted.pdf"
+        pdf_path = self._converted_pdf_path(pptx_path)
         
         from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
         from reportlab.lib.styles import getSampleStyleSheet
@@ -217,61 +1687,169 @@ class DocumentComparator:
         
         if file_type == 'pdf':
             return file_path  # Already PDF
-        elif file_type == 'docx':
-            return self.convert_docx_to_pdf(file_path)
-        elif file_type == 'xlsx':
-            return self.convert_xlsx_to_pdf(file_path)
-        elif file_type == 'pptx':
-            return self.convert_pptx_to_pdf(file_path)
-        else:
+        
+        # Converted earlier in this comparison (possibly by a document worker)
+        converted_path = self._converted_pdf_path(file_path)
+        if converted_path.exists():
+            return str(converted_path)
+        
+        converters = {
+            'docx': self.convert_docx_to_pdf,
+            'xlsx': self.convert_xlsx_to_pdf,
+            'pptx': self.convert_pptx_to_pdf,
+        }
+        if file_type not in converters:
             raise ValueError(f"Unsupported file type: {file_type}")
+        self.report_progress('convert')
+        with self.metrics.stage('convert', document=Path(file_path).name):
+            return converters[file_type](file_path)
+        
+    def read_pdf(self, pdf_path: str, render: bool = True,
+                 extract: bool = True) -> Tuple[Optional[List[Image.Image]], Optional[BlockTable]]:
+        """Render the pages and/or extract the text blocks of a PDF, opening it once.
+        
+        Each page is loaded a single time for both. Large documents are
+        rendered on the process pool instead, one contiguous page range per
+        worker, while this process extracts the text. Returns None for
+        whichever part was not requested.
+        """
+        steps = [step for step, wanted in (("rendering pages", render), ("extracting text", extract)) if wanted]
+        print(f"Reading {pdf_path} ({' and '.join(steps)})...")
+        with self.metrics.stage('read', document=Path(pdf_path).name) as record:
+            stage = 'render' if render else 'extract'
+            with PdfDocument(pdf_path, self.dpi, self.colorspace) as document:
+                page_count = len(document)
+                self.report_progress(stage, 0, page_count)
+                blocks = BlockTable(page_count) if extract else None
+                images = [] if render else None
+                
+                workers = min(self.pool_workers(), page_count // MIN_PAGES_PER_RENDER_WORKER) if render else 0
+                if workers > 1:
+                    futures = self._submit_page_ranges(pdf_path, page_count, workers)
+                    if extract:
+                        for _ in document.iter_pages(blocks, render=False):
+                            pass
+                    # Collect ranges in submission order so page order is preserved
+                    for future in futures:
+                        for mode, size, data in future.result():
+                            images.append(Image.frombytes(mode, size, data))
+                        self.report_progress(stage, len(images), page_count)
+                elif render or extract:
+                    for page_num, image in document.iter_pages(blocks, render):
+                        if render:
+                            images.append(image)
+                        self.report_progress(stage, page_num + 1, page_count)
+                
+                record.update(pages=page_count, rendered=len(images) if render else 0,
+                              blocks=len(blocks) if extract else 0)
         
+        return images, blocks
+    
+    def _submit_page_ranges(self, pdf_path: str, page_count: int, workers: int) -> List:
+        """Submit a PDF to the render pool, one contiguous page range per worker."""
+        pool = _get_process_pool(self.render_workers)
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        return [pool.submit(_render_page_range, pdf_path, self.dpi, self.colorspace, start, stop)
+                for start, stop in zip(bounds, bounds[1:])]
+    
     def pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
         """Convert PDF pages to PIL Images."""
-        print(f"Converting {pdf_path} to images...")
-        doc = fitz.open(pdf_path)
-        images = []
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            # Convert to image with high DPI for quality
-            mat = fitz.Matrix(self.dpi/72, self.dpi/72)
-            pix = page.get_pixmap(matrix=mat) # type: ignore
-            img_data = pix.tobytes("png")
-            image = Image.open(io.BytesIO(img_data))
-            images.append(image)
-            
-        doc.close()
-        return images
+        return self.read_pdf(pdf_path, extract=False)[0]
     
-    def extract_text_blocks(self, pdf_path: str) -> List[List[TextBlock]]:
+    def extract_text_blocks(self, pdf_path: str) -> BlockTable:
         """Extract text blocks with position information from PDF."""
-        print(f"Extracting text blocks from {pdf_path}...")
-        doc = fitz.open(pdf_path)
-        pages_blocks = []
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            blocks = []
-            
-            # Get text blocks with position
-            text_dict = page.get_text("dict") # type: ignore
-            for block in text_dict["blocks"]:
-                if "lines" in block:  # Text block
-                    for line in block["lines"]:
-                        line_text = ""
-                        line_bbox = line["bbox"]
-                        for span in line["spans"]:
-                            line_text += span["text"]
-                        
-                        if line_text.strip():
-                            text_block = TextBlock(line_text, line_bbox, page_num)
-                            blocks.append(text_block)
-            
-            pages_blocks.append(blocks)
+        return self.read_pdf(pdf_path, render=False)[1]
+    
+    def load_document(self, file_path: str, render: bool = True) -> Tuple[Optional[List[Image.Image]], BlockTable]:
+        """Return page images and text blocks of a document, using the artifact cache if enabled.
         
-        doc.close()
-        return pages_blocks
+        With render=False only the text blocks are loaded and the images are None.
+        """
+        images = blocks = None
+        name = Path(file_path).name
+        if self.cache:
+            with self.metrics.stage('cache_read', document=name) as record:
+                file_hash = self.file_hash(file_path)
+                if render:
+                    images = self.cache.load_pages(file_hash, self.dpi, self.colorspace)
+                blocks = self.cache.load_blocks(file_hash)
+                record.update(pages=len(images) if images is not None else 0,
+                              blocks=len(blocks) if blocks is not None else 0)
+            if (images is not None or not render) and blocks is not None:
+                print(f"Using cached {'pages and ' if render else ''}text blocks for {file_path}")
+                return images, blocks
+        
+        # Step 1: Convert document to PDF if needed
+        pdf_path = self.convert_to_pdf(file_path)
+        
+        # Steps 2-3: Render pages and extract text blocks with positions,
+        # from a single open document
+        render_pages = render and images is None
+        extract_blocks = blocks is None
+        rendered, extracted = self.read_pdf(pdf_path, render_pages, extract_blocks)
+        if render_pages:
+            images = rendered
+        if extract_blocks:
+            blocks = extracted
+        if self.cache:
+            with self.metrics.stage('cache_write', document=name,
+                                    pages=len(images) if render_pages else 0,
+                                    blocks=len(blocks) if extract_blocks else 0):
+                if render_pages:
+                    self.cache.store_pages(file_hash, self.dpi, self.colorspace, images)
+                if extract_blocks:
+                    self.cache.store_blocks(file_hash, blocks)
+        
+        return images, blocks
+    
+    def render_document_pages(self, file_path: str, page_numbers: List[int]) -> Dict[int, Image.Image]:
+        """Render selected pages of a document, using cached pages if available."""
+        if not page_numbers:
+            return {}
+        
+        name = Path(file_path).name
+        if self.cache:
+            with self.metrics.stage('cache_read', document=name, pages=len(page_numbers)):
+                images = self.cache.load_pages(self.file_hash(file_path), self.dpi, self.colorspace, page_numbers)
+            if images is not None:
+                return dict(zip(page_numbers, images))
+        
+        pdf_path = self.convert_to_pdf(file_path)
+        print(f"Rendering {len(page_numbers)} changed page(s) of {pdf_path}...")
+        self.report_progress('render')
+        with self.metrics.stage('render', document=name, pages=len(page_numbers)), \
+                PdfDocument(pdf_path, self.dpi, self.colorspace) as document:
+            return dict(document.iter_pages(page_numbers=page_numbers))
+    
+    def load_documents_concurrently(self, file_paths: List[str], render: bool = True) -> List[Tuple[Optional[List[Image.Image]], BlockTable]]:
+        """Run load_document for several documents at once, one pool worker per document.
+        
+        Conversion, rendering and extraction of one document do not depend on the
+        other, so the total time is close to that of the slowest document. Only
+        the text blocks come back over IPC; page pixels are passed through a raw
+        file in the comparison's temp folder (see _load_document_job), read back
+        one page at a time.
+        """
+        # Hash in the parent so workers share the memoized hashes
+        if self.cache:
+            for file_path in file_paths:
+                self.file_hash(file_path)
+        
+        # Workers cannot report progress, so it is counted in documents here
+        stage = 'convert' if any(self.get_file_type(path) != 'pdf' for path in file_paths) else \
+            'render' if render else 'extract'
+        self.report_progress(stage, 0, len(file_paths))
+        pool = _get_process_pool(self.render_workers)
+        results = []
+        with self.metrics.stage('load', documents=len(file_paths)):
+            futures = [pool.submit(_load_document_job, self, file_path, render) for file_path in file_paths]
+            for future in futures:
+                blocks, pages, stages = future.result()
+                results.append((_read_spilled_pages(*pages) if pages else None, blocks))
+                self.report_progress('render' if render else 'extract', len(results), len(file_paths))
+                # Stages of the worker, recorded in its own process
+                self.metrics.stages.extend(dict(record, worker=True) for record in stages)
+        return results
     
     def normalize_text_for_comparison(self, text: str) -> str:
         """Normalize text for comparison, removing layout-dependent differences."""
@@ -283,337 +1861,699 @@ class DocumentComparator:
         text = text.lower()
         return text
     
-    def find_word_level_differences(self, text1: str, text2: str) -> Dict[str, List]:
-        """Find word-level differences between two text strings."""
+    def flatten_blocks(self, blocks: BlockTable) -> Tuple[List[str], List[int]]:
+        """Normalize every line of a block table, with the table row of each line.
+        
+        Rows whose text normalizes to nothing are skipped, so lines[i] is always
+        the normalized text of row rows[i]. Normalization is done once per
+        distinct text, since repeated lines share one interned string.
+        """
+        normalized_texts: Dict[str, str] = {}
+        lines = []
+        rows = []
+        for row, text in enumerate(blocks.texts):
+            normalized = normalized_texts.get(text)
+            if normalized is None:
+                normalized = sys.intern(self.normalize_text_for_comparison(text))
+                normalized_texts[text] = normalized
+            if normalized:
+                lines.append(normalized)
+                rows.append(row)
+        return lines, rows
+    
+    def find_word_level_differences(self, text1: str, text2: str) -> Dict[str, Dict[str, Set[int]]]:
+        """Find word-level differences between two text strings.
+        
+        Returns per-side sets of word indices: 'old' (into text1) has
+        'deletions' and 'modifications', 'new' (into text2) has 'insertions'
+        and 'modifications'. Lookups are O(1) however many words changed.
+        """
         words1 = text1.split()
         words2 = text2.split()
         
-        matcher = difflib.SequenceMatcher(None, words1, words2)
         word_differences = {
-            'deletions': [],    # Word indices deleted from text1
-            'insertions': [],   # Word indices added in text2  
-            'modifications': [] # Word indices modified between texts
+            'old': {'deletions': set(), 'modifications': set()},   # Word indices in text1
+            'new': {'insertions': set(), 'modifications': set()},  # Word indices in text2
         }
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for tag, i1, i2, j1, j2 in diff_opcodes(words1, words2, self.diff_engine):
             if tag == 'delete':
-                word_differences['deletions'].extend(range(i1, i2))
+                word_differences['old']['deletions'].update(range(i1, i2))
             elif tag == 'insert':
-                word_differences['insertions'].extend(range(j1, j2))
+                word_differences['new']['insertions'].update(range(j1, j2))
             elif tag == 'replace':
-                word_differences['modifications'].extend([('old', i) for i in range(i1, i2)])
-                word_differences['modifications'].extend([('new', j) for j in range(j1, j2)])
+                word_differences['old']['modifications'].update(range(i1, i2))
+                word_differences['new']['modifications'].update(range(j1, j2))
         
         return word_differences
 
-    def find_text_differences(self, blocks1: List[List[TextBlock]], 
-                            blocks2: List[List[TextBlock]]) -> Dict:
-        """Find text differences between two sets of text blocks with word-level precision."""
+    def find_text_differences(self, blocks1: BlockTable, blocks2: BlockTable,
+                              pages: Optional[List[Tuple[Optional[int], Optional[int]]]] = None) -> Dict:
+        """Find text differences between two sets of text blocks with word-level precision.
+        
+        The diff is hierarchical. With the aligned page pairs (see
+        align_document_pages), paired pages whose normalized lines are
+        identical are skipped on a fingerprint comparison. Lines are aligned only
+        within each run of differing page pairs, and words only within replaced
+        lines. The cost grows with the size of the change, not of the documents.
+        Without pages the documents are diffed as a single region.
+        """
         print("Analyzing text differences...")
         
-        # Flatten all text blocks and normalize
-        text1_lines = []
-        text2_lines = []
-        block1_map = {}  # normalized_text -> TextBlock
-        block2_map = {}  # normalized_text -> TextBlock
-        
-        for page_blocks in blocks1:
-            for block in page_blocks:
-                normalized = self.normalize_text_for_comparison(block.text)
-                if normalized:
-                    text1_lines.append(normalized)
-                    block1_map[normalized] = block
-        
-        for page_blocks in blocks2:
-            for block in page_blocks:
-                normalized = self.normalize_text_for_comparison(block.text)
-                if normalized:
-                    text2_lines.append(normalized)
-                    block2_map[normalized] = block
-        
-        # Use difflib to find line-level differences first
-        matcher = difflib.SequenceMatcher(None, text1_lines, text2_lines)
+        # Normalize all lines, keeping the table row of each one, so every opcode
+        # position resolves to its exact TextBlock (repeated lines included)
+        text1_lines, rows1 = self.flatten_blocks(blocks1)
+        text2_lines, rows2 = self.flatten_blocks(blocks2)
         
         differences = {
             'deletions': [],    # Text blocks deleted from pdf1
             'insertions': [],   # Text blocks added in pdf2
             'modifications': [], # Text blocks modified between pdfs
-            'word_level': {}    # Map block -> word-level differences
+            'word_level': {},   # Map block -> word-level differences
+            'visual': []        # Pixel-diff regions (kind, page1, page2, bbox), see add_visual_differences
         }
         
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if pages is None:
+            regions = [((0, len(text1_lines)), (0, len(text2_lines)))]
+        else:
+            regions = self.differing_regions(blocks1, rows1, text1_lines, blocks2, rows2, text2_lines, pages)
+        
+        for done, ((start1, stop1), (start2, stop2)) in enumerate(regions):
+            self.report_progress('diff', done, len(regions))
+            self.add_line_differences(differences,
+                                      text1_lines[start1:stop1], rows1[start1:stop1], blocks1,
+                                      text2_lines[start2:stop2], rows2[start2:stop2], blocks2)
+        self.report_progress('diff', len(regions), len(regions))
+        
+        return differences
+    
+    def differing_regions(self, blocks1: BlockTable, rows1: List[int], lines1: List[str],
+                          blocks2: BlockTable, rows2: List[int], lines2: List[str],
+                          pages: List[Tuple[Optional[int], Optional[int]]]) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """Spans of flattened lines, per document, of each run of page pairs that differ.
+        
+        A page pair is identical when both pages hold the same normalized lines,
+        which is checked on a fingerprint (the hash of the page's lines) first.
+        Consecutive differing pairs form one region, so text that flows across
+        a page break is still aligned as a whole.
+        """
+        spans1 = self._page_line_spans(blocks1, rows1)
+        spans2 = self._page_line_spans(blocks2, rows2)
+        fingerprints1 = [hash(tuple(lines1[start:stop])) for start, stop in spans1]
+        fingerprints2 = [hash(tuple(lines2[start:stop])) for start, stop in spans2]
+        
+        regions: List[List[List[int]]] = []
+        region = None
+        position1 = position2 = 0  # End of the lines of the pages walked so far
+        identical = 0
+        for page1, page2 in pages:
+            if (page1 is not None and page2 is not None
+                    and fingerprints1[page1] == fingerprints2[page2]
+                    and lines1[slice(*spans1[page1])] == lines2[slice(*spans2[page2])]):
+                identical += 1
+                region = None
+            else:
+                if region is None:
+                    region = [[position1, position1], [position2, position2]]
+                    regions.append(region)
+                if page1 is not None:
+                    region[0][1] = spans1[page1][1]
+                if page2 is not None:
+                    region[1][1] = spans2[page2][1]
+            
+            if page1 is not None:
+                position1 = spans1[page1][1]
+            if page2 is not None:
+                position2 = spans2[page2][1]
+        
+        print(f"Skipping {identical} identical page pair(s); diffing {len(pages) - identical} "
+              f"in {len(regions)} region(s)")
+        return [(tuple(span1), tuple(span2)) for span1, span2 in regions]
+    
+    @staticmethod
+    def _page_line_spans(blocks: BlockTable, rows: List[int]) -> List[Tuple[int, int]]:
+        """(start, stop) into the flattened lines of every page, from their table rows."""
+        spans = []
+        for page_num in range(blocks.page_count):
+            page_rows = blocks.page_rows(page_num)
+            spans.append((bisect_left(rows, page_rows.start), bisect_left(rows, page_rows.stop)))
+        return spans
+    
+    def add_line_differences(self, differences: Dict,
+                             lines1: List[str], rows1: List[int], blocks1: BlockTable,
+                             lines2: List[str], rows2: List[int], blocks2: BlockTable):
+        """Align the lines of one region of both documents and add their differences."""
+        # Align lines first (see diff_opcodes for the available engines)
+        opcodes = diff_opcodes(lines1, lines2, self.diff_engine)
+        
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'delete':
                 # Text deleted from pdf1
-                for i in range(i1, i2):
-                    if i < len(text1_lines):
-                        block = block1_map.get(text1_lines[i])
-                        if block:
-                            differences['deletions'].append(block)
+                differences['deletions'].extend(blocks1.block(row) for row in rows1[i1:i2])
             
             elif tag == 'insert':
                 # Text inserted in pdf2
-                for j in range(j1, j2):
-                    if j < len(text2_lines):
-                        block = block2_map.get(text2_lines[j])
-                        if block:
-                            differences['insertions'].append(block)
+                differences['insertions'].extend(blocks2.block(row) for row in rows2[j1:j2])
             
             elif tag == 'replace':
-                # For replaced lines, perform word-level analysis
-                old_lines = text1_lines[i1:i2]
-                new_lines = text2_lines[j1:j2]
-                
-                # If we have corresponding lines, do word-level comparison
-                if len(old_lines) == len(new_lines) == 1:
-                    old_block = block1_map.get(old_lines[0])
-                    new_block = block2_map.get(new_lines[0])
-                    
-                    if old_block and new_block:
-                        # Perform word-level comparison
-                        word_diffs = self.find_word_level_differences(old_lines[0], new_lines[0])
-                        differences['word_level'][old_block] = ('old', word_diffs, old_lines[0])
-                        differences['word_level'][new_block] = ('new', word_diffs, new_lines[0])
-                        differences['modifications'].append(('old', old_block))
-                        differences['modifications'].append(('new', new_block))
-                        continue
+                # For a single replaced line, perform word-level analysis
+                if i2 - i1 == j2 - j1 == 1:
+                    old_block, new_block = blocks1.block(rows1[i1]), blocks2.block(rows2[j1])
+                    old_line, new_line = lines1[i1], lines2[j1]
+                    word_diffs = self.find_word_level_differences(old_line, new_line)
+                    differences['word_level'][old_block] = ('old', word_diffs, old_line)
+                    differences['word_level'][new_block] = ('new', word_diffs, new_line)
+                    differences['modifications'].append(('old', old_block))
+                    differences['modifications'].append(('new', new_block))
+                    continue
                 
                 # Fall back to line-level for complex changes
-                for i in range(i1, i2):
-                    if i < len(text1_lines):
-                        block = block1_map.get(text1_lines[i])
-                        if block:
-                            differences['modifications'].append(('old', block))
-                
-                for j in range(j1, j2):
-                    if j < len(text2_lines):
-                        block = block2_map.get(text2_lines[j])
-                        if block:
-                            differences['modifications'].append(('new', block))
-        
-        return differences
+                differences['modifications'].extend(('old', blocks1.block(row)) for row in rows1[i1:i2])
+                differences['modifications'].extend(('new', blocks2.block(row)) for row in rows2[j1:j2])
     
-    def pad_images_and_blocks(self, images1: List[Image.Image], images2: List[Image.Image],
-                            blocks1: List[List[TextBlock]], blocks2: List[List[TextBlock]]) -> Tuple:
-        """Pad the shorter PDF with empty pages."""
-        max_pages = max(len(images1), len(images2))
+    def page_signatures(self, blocks: BlockTable) -> List[FrozenSet[int]]:
+        """Bottom-k MinHash signature of the normalized text of every page.
         
-        # Create empty page template
-        if images1:
-            width, height = images1[0].size
-        elif images2:
-            width, height = images2[0].size
-        else:
-            width, height = 800, 1000  # Default size
+        Each page's words are cut into overlapping shingles of PAGE_SHINGLE_SIZE
+        words; the signature keeps the PAGE_SIGNATURE_SIZE smallest shingle
+        hashes. Pages without text get an empty signature.
+        """
+        lines, rows = self.flatten_blocks(blocks)
+        page_words: List[List[str]] = [[] for _ in range(blocks.page_count)]
+        for line, row in zip(lines, rows):
+            page_words[blocks.page_nums[row]].extend(line.split())
+        
+        signatures = []
+        for words in page_words:
+            shingles = {zlib.crc32(" ".join(words[i:i + PAGE_SHINGLE_SIZE]).encode('utf-8'))
+                        for i in range(max(1, len(words) - PAGE_SHINGLE_SIZE + 1))} if words else set()
+            signatures.append(frozenset(sorted(shingles)[:PAGE_SIGNATURE_SIZE]))
+        return signatures
+    
+    def align_document_pages(self, blocks1: BlockTable, blocks2: BlockTable) -> List[Tuple[Optional[int], Optional[int]]]:
+        """Pair up the pages of both documents (see align_pages) and report what was found."""
+        pages = align_pages(self.page_signatures(blocks1), self.page_signatures(blocks2))
+        deleted = sum(1 for page1, page2 in pages if page2 is None)
+        inserted = sum(1 for page1, page2 in pages if page1 is None)
+        print(f"Aligned {blocks1.page_count} and {blocks2.page_count} page(s): "
+              f"{inserted} inserted, {deleted} deleted")
+        return pages
+    
+    def text_changed_pages(self, differences: Dict) -> Tuple[Set[int], Set[int]]:
+        """Pages of each document that contain at least one text change."""
+        pages1 = {block.page_num for block in differences['deletions']}
+        pages2 = {block.page_num for block in differences['insertions']}
+        for side, block in differences['modifications']:
+            (pages1 if side == 'old' else pages2).add(block.page_num)
+        return pages1, pages2
+    
+    def changed_pages(self, differences: Dict) -> Tuple[Set[int], Set[int]]:
+        """Pages of each document that contain at least one difference.
         
-        empty_image = Image.new('RGB', (width, height), 'white')
+        Pages that were inserted or deleted as a whole count as changed.
+        """
+        pages1, pages2 = self.text_changed_pages(differences)
+        for kind, page1, page2, bbox in differences.get('visual', []):
+            if kind != 'insertion':
+                pages1.add(page1)
+            if kind != 'deletion':
+                pages2.add(page2)
+        for page1, page2 in differences['pages']:
+            if page2 is None:
+                pages1.add(page1)
+            elif page1 is None:
+                pages2.add(page2)
+        return pages1, pages2
+    
+    def changed_rows(self, differences: Dict) -> List[int]:
+        """Indexes into differences['pages'] of the page pairs with a change on either side."""
+        pages1, pages2 = self.changed_pages(differences)
+        return [row for row, (page1, page2) in enumerate(differences['pages'])
+                if page1 in pages1 or page2 in pages2]
+    
+    def render_changed_pages(self, file1_path: str, file2_path: str, page_counts: Tuple[int, int],
+                             differences: Dict, extra_rows: Iterable[int] = ()) -> Tuple[List[Optional[Image.Image]], List[Optional[Image.Image]]]:
+        """Render only the page pairs with differences, plus extra_rows.
         
-        # Pad images1 if needed
-        while len(images1) < max_pages:
-            images1.append(empty_image.copy())
-            blocks1.append([])
+        Returns one entry per page for each document; pages that were not
+        rendered are None. Both pages of a changed pair are rendered so they
+        can be shown side by side.
+        """
+        rows = sorted(set(self.changed_rows(differences)).union(extra_rows))
+        print(f"Rendering {len(rows)} of {len(differences['pages'])} page pair(s) with changes...")
         
-        # Pad images2 if needed
-        while len(images2) < max_pages:
-            images2.append(empty_image.copy())
-            blocks2.append([])
+        return self.render_page_pairs(file1_path, file2_path, page_counts,
+                                      [differences['pages'][row] for row in rows])
+    
+    def render_page_pairs(self, file1_path: str, file2_path: str, page_counts: Tuple[int, int],
+                          pairs: List[Tuple[Optional[int], Optional[int]]]) -> Tuple[List[Optional[Image.Image]], List[Optional[Image.Image]]]:
+        """Render the pages of the given page pairs; see render_changed_pages."""
+        rendered1 = self.render_document_pages(file1_path, [page1 for page1, _ in pairs if page1 is not None])
+        rendered2 = self.render_document_pages(file2_path, [page2 for _, page2 in pairs if page2 is not None])
+        
+        images1: List[Optional[Image.Image]] = [rendered1.get(page_num) for page_num in range(page_counts[0])]
+        images2: List[Optional[Image.Image]] = [rendered2.get(page_num) for page_num in range(page_counts[1])]
+        return images1, images2
+    
+    def stream_page_images(self, file1_path: str, file2_path: str, differences: Dict,
+                           visual_rows: Iterable[int] = ()) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """Render, annotate, encode and save the report pages one page pair at a time.
+        
+        Only the current pair of page images is alive at any point, so peak
+        memory is bounded by a few pages whatever the document length. Pages
+        come from the artifact cache when present and are rendered from a
+        single open document otherwise. The page pairs of visual_rows are
+        pixel-diffed as they go by, adding their regions to differences.
+        Returns the <img> src of every page of each document; pages that were
+        not rendered ('changed' render mode) are None.
+        """
+        pages = differences['pages']
+        visual_rows = set(visual_rows)
+        text_changed = set(self.changed_rows(differences))
+        if self.render_mode == 'all':
+            rows = range(len(pages))
+        else:
+            rows = sorted(text_changed | visual_rows)
+        print(f"Streaming {len(rows)} of {len(pages)} page pair(s) through render, annotate and encode...")
+        
+        marks1, marks2 = self.collect_annotation_marks(differences)
+        
+        # The cached pages of each document, looked up once rather than per page
+        pages_dirs = [None, None]
+        if self.cache:
+            for side, file_path in enumerate((file1_path, file2_path)):
+                pages_dir = self.cache.pages_dir(self.file_hash(file_path), self.dpi, self.colorspace)
+                pages_dirs[side] = pages_dir if pages_dir.is_dir() else None
+        
+        pdf1_path, pdf2_path = self.convert_to_pdf(file1_path), self.convert_to_pdf(file2_path)
+        with self.metrics.stage('stream', pages=len(rows)), \
+                PdfDocument(pdf1_path, self.dpi, self.colorspace) as document1, \
+                PdfDocument(pdf2_path, self.dpi, self.colorspace) as document2:
+            sources1: List[Optional[str]] = [None] * len(document1)
+            sources2: List[Optional[str]] = [None] * len(document2)
+            
+            for done, row in enumerate(rows):
+                self.report_progress('annotate', done, len(rows))
+                page1, page2 = pages[row]
+                image1 = self._stream_page(pages_dirs[0], document1, page1)
+                image2 = self._stream_page(pages_dirs[1], document2, page2)
+                
+                if row in visual_rows:
+                    regions = self.add_visual_differences(differences, page1, page2, image1, image2)
+                    for style, bbox in regions:
+                        if style != 'insertion':
+                            marks1.setdefault(page1, []).append((style, bbox))
+                        if style != 'deletion':
+                            marks2.setdefault(page2, []).append((style, bbox))
+                    if not regions and row not in text_changed and self.render_mode == 'changed':
+                        continue  # Rendered only for the pixel diff, and unchanged
+                
+                if image1 is not None:
+                    sources1[page1] = self.save_page_image(
+                        self.draw_page_marks(image1, marks1.get(page1, [])), "original", page1)
+                if image2 is not None:
+                    sources2[page2] = self.save_page_image(
+                        self.draw_page_marks(image2, marks2.get(page2, [])), "modified", page2)
+        
+        return sources1, sources2
+    
+    def _stream_page(self, pages_dir: Optional[Path], document: PdfDocument,
+                     page_num: Optional[int]) -> Optional[Image.Image]:
+        """One page of a document for stream_page_images, or None for a missing page.
         
-        return images1, images2, blocks1, blocks2
+        pages_dir is the document's folder of cached pages, if it has one.
+        """
+        if page_num is None:
+            return None
+        if pages_dir is not None:
+            return ComparisonCache.load_page(ComparisonCache.page_path(pages_dir, page_num))
+        return document.render_page(page_num)
     
-    def calculate_word_positions(self, text: str, bbox: Tuple[float, float, float, float]) -> List[Tuple[float, float, float, float]]:
-        """Calculate approximate positions for each word in a text block."""
-        words = text.split()
-        if not words:
+    def visual_diff_rows(self, blocks1: BlockTable, blocks2: BlockTable, differences: Dict) -> List[int]:
+        """Page pairs (indexes into differences['pages']) to compare pixel by pixel, as set by the visual_diff mode.
+        
+        In 'auto' mode these are the pairs with no text on either page, such
+        as scans, which the text diff cannot see into. In 'on' mode these are
+        all pairs without text changes: on a pair with text changes the text
+        diff already reports them, and the text that moved around them would
+        show up as pixel differences too. A page without a counterpart is
+        compared against a blank page.
+        """
+        pages = differences['pages']
+        if self.visual_diff == 'off':
             return []
+        if self.visual_diff == 'on':
+            text_pages1, text_pages2 = self.text_changed_pages(differences)
+            rows = [row for row, (page1, page2) in enumerate(pages)
+                    if page1 not in text_pages1 and page2 not in text_pages2]
+        else:
+            rows = [row for row, (page1, page2) in enumerate(pages)
+                    if (page1 is None or not blocks1.page_rows(page1))
+                    and (page2 is None or not blocks2.page_rows(page2))]
+        
+        if rows and np is None:
+            if self.visual_diff == 'on':
+                raise ImportError("numpy is required for the visual diff. Install with: pip install numpy")
+            print(f"Skipping the visual diff of {len(rows)} page(s) without text: numpy is not installed")
+            return []
+        return rows
+    
+    def find_visual_differences(self, images1: List[Optional[Image.Image]], images2: List[Optional[Image.Image]],
+                                rows: List[int], differences: Dict):
+        """Pixel-diff the page pairs of the given rows and add their changed regions to differences."""
+        if not rows:
+            return
+        print(f"Comparing {len(rows)} page pair(s) pixel by pixel...")
+        with self.metrics.stage('visual_diff', pages=len(rows)):
+            for done, row in enumerate(rows):
+                self.report_progress('diff', done, len(rows))
+                page1, page2 = differences['pages'][row]
+                self.add_visual_differences(differences, page1, page2,
+                                            None if page1 is None else images1[page1],
+                                            None if page2 is None else images2[page2])
+    
+    def add_visual_differences(self, differences: Dict, page1: Optional[int], page2: Optional[int],
+                               image1: Optional[Image.Image], image2: Optional[Image.Image]) -> List[Tuple[str, Tuple]]:
+        """Pixel-diff one page pair and add its changed regions to differences['visual'].
         
-        x0, y0, x1, y1 = bbox
-        total_chars = len(text)
-        word_positions = []
-        
-        current_pos = 0
-        for word in words:
-            # Calculate word's relative position in the text
-            word_start_ratio = current_pos / total_chars if total_chars > 0 else 0
-            word_end_ratio = (current_pos + len(word)) / total_chars if total_chars > 0 else 0
-            
-            # Map to actual coordinates
-            word_x0 = x0 + (x1 - x0) * word_start_ratio
-            word_x1 = x0 + (x1 - x0) * word_end_ratio
-            
-            word_positions.append((word_x0, y0, word_x1, y1))
-            current_pos += len(word) + 1  # +1 for space
-        
-        return word_positions
-
+        Regions are kept apart from the text changes: they are marked and
+        listed like them but counted on their own. A missing page is compared
+        as blank. Returns the regions as (style, bbox in PDF points).
+        """
+        image1 = image1 or Image.new('L', image2.size, 255)
+        image2 = image2 or Image.new('L', image1.size, 255)
+        scale_factor = self.dpi / 72
+        regions = []
+        for kind, box in pixel_diff_regions(image1, image2):
+            bbox = tuple(coord / scale_factor for coord in box)
+            differences['visual'].append((kind, page1, page2, bbox))
+            regions.append((kind, bbox))
+        return regions
+    
     def annotate_images(self, images1: List[Image.Image], images2: List[Image.Image],
                        differences: Dict) -> Tuple[List[Image.Image], List[Image.Image]]:
         """Annotate images with colored boxes for differences, with word-level precision."""
         print("Annotating images with differences...")
+        self.report_progress('annotate')
         
-        annotated1 = [img.copy() for img in images1]
-        annotated2 = [img.copy() for img in images2]
+        with self.metrics.stage('annotate') as record:
+            marks1, marks2 = self.collect_annotation_marks(differences)
+            annotated1 = self.draw_annotation_marks(images1, marks1)
+            annotated2 = self.draw_annotation_marks(images2, marks2)
+            record['pages'] = len(marks1) + len(marks2)
+        return annotated1, annotated2
+    
+    def collect_annotation_marks(self, differences: Dict) -> Tuple[Dict[int, List[Tuple[str, Tuple]]], Dict[int, List[Tuple[str, Tuple]]]]:
+        """Collect the boxes to draw on each page of both documents.
         
-        # Scale factor from PDF points to image pixels
-        scale_factor = self.dpi / 72
+        Returns, per document, page number -> list of (style, bbox in PDF points),
+        where style is a key of ANNOTATION_STYLES.
+        """
+        marks1: Dict[int, List[Tuple[str, Tuple]]] = {}
+        marks2: Dict[int, List[Tuple[str, Tuple]]] = {}
         
-        # Track blocks that have word-level differences to avoid double-annotation
-        word_level_blocks = set(differences.get('word_level', {}).keys())
+        # Blocks with word-level differences are marked per word, not as a whole line
+        word_level = differences.get('word_level', {})
         
-        # Annotate deletions (light red background with dark red border for visibility)
+        # Deletions (red on first PDF)
         for block in differences['deletions']:
-            if block.page_num < len(annotated1) and block not in word_level_blocks:
-                img = annotated1[block.page_num]
-                draw = ImageDraw.Draw(img)
-                
-                # Scale bbox to image coordinates
-                x0 = block.x0 * scale_factor
-                y0 = block.y0 * scale_factor
-                x1 = block.x1 * scale_factor
-                y1 = block.y1 * scale_factor
-                
-                # Draw light red background to preserve text visibility
-                overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(255, 200, 200, 120))  # Light red
-                img.paste(overlay, (0, 0), overlay)
-                
-                # Draw dark red border
-                draw.rectangle([x0-2, y0-2, x1+2, y1+2], outline='darkred', width=3)
+            if block not in word_level:
+                marks1.setdefault(block.page_num, []).append(('deletion', block.bbox))
         
-        # Annotate insertions (green on second PDF)
+        # Insertions (green on second PDF)
         for block in differences['insertions']:
-            if block.page_num < len(annotated2) and block not in word_level_blocks:
-                img = annotated2[block.page_num]
-                draw = ImageDraw.Draw(img)
-                
-                # Scale bbox to image coordinates
-                x0 = block.x0 * scale_factor
-                y0 = block.y0 * scale_factor
-                x1 = block.x1 * scale_factor
-                y1 = block.y1 * scale_factor
-                
-                # Draw green box for insertions
-                draw.rectangle([x0-2, y0-2, x1+2, y1+2], outline='green', width=3)
-                overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(0, 255, 0, 80))
-                img.paste(overlay, (0, 0), overlay)
-        
-        # Annotate word-level modifications
-        for block, (change_type, word_diffs, text) in differences.get('word_level', {}).items():
-            if change_type == 'old' and block.page_num < len(annotated1):
-                img = annotated1[block.page_num]
-                self._annotate_word_level_changes(img, block, word_diffs, text, scale_factor, 'old')
-                
-            elif change_type == 'new' and block.page_num < len(annotated2):
-                img = annotated2[block.page_num]
-                self._annotate_word_level_changes(img, block, word_diffs, text, scale_factor, 'new')
+            if block not in word_level:
+                marks2.setdefault(block.page_num, []).append(('insertion', block.bbox))
         
-        # Annotate line-level modifications (orange on both PDFs) - only for non-word-level blocks
+        # Word-level modifications
+        for block, (change_type, word_diffs, text) in word_level.items():
+            marks = marks1 if change_type == 'old' else marks2
+            marks.setdefault(block.page_num, []).extend(
+                self._word_level_marks(block, word_diffs, text, change_type))
+        
+        # Line-level modifications (orange on both PDFs)
         for change_type, block in differences['modifications']:
-            if block in word_level_blocks:
+            if block in word_level:
                 continue  # Skip blocks that already have word-level annotations
-                
-            if change_type == 'old' and block.page_num < len(annotated1):
-                img = annotated1[block.page_num]
-                draw = ImageDraw.Draw(img)
-                
-                x0 = block.x0 * scale_factor
-                y0 = block.y0 * scale_factor
-                x1 = block.x1 * scale_factor
-                y1 = block.y1 * scale_factor
-                
-                draw.rectangle([x0-2, y0-2, x1+2, y1+2], outline='orange', width=3)
-                overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(255, 165, 0, 80))
-                img.paste(overlay, (0, 0), overlay)
-                
-            elif change_type == 'new' and block.page_num < len(annotated2):
-                img = annotated2[block.page_num]
-                draw = ImageDraw.Draw(img)
-                
-                x0 = block.x0 * scale_factor
-                y0 = block.y0 * scale_factor
-                x1 = block.x1 * scale_factor
-                y1 = block.y1 * scale_factor
-                
-                draw.rectangle([x0-2, y0-2, x1+2, y1+2], outline='orange', width=3)
-                overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(255, 165, 0, 80))
-                img.paste(overlay, (0, 0), overlay)
+            marks = marks1 if change_type == 'old' else marks2
+            marks.setdefault(block.page_num, []).append(('modification', block.bbox))
         
-        return annotated1, annotated2
+        # Pixel-diff regions, on the side(s) they changed
+        for kind, page1, page2, bbox in differences.get('visual', []):
+            if kind != 'insertion':
+                marks1.setdefault(page1, []).append((kind, bbox))
+            if kind != 'deletion':
+                marks2.setdefault(page2, []).append((kind, bbox))
+        
+        return marks1, marks2
     
-    def _annotate_word_level_changes(self, img: Image.Image, block: TextBlock, 
-                                   word_diffs: Dict, text: str, scale_factor: float, 
-                                   change_type: str):
-        """Annotate individual words within a text block."""
-        words = text.split()
-        word_positions = self.calculate_word_positions(text, block.bbox)
-        
-        draw = ImageDraw.Draw(img)
-        overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
-        
-        for word_idx, (word_x0, word_y0, word_x1, word_y1) in enumerate(word_positions):
-            # Scale to image coordinates
-            x0 = word_x0 * scale_factor
-            y0 = word_y0 * scale_factor
-            x1 = word_x1 * scale_factor
-            y1 = word_y1 * scale_factor
-            
-            # Check if this word has changes
-            is_deleted = word_idx in word_diffs.get('deletions', [])
-            is_inserted = word_idx in word_diffs.get('insertions', [])
-            is_modified = any(item[1] == word_idx for item in word_diffs.get('modifications', []) 
-                            if item[0] == change_type)
-            
-            if is_deleted:
-                # Light red background for deletions to preserve visibility
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(255, 200, 200, 150))
-                draw.rectangle([x0-1, y0-1, x1+1, y1+1], outline='darkred', width=2)
-                
-            elif is_inserted:
-                # Green for insertions
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(200, 255, 200, 120))
-                draw.rectangle([x0-1, y0-1, x1+1, y1+1], outline='green', width=2)
-                
-            elif is_modified:
-                # Orange for modifications
-                overlay_draw.rectangle([x0, y0, x1, y1], fill=(255, 220, 180, 120))
-                draw.rectangle([x0-1, y0-1, x1+1, y1+1], outline='orange', width=2)
+    def draw_annotation_marks(self, images: List[Optional[Image.Image]],
+                              marks: Dict[int, List[Tuple[str, Tuple]]]) -> List[Optional[Image.Image]]:
+        """Draw collected marks onto copies of the page images that have any.
+        
+        Boxes of the same style that overlap or touch are merged first. Fills are
+        alpha-blended straight into the page (cost proportional to the box area,
+        not the page area), then all borders are drawn on top in one pass.
+        Pages without marks are returned as-is.
+        """
+        annotated = list(images)
+        
+        for page_num, page_marks in marks.items():
+            if page_num >= len(annotated) or annotated[page_num] is None:
+                continue
+            annotated[page_num] = self.draw_page_marks(annotated[page_num].copy(), page_marks)
         
-        img.paste(overlay, (0, 0), overlay)
+        return annotated
     
-    def save_images_to_base64(self, images: List[Image.Image], prefix: str) -> List[str]:
-        """Save images and return base64 encoded strings for HTML embedding."""
-        base64_images = []
+    def draw_page_marks(self, img: Image.Image, page_marks: List[Tuple[str, Tuple]]) -> Image.Image:
+        """Draw the marks of one page onto its image, in place, and return it.
         
-        for i, img in enumerate(images):
-            # Save to comparison directory
-            img_path = self.comparison_dir / f"{prefix}_page_{i+1}.png"
-            img.save(img_path)
-            
-            # Convert to base64 for HTML embedding
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_data = base64.b64encode(buffer.getvalue()).decode()
-            base64_images.append(img_data)
+        Grayscale pages with marks are converted to RGB first so the
+        highlights keep their colors.
+        """
+        if not page_marks:
+            return img
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Scale factor from PDF points to image pixels
+        scale_factor = self.dpi / 72
+        gap = ANNOTATION_MERGE_GAP * scale_factor
+        
+        rects_by_style: Dict[str, List[List[float]]] = {}
+        for style, bbox in page_marks:
+            rects_by_style.setdefault(style, []).append([coord * scale_factor for coord in bbox])
+        
+        draw = ImageDraw.Draw(img, 'RGBA')
+        merged = [(style, rect) for style, rects in rects_by_style.items()
+                  for rect in merge_rectangles(rects, gap)]
         
-        return base64_images
+        for style, (x0, y0, x1, y1) in merged:
+            draw.rectangle([x0, y0, x1, y1], fill=ANNOTATION_STYLES[style][0])
+        for style, (x0, y0, x1, y1) in merged:
+            _, outline, width, pad = ANNOTATION_STYLES[style]
+            draw.rectangle([x0-pad, y0-pad, x1+pad, y1+pad], outline=outline, width=width)
+        
+        return img
     
-    def generate_html_report(self, pdf1_path: str, pdf2_path: str,
-                           images1_b64: List[str], images2_b64: List[str],
-                           differences: Dict) -> str:
-        """Generate HTML report with side-by-side comparison."""
+    def _word_level_marks(self, block: TextBlock, word_diffs: Dict, text: str,
+                          change_type: str) -> List[Tuple[str, Tuple]]:
+        """Marks for the individual changed words within a text block.
         
-        total_deletions = len(differences['deletions'])
-        total_insertions = len(differences['insertions'])
-        total_modifications = len([x for x in differences['modifications'] if x[0] == 'old'])
-        total_changes = total_deletions + total_insertions + total_modifications
+        Word indices refer to text.split(), which lines up with the word boxes
+        stored at extraction (normalization only collapses whitespace).
+        """
+        side = word_diffs[change_type]  # Index sets for this block's side
+        marks = []
         
-        html_content = f"""
+        for word_idx, word_bbox in enumerate(block.word_bboxes):
+            # Check if this word has changes
+            if word_idx in side.get('deletions', ()):
+                marks.append(('word_deletion', word_bbox))
+            elif word_idx in side.get('insertions', ()):
+                marks.append(('word_insertion', word_bbox))
+            elif word_idx in side['modifications']:
+                marks.append(('word_modification', word_bbox))
+        
+        return marks
+    
+    def encode_image(self, img: Image.Image) -> bytes:
+        """Encode a page image once in the configured output format."""
+        fmt, options = IMAGE_FORMATS[self.image_format]
+        if fmt == 'JPEG' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, **options)
+        return buffer.getvalue()
+    
+    def save_page_images(self, images: List[Optional[Image.Image]], prefix: str) -> List[Optional[str]]:
+        """Encode each page once and return its <img> src.
+        
+        By default pages are saved as separate files next to the report (and
+        lazy-loaded by the browser); with embed_images they are only inlined
+        as data URIs, and no files are written. None entries (pages not
+        rendered) stay None.
+        """
+        with self.metrics.stage('encode', document=prefix) as record:
+            sources = [None if img is None else self.save_page_image(img, prefix, i)
+                       for i, img in enumerate(images)]
+            record['pages'] = sum(src is not None for src in sources)
+        return sources
+    
+    def save_page_image(self, img: Image.Image, prefix: str, page_num: int) -> str:
+        """Encode one page and return its <img> src: a data URI with embed_images, else a saved file."""
+        img_data = self.encode_image(img)
+        if self.embed_images:
+            mime_type = f"image/{IMAGE_FORMATS[self.image_format][0].lower()}"
+            return f"data:{mime_type};base64,{base64.b64encode(img_data).decode()}"
+        
+        # Save to comparison directory
+        img_name = f"{prefix}_page_{page_num+1}.{self.image_format}"
+        with open(self.comparison_dir / img_name, 'wb') as f:
+            f.write(img_data)
+        return img_name
+    
+    def differences_to_json(self, file1_path: str, file2_path: str, differences: Dict,
+                            images1_src: Optional[List[Optional[str]]] = None,
+                            images2_src: Optional[List[Optional[str]]] = None) -> Dict:
+        """Structured form of the differences, written as DIFF_NAME next to the report.
+        
+        Changes are listed per aligned page pair. Page numbers are 1-based and
+        null for the missing side of an inserted or deleted page. Boxes are
+        [x0, y0, x1, y1] in PDF points; multiply by dpi / 72 for page image
+        pixels. Changes with an empty text are pixel-diff regions. Changed
+        lines that were diffed word by word list their changed words in
+        'words'. 'image' is the page image file when one was written.
+        """
+        word_level = differences.get('word_level', {})
+        
+        def bbox_json(bbox):
+            return [round(coord, 2) for coord in bbox]
+        
+        def change_json(change_type, side, block):
+            change = {'type': change_type, 'side': side, 'bbox': bbox_json(block.bbox), 'text': block.text}
+            if block in word_level:
+                block_side, word_diffs, _ = word_level[block]
+                words = block.text.split()  # Lines up with the word boxes, see _word_level_marks
+                change['words'] = [
+                    {'type': word_type.rstrip('s'), 'index': word_idx, 'text': words[word_idx],
+                     'bbox': bbox_json(block.word_bboxes[word_idx])}
+                    for word_type, indices in sorted(word_diffs[block_side].items())
+                    for word_idx in sorted(indices)
+                ]
+            return change
+        
+        # Changes of each page of either document, by (side, page number)
+        page_changes: Dict[Tuple[str, int], List[Dict]] = {}
+        for block in differences['deletions']:
+            page_changes.setdefault(('original', block.page_num), []).append(
+                change_json('deletion', 'original', block))
+        for block in differences['insertions']:
+            page_changes.setdefault(('modified', block.page_num), []).append(
+                change_json('insertion', 'modified', block))
+        for change_side, block in differences['modifications']:
+            side = 'original' if change_side == 'old' else 'modified'
+            page_changes.setdefault((side, block.page_num), []).append(
+                change_json('modification', side, block))
+        for kind, page1, page2, bbox in differences.get('visual', []):
+            if kind != 'insertion':
+                page_changes.setdefault(('original', page1), []).append(
+                    change_json(kind, 'original', TextBlock('', bbox, page1)))
+            if kind != 'deletion':
+                page_changes.setdefault(('modified', page2), []).append(
+                    change_json(kind, 'modified', TextBlock('', bbox, page2)))
+        
+        pages = []
+        for page1, page2 in differences['pages']:
+            changes = page_changes.get(('original', page1), []) + page_changes.get(('modified', page2), [])
+            if page2 is None:
+                status = 'deleted'
+            elif page1 is None:
+                status = 'inserted'
+            else:
+                status = 'changed' if changes else 'unchanged'
+            pages.append({
+                'original': None if page1 is None else page1 + 1,
+                'modified': None if page2 is None else page2 + 1,
+                'status': status,
+                'original_image': images1_src[page1] if images1_src and page1 is not None else None,
+                'modified_image': images2_src[page2] if images2_src and page2 is not None else None,
+                'changes': changes,
+            })
+        
+        return {
+            'original': os.path.basename(file1_path),
+            'modified': os.path.basename(file2_path),
+            'dpi': self.dpi,
+            'summary': self.count_differences(differences),
+            'pages': pages,
+        }
+    
+    def count_differences(self, differences: Dict) -> Dict[str, int]:
+        """Count deletions, insertions and modifications, and whole pages deleted and inserted.
+        
+        Deletions, insertions and modifications count text changes only;
+        pixel-diff regions are counted as 'visual' (and in the total).
+        """
+        deletions = len(differences['deletions'])
+        insertions = len(differences['insertions'])
+        modifications = len([x for x in differences['modifications'] if x[0] == 'old'])
+        visual = len(differences.get('visual', []))
+        pages = differences.get('pages', [])
+        return {
+            'total': deletions + insertions + modifications + visual,
+            'deletions': deletions,
+            'insertions': insertions,
+            'modifications': modifications,
+            'visual': visual,
+            'pages_deleted': sum(1 for page1, page2 in pages if page2 is None),
+            'pages_inserted': sum(1 for page1, page2 in pages if page1 is None),
+        }
+    
+    def page_pair_label(self, page1: Optional[int], page2: Optional[int]) -> str:
+        """Report heading of an aligned page pair, e.g. 'Page 4', 'Page 4 &rarr; Page 5' or 'Page 4 deleted'."""
+        if page2 is None:
+            return f"Page {page1 + 1} deleted"
+        if page1 is None:
+            return f"Page {page2 + 1} inserted"
+        if page1 == page2:
+            return f"Page {page1 + 1}"
+        return f"Page {page1 + 1} &rarr; Page {page2 + 1}"
+    
+    def page_range_label(self, pairs: List[Tuple[Optional[int], Optional[int]]]) -> str:
+        """Label of a run of unchanged page pairs, e.g. 'Pages 6&ndash;8 (now 7&ndash;9)'."""
+        def page_range(page_nums):
+            page_nums = [page_num + 1 for page_num in page_nums if page_num is not None]
+            if len(page_nums) == 1:
+                return str(page_nums[0])
+            return f"{page_nums[0]}&ndash;{page_nums[-1]}" if page_nums else ""
+        
+        original = page_range([page1 for page1, _ in pairs])
+        modified = page_range([page2 for _, page2 in pairs])
+        label = f"Page{'s' if len(pairs) > 1 else ''} {original or modified}"
+        return label if modified in (original, '') else f"{label} (now {modified})"
+    
+    def page_side_html(self, images_src: List[Optional[str]], page_num: Optional[int], label: str) -> str:
+        """<img> of one side of a page pair, or a placeholder where the page does not exist."""
+        if page_num is None:
+            return f'<div class="page-missing">No matching page in the {label.lower()} document</div>'
+        return (f'<img src="{images_src[page_num]}" loading="lazy" decoding="async"\n'
+                f'                             alt="{label} Page {page_num + 1}" class="page-image">')
+    
+    def report_header_html(self, file1_path: str, file2_path: str, counts: Dict[str, int]) -> str:
+        """Opening part of a report: styles, file names, legend and summary counts."""
+        total_deletions = counts['deletions']
+        total_insertions = counts['insertions']
+        total_modifications = counts['modifications']
+        total_changes = counts['total']
+        # Pixel-diff regions get their own card, only when there are any
+        visual_stat = f"""
+                    <div class="stat-item">
+                        <div class="stat-number">{counts['visual']}</div>
+                        <div class="stat-label">Visual Changes</div>
+                    </div>""" if counts.get('visual') else ''
+        
+        return f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -836,6 +2776,58 @@ class DocumentComparator:
             transform: scale(1.02);
         }}
         
+        .unchanged-pages {{
+            background: #f8fafc;
+            border: 1px dashed #cbd5e1;
+            border-radius: 12px;
+            padding: 16px 24px;
+            text-align: center;
+            font-size: 0.875rem;
+            color: #64748b;
+        }}
+        
+        .change-table {{
+            width: 100%;
+            border-collapse: collapse;
+            font-size: 0.875rem;
+        }}
+        
+        .change-table th, .change-table td {{
+            padding: 10px 16px;
+            border-bottom: 1px solid #e2e8f0;
+            text-align: left;
+            vertical-align: top;
+            width: 42%;
+        }}
+        
+        .change-table th {{
+            color: #64748b;
+            font-size: 0.75rem;
+            text-transform: uppercase;
+            letter-spacing: 0.05em;
+        }}
+        
+        .change-table .change-location, .change-table th:first-child {{
+            width: 16%;
+            color: #64748b;
+            white-space: nowrap;
+        }}
+        
+        .change-deletion td {{ background: #fef2f2; }}
+        .change-insertion td {{ background: #f0fdf4; }}
+        .change-modification td {{ background: #fffbeb; }}
+        .word-deletion {{ background: #fecaca; text-decoration: line-through; }}
+        .word-insertion {{ background: #bbf7d0; }}
+        .word-modification {{ background: #fed7aa; }}
+        
+        .page-missing {{
+            border: 1px dashed #cbd5e1;
+            border-radius: 8px;
+            padding: 48px 16px;
+            font-size: 0.875rem;
+            color: #64748b;
+        }}
+        
         .navigation {{
             position: fixed;
             top: 50%;
@@ -939,11 +2931,11 @@ class DocumentComparator:
             <div class="file-info">
                 <div class="file-card">
                     <h4>Original Document</h4>
-                    <p>{html.escape(os.path.basename(pdf1_path))}</p>
+                    <p>{html.escape(os.path.basename(file1_path))}</p>
                 </div>
                 <div class="file-card">
                     <h4>Modified Document</h4>
-                    <p>{html.escape(os.path.basename(pdf2_path))}</p>
+                    <p>{html.escape(os.path.basename(file2_path))}</p>
                 </div>
             </div>
             
@@ -980,48 +2972,27 @@ class DocumentComparator:
                     <div class="stat-item">
                         <div class="stat-number">{total_modifications}</div>
                         <div class="stat-label">Modifications</div>
-                    </div>
+                    </div>{visual_stat}
                 </div>
             </div>
         </div>
         
         <div class="comparison-section">
 """
-        
-        # Add page-by-page comparisons
-        for page_num in range(len(images1_b64)):
-            html_content += f"""
-            <div class="page-container" id="page-{page_num + 1}">
-                <div class="page-header">
-                    Page {page_num + 1}
-                </div>
-                <div class="page-comparison">
-                    <div class="page-side">
-                        <h4>Original</h4>
-                        <img src="data:image/png;base64,{images1_b64[page_num]}" 
-                             alt="Original Page {page_num + 1}" class="page-image">
-                    </div>
-                    <div class="page-side">
-                        <h4>Modified</h4>
-                        <img src="data:image/png;base64,{images2_b64[page_num]}" 
-                             alt="Modified Page {page_num + 1}" class="page-image">
-                    </div>
-                </div>
-            </div>
-            """
-        
-        # Add navigation
-        html_content += """
+    
+    def report_footer_html(self, nav_title: str, nav_items: List[Tuple[str, str]]) -> str:
+        """Closing part of a report: the navigation panel with (anchor id, label) links."""
+        html_content = f"""
         </div>
     </div>
     
     <div class="navigation">
-        <h4>Pages</h4>
+        <h4>{nav_title}</h4>
 """
         
-        for page_num in range(len(images1_b64)):
+        for anchor, label in nav_items:
             html_content += f"""
-        <a href="#page-{page_num + 1}" class="nav-item">Page {page_num + 1}</a>
+        <a href="#{anchor}" class="nav-item">{label}</a>
 """
         
         html_content += """
@@ -1048,57 +3019,928 @@ class DocumentComparator:
         
         return html_content
     
+    def generate_html_report(self, pdf1_path: str, pdf2_path: str,
+                           images1_src: List[Optional[str]], images2_src: List[Optional[str]],
+                           differences: Dict) -> str:
+        """Generate HTML report with side-by-side comparison."""
+        html_content = self.report_header_html(pdf1_path, pdf2_path, self.count_differences(differences))
+        
+        # Add page-by-page comparisons of the aligned page pairs; runs of pairs
+        # that were not rendered (unchanged pages in 'changed' render mode)
+        # collapse into one line
+        pages = differences['pages']
+        rendered_rows = [row for row, (page1, page2) in enumerate(pages)
+                         if (page1 is not None and images1_src[page1] is not None)
+                         or (page2 is not None and images2_src[page2] is not None)]
+        rendered_set = set(rendered_rows)
+        unchanged_start = None
+        for row in range(len(pages) + 1):
+            rendered = row in rendered_set
+            if not rendered and row < len(pages):
+                if unchanged_start is None:
+                    unchanged_start = row
+                continue
+            if unchanged_start is not None:
+                count = row - unchanged_start
+                pages_label = self.page_range_label(pages[unchanged_start:row])
+                html_content += f"""
+            <div class="unchanged-pages">
+                {pages_label}: {count} unchanged page{'s' if count != 1 else ''}
+            </div>
+            """
+                unchanged_start = None
+            if not rendered:
+                continue
+            
+            page1, page2 = pages[row]
+            html_content += f"""
+            <div class="page-container" id="page-{row + 1}">
+                <div class="page-header">
+                    {self.page_pair_label(page1, page2)}
+                </div>
+                <div class="page-comparison">
+                    <div class="page-side">
+                        <h4>Original</h4>
+                        {self.page_side_html(images1_src, page1, "Original")}
+                    </div>
+                    <div class="page-side">
+                        <h4>Modified</h4>
+                        {self.page_side_html(images2_src, page2, "Modified")}
+                    </div>
+                </div>
+            </div>
+            """
+        
+        html_content += self.report_footer_html(
+            'Pages', [(f"page-{row + 1}", self.page_pair_label(*pages[row])) for row in rendered_rows])
+        
+        return html_content
+    
     def compare_pdfs(self, file1_path: str, file2_path: str):
-        """Main comparison method for documents (PDF, DOCX, XLSX, PPTX)."""
+        """Main comparison method for documents (PDF, DOCX, XLSX, PPTX).
+        
+        Returns the path of the HTML report, or of the JSON differences when
+        only those are written (see report_path and diff_path).
+        """
         print("Starting document comparison...")
+        self.cache_hit = False
+        self.metrics = StageMetrics()
+        
+        try:
+            self._compare_or_reuse(file1_path, file2_path)
+        finally:
+            if self.cache:
+                # Cache entries used by this comparison may be evicted again
+                self.cache.release()
+        
+        self.report_path = self.comparison_dir / REPORT_NAME if self.output_format != 'json' else None
+        self.diff_path = self.comparison_dir / DIFF_NAME if self.output_format != 'html' else None
+        if self.cache:
+            # Most recently used again now that the caller is about to serve it
+            self.cache.touch(self.comparison_dir)
+        self.metrics.finish()
         
-        # Step 1: Convert documents to PDF if needed
-        pdf1_path = self.convert_to_pdf(file1_path)
-        pdf2_path = self.convert_to_pdf(file2_path)
+        print(f"\n{'='*60}")
+        print("DOCUMENT COMPARISON COMPLETE")
+        print(f"{'='*60}")
+        print(f"Comparison folder: {self.comparison_dir}")
+        if self.report_path:
+            print(f"Report saved: {self.report_path}")
+        if self.diff_path:
+            print(f"Differences saved: {self.diff_path}")
+        print(f"Total changes found: {self.summary['total']}")
+        print(f"  - Deletions: {self.summary['deletions']}")
+        print(f"  - Insertions: {self.summary['insertions']}")
+        print(f"  - Modifications: {self.summary['modifications']}")
+        if self.summary.get('visual'):
+            print(f"  - Visual changes: {self.summary['visual']}")
+        print(f"Completed in {self.metrics.total['wall_s']:.2f} s "
+              f"({self.metrics.total['cpu_s']:.2f} s CPU, peak RSS {self.metrics.total['peak_rss_mb']} MB)")
+        print(f"{'='*60}")
         
-        # Step 2: Convert PDFs to images
-        images1 = self.pdf_to_images(pdf1_path)
-        images2 = self.pdf_to_images(pdf2_path)
+        return str(self.report_path or self.diff_path)
+    
+    def output_names(self) -> List[str]:
+        """Names of the files a comparison writes to its folder for the output format."""
+        names = [SUMMARY_NAME]
+        if self.output_format != 'json':
+            names.append(REPORT_NAME)
+        if self.output_format != 'html':
+            names.append(DIFF_NAME)
+        return names
+    
+    def _compare_or_reuse(self, file1_path: str, file2_path: str):
+        """Set self.comparison_dir and self.summary, from the cache or by comparing the documents."""
+        # Step 0: Reuse the cached report if these exact inputs were compared before
+        cache_key = None
+        if self.cache:
+            with self.metrics.stage('lookup'):
+                names = (os.path.basename(file1_path), os.path.basename(file2_path))
+                cache_key = self.cache.result_key(
+                    self.file_hash(file1_path), self.file_hash(file2_path), self.comparison_options(), names)
+                entry = self.cache.lookup_result(cache_key, self.output_names())
+            if entry:
+                print(f"Found cached comparison: {entry.name}")
+                self.cache_hit = True
+                self.comparison_dir = entry
+                with open(entry / SUMMARY_NAME, 'r', encoding='utf-8') as f:
+                    self.summary = json.load(f)
+        
+        if not self.cache_hit:
+            self._create_comparison_dir()
+            try:
+                differences = self._run_comparison(file1_path, file2_path)
+            except Exception:
+                if self.cache:
+                    shutil.rmtree(self.comparison_dir, ignore_errors=True)
+                raise
+            
+            self.summary = self.count_differences(differences)
+            with open(self.comparison_dir / SUMMARY_NAME, 'w', encoding='utf-8') as f:
+                json.dump(self.summary, f)
+            
+            if self.cache:
+                # Intermediate conversions are not needed once the report exists
+                shutil.rmtree(self.temp_conversion_dir, ignore_errors=True)
+                self.comparison_dir = self.cache.store_result(cache_key, self.comparison_dir)
+    
+    def _run_comparison(self, file1_path: str, file2_path: str) -> Dict:
+        """Run the full comparison pipeline into self.comparison_dir and return the differences."""
+        file_type = self.structural_file_type(file1_path, file2_path)
+        if file_type:
+            return self._run_structural_comparison(file1_path, file2_path, file_type)
+        
+        # In 'changed' mode pages are only rendered after the diff, for pages with changes;
+        # in streaming mode all rendering happens after the diff, one page at a time.
+        # JSON-only output renders nothing but the pages compared as images.
+        write_html = self.output_format != 'json'
+        render_all = write_html and self.render_mode == 'all' and not self.streaming
+        
+        # Steps 1-3: Convert to PDF, render pages and extract text blocks
+        # (reusing cached artifacts of documents seen in earlier comparisons)
+        if self.pipeline and self.pool_workers() >= 2:
+            (images1, blocks1), (images2, blocks2) = self.load_documents_concurrently(
+                [file1_path, file2_path], render=render_all)
+        else:
+            images1, blocks1 = self.load_document(file1_path, render=render_all)
+            images2, blocks2 = self.load_document(file2_path, render=render_all)
+        
+        # Step 4: Pair up the pages of both documents, so inserted and deleted
+        # pages do not shift every later page out of place
+        with self.metrics.stage('align', pages=blocks1.page_count + blocks2.page_count):
+            pages = self.align_document_pages(blocks1, blocks2)
+        
+        # Step 5: Find text differences, and pixel differences on pages without text
+        with self.metrics.stage('diff', blocks=len(blocks1) + len(blocks2)) as record:
+            differences = self.find_text_differences(blocks1, blocks2, pages)
+            record['changed_blocks'] = sum(len(differences[kind]) for kind in ('deletions', 'insertions', 'modifications'))
+        differences['pages'] = pages
+        visual_rows = self.visual_diff_rows(blocks1, blocks2, differences)
+        if render_all:
+            self.find_visual_differences(images1, images2, visual_rows, differences)
+        elif not write_html:
+            page_counts = (blocks1.page_count, blocks2.page_count)
+            images1, images2 = self.render_page_pairs(
+                file1_path, file2_path, page_counts, [pages[row] for row in visual_rows])
+            self.find_visual_differences(images1, images2, visual_rows, differences)
+        elif not self.streaming:
+            # Render only the page pairs the differences touch (and the pairs
+            # without text, which can only be compared as images)
+            page_counts = (blocks1.page_count, blocks2.page_count)
+            images1, images2 = self.render_changed_pages(
+                file1_path, file2_path, page_counts, differences, visual_rows)
+            self.find_visual_differences(images1, images2, visual_rows, differences)
+            changed = set(self.changed_rows(differences))
+            for row in visual_rows:
+                if row not in changed:
+                    page1, page2 = pages[row]
+                    if page1 is not None:
+                        images1[page1] = None
+                    if page2 is not None:
+                        images2[page2] = None
+        
+        images1_src = images2_src = None
+        if write_html:
+            if self.streaming:
+                # Steps 6-7: Render, annotate, encode and save page by page
+                images1_src, images2_src = self.stream_page_images(
+                    file1_path, file2_path, differences, visual_rows)
+            else:
+                # Step 6: Annotate images with differences
+                annotated1, annotated2 = self.annotate_images(images1, images2, differences)
+                
+                # Step 7: Encode and save page images for HTML
+                self.report_progress('report')
+                images1_src = self.save_page_images(annotated1, "original")
+                images2_src = self.save_page_images(annotated2, "modified")
+            
+            # Step 8: Generate and save the HTML report
+            self.report_progress('report')
+            with self.metrics.stage('report'):
+                html_content = self.generate_html_report(
+                    file1_path, file2_path, images1_src, images2_src, differences)
+                with open(self.comparison_dir / REPORT_NAME, 'w', encoding='utf-8') as f:
+                    f.write(html_content)
+        
+        # Step 9: Save the differences as JSON (with links to the page images,
+        # unless those are embedded in the report)
+        if self.output_format != 'html':
+            self.report_progress('report')
+            linked = not self.embed_images
+            with self.metrics.stage('json'):
+                diff_json = self.differences_to_json(
+                    file1_path, file2_path, differences,
+                    images1_src if linked else None, images2_src if linked else None)
+                with open(self.comparison_dir / DIFF_NAME, 'w', encoding='utf-8') as f:
+                    json.dump(diff_json, f, separators=(',', ':'))
         
-        # Step 3: Extract text blocks with positions
-        blocks1 = self.extract_text_blocks(pdf1_path)
-        blocks2 = self.extract_text_blocks(pdf2_path)
+        return differences
+    
+    def structural_file_type(self, file1_path: str, file2_path: str) -> Optional[str]:
+        """Office type both files share when they are compared structurally, else None."""
+        if self.office_mode != 'structural':
+            return None
+        file_type = self.get_file_type(file1_path)
+        if file_type in OFFICE_FILE_TYPES and self.get_file_type(file2_path) == file_type:
+            return file_type
+        return None
+    
+    def _run_structural_comparison(self, file1_path: str, file2_path: str, file_type: str) -> Dict:
+        """Compare two Office files item by item and write the report without rendering pages."""
+        print(f"Comparing {file_type.upper()} structure (no PDF conversion)...")
+        read_items = {'docx': docx_items, 'pptx': pptx_items, 'xlsx': read_xlsx_sheets}[file_type]
+        items = []
+        for done, file_path in enumerate((file1_path, file2_path)):
+            self.report_progress('extract', done, 2)
+            with self.metrics.stage('extract', document=Path(file_path).name) as record:
+                items.append(read_items(file_path))
+                record['items'] = sum(map(len, items[-1])) if file_type == 'xlsx' else len(items[-1])
+        self.report_progress('diff')
+        with self.metrics.stage('diff') as record:
+            if file_type == 'xlsx':
+                differences = self.diff_xlsx_sheets(*items)
+            else:
+                differences = self.diff_office_items(*items)
+            record['changes'] = len(differences['changes'])
+        
+        self.report_progress('report')
+        if self.output_format != 'json':
+            with self.metrics.stage('report'), \
+                    open(self.comparison_dir / REPORT_NAME, 'w', encoding='utf-8') as f:
+                f.write(self.generate_structural_report(file1_path, file2_path, differences))
+        if self.output_format != 'html':
+            with self.metrics.stage('json'), \
+                    open(self.comparison_dir / DIFF_NAME, 'w', encoding='utf-8') as f:
+                json.dump(self.structural_differences_to_json(file1_path, file2_path, differences), f,
+                          separators=(',', ':'))
+        return differences
+    
+    def _structural_differences(self) -> Dict:
+        """Empty differences dict of a structural comparison.
         
-        # Step 4: Pad shorter PDF with empty pages
-        images1, images2, blocks1, blocks2 = self.pad_images_and_blocks(
-            images1, images2, blocks1, blocks2)
+        'changes' lists (type, old item, new item) in document order, with
+        None for the missing side; the other lists are as in find_text_differences.
+        """
+        return {'deletions': [], 'insertions': [], 'modifications': [], 'word_level': {}, 'visual': [],
+                'pages': [], 'changes': []}
+    
+    def _add_structural_change(self, differences: Dict, old: Optional[OfficeItem], new: Optional[OfficeItem]):
+        """Record one deleted, inserted or modified item (with word-level detail)."""
+        if new is None:
+            differences['deletions'].append(old)
+            differences['changes'].append(('deletion', old, None))
+        elif old is None:
+            differences['insertions'].append(new)
+            differences['changes'].append(('insertion', None, new))
+        else:
+            old_text = self.normalize_text_for_comparison(old.text)
+            new_text = self.normalize_text_for_comparison(new.text)
+            word_diffs = self.find_word_level_differences(old_text, new_text)
+            differences['word_level'][old] = ('old', word_diffs, old_text)
+            differences['word_level'][new] = ('new', word_diffs, new_text)
+            differences['modifications'].append(('old', old))
+            differences['modifications'].append(('new', new))
+            differences['changes'].append(('modification', old, new))
+    
+    def diff_office_items(self, items1: List[OfficeItem], items2: List[OfficeItem]) -> Dict:
+        """Align two sequences of paragraphs or shapes on their normalized text.
         
-        # Step 5: Find text differences
-        differences = self.find_text_differences(blocks1, blocks2)
+        Replaced runs are paired item by item as modifications (with a word
+        diff); what is left over on either side is deleted or inserted.
+        """
+        differences = self._structural_differences()
+        lines1 = [self.normalize_text_for_comparison(item.text) for item in items1]
+        lines2 = [self.normalize_text_for_comparison(item.text) for item in items2]
+        
+        for tag, i1, i2, j1, j2 in diff_opcodes(lines1, lines2, self.diff_engine):
+            if tag == 'equal':
+                continue
+            paired = min(i2 - i1, j2 - j1)
+            for offset in range(paired):
+                self._add_structural_change(differences, items1[i1 + offset], items2[j1 + offset])
+            for i in range(i1 + paired, i2):
+                self._add_structural_change(differences, items1[i], None)
+            for j in range(j1 + paired, j2):
+                self._add_structural_change(differences, None, items2[j])
+        return differences
+    
+    def diff_xlsx_sheets(self, sheets1: List[SheetTable], sheets2: List[SheetTable]) -> Dict:
+        """Compare two workbooks sheet by sheet (matched by name), see diff_sheet.
         
-        # Step 6: Annotate images with differences
-        annotated1, annotated2 = self.annotate_images(images1, images2, differences)
+        Sheets with equal digests are skipped outright. The rows of a sheet
+        that exists on one side only are all reported as removed or added.
+        """
+        differences = self._structural_differences()
+        sheets2_by_name = {sheet.name: sheet for sheet in sheets2}
+        names1 = {sheet.name for sheet in sheets1}
+        pairs = [(sheet, sheets2_by_name.get(sheet.name)) for sheet in sheets1]
+        pairs += [(None, sheet) for sheet in sheets2 if sheet.name not in names1]
+        
+        unchanged = 0
+        for sheet1, sheet2 in pairs:
+            if sheet1 is not None and sheet2 is not None:
+                if sheet1.digest == sheet2.digest:
+                    unchanged += 1
+                else:
+                    self.diff_sheet(differences, sheet1, sheet2)
+            elif sheet1 is not None:
+                for index in range(len(sheet1)):
+                    self._add_structural_change(differences, self._sheet_row_item(sheet1, index), None)
+            else:
+                for index in range(len(sheet2)):
+                    self._add_structural_change(differences, None, self._sheet_row_item(sheet2, index))
+        
+        print(f"Skipped {unchanged} of {len(pairs)} sheet(s) with identical content")
+        return differences
+    
+    def diff_sheet(self, differences: Dict, sheet1: SheetTable, sheet2: SheetTable):
+        """Cell-level diff of two versions of a sheet.
+        
+        Columns are aligned on the header (first) row, so added and removed
+        columns are reported once instead of as a change in every row. Rows
+        are aligned on the sheet_key column when set, or on their hashes
+        (see align_sheet_rows). Aligned rows whose content differs are then
+        compared cell by cell over the common columns. Reordering rows is not
+        a difference: rows that only moved are not reported.
+        """
+        from openpyxl.utils import get_column_letter
+        
+        columns = self.align_sheet_columns(sheet1, sheet2)
+        header1 = sheet1.row_cells(0) if len(sheet1) else []
+        header2 = sheet2.row_cells(0) if len(sheet2) else []
+        for col1, col2 in columns:
+            if col2 is None:
+                self._add_structural_change(differences, OfficeItem(
+                    sheet1.name, f"Column {get_column_letter(col1 + 1)}", self._header_text(header1, col1)), None)
+            elif col1 is None:
+                self._add_structural_change(differences, None, OfficeItem(
+                    sheet2.name, f"Column {get_column_letter(col2 + 1)}", self._header_text(header2, col2)))
+        common = [(col1, col2) for col1, col2 in columns if col1 is not None and col2 is not None]
+        
+        # Changes are collected with their row position (in the modified sheet
+        # where the row exists) and added in sheet order
+        changes: List[Tuple[Tuple[int, int], Optional[OfficeItem], Optional[OfficeItem]]] = []
+        hashes = self.sheet_row_hashes(sheet1, sheet2, common)
+        aligned = []
+        for index1, index2 in self.align_sheet_rows(sheet1, sheet2, common, hashes):
+            if index2 is None:
+                changes.append(((index1, -1), self._sheet_row_item(sheet1, index1), None))
+            elif index1 is None:
+                changes.append(((index2, -1), None, self._sheet_row_item(sheet2, index2)))
+            else:
+                aligned.append((index1, index2))
+        
+        changed_pairs = self.changed_row_pairs(aligned, hashes)
+        for index1, index2, col1, col2, text1, text2 in self.compare_sheet_rows(sheet1, sheet2, changed_pairs, common):
+            changes.append((
+                (index2, col2),
+                OfficeItem(sheet1.name, f"{get_column_letter(col1 + 1)}{sheet1.row_numbers[index1]}", text1)
+                if text1.strip() else None,
+                OfficeItem(sheet2.name, f"{get_column_letter(col2 + 1)}{sheet2.row_numbers[index2]}", text2)
+                if text2.strip() else None))
+        
+        changes.sort(key=lambda change: change[0])
+        for _, old, new in changes:
+            self._add_structural_change(differences, old, new)
+    
+    def align_sheet_columns(self, sheet1: SheetTable, sheet2: SheetTable) -> List[Tuple[Optional[int], Optional[int]]]:
+        """Pair up the columns (0-based) of two sheets by their header cells.
         
-        # Step 7: Convert images to base64 for HTML
-        images1_b64 = self.save_images_to_base64(annotated1, "original")
-        images2_b64 = self.save_images_to_base64(annotated2, "modified")
+        Header cells are aligned with the configured diff engine; renamed
+        headers in place pair up by position. Columns past the header (data
+        without a heading) pair up by position from the end of the header.
+        """
+        header1 = [self.normalize_text_for_comparison(text) for text in (sheet1.row_cells(0) if len(sheet1) else [])]
+        header2 = [self.normalize_text_for_comparison(text) for text in (sheet2.row_cells(0) if len(sheet2) else [])]
+        columns: List[Tuple[Optional[int], Optional[int]]] = []
+        for tag, i1, i2, j1, j2 in diff_opcodes(header1, header2, self.diff_engine):
+            paired = i2 - i1 if tag == 'equal' else min(i2 - i1, j2 - j1)
+            columns.extend((i1 + offset, j1 + offset) for offset in range(paired))
+            columns.extend((col1, None) for col1 in range(i1 + paired, i2))
+            columns.extend((None, col2) for col2 in range(j1 + paired, j2))
+        
+        width1, width2 = self._sheet_width(sheet1), self._sheet_width(sheet2)
+        extra = max(width1 - len(header1), width2 - len(header2), 0)
+        for offset in range(extra):
+            col1, col2 = len(header1) + offset, len(header2) + offset
+            columns.append((col1 if col1 < width1 else None, col2 if col2 < width2 else None))
+        return columns
+    
+    def align_sheet_rows(self, sheet1: SheetTable, sheet2: SheetTable, common: List[Tuple[int, int]],
+                         hashes: Tuple[Sequence[int], Sequence[int]]) -> List[Tuple[Optional[int], Optional[int]]]:
+        """Pair up the rows (indexes into SheetTable.rows) of two sheets.
+        
+        With sheet_key, rows pair up on equal key cells; rows with a repeated
+        key pair up on equal content first, then in order of occurrence.
+        Otherwise rows are aligned on their hashes over the common columns
+        (see sheet_row_hashes) with the configured diff engine: replaced runs
+        pair up by position, and a removed row equal to an added one is a
+        moved row (e.g. after sorting) rather than a change.
+        
+        Either way a row that only moved pairs up with itself, so moves are
+        not reported as differences; a moved row that was also edited is
+        reported as changed cells with a key, and as removed and added
+        without one.
+        """
+        hashes1, hashes2 = list(hashes[0]), list(hashes[1])
+        key_columns = self._sheet_key_columns(sheet1, sheet2, common)
+        if key_columns is not None:
+            key1, key2 = key_columns
+            groups1: Dict[str, List[int]] = {}
+            groups2: Dict[str, List[int]] = {}
+            for index in range(len(sheet1)):
+                groups1.setdefault(self._sheet_key(sheet1, index, key1), []).append(index)
+            for index in range(len(sheet2)):
+                groups2.setdefault(self._sheet_key(sheet2, index, key2), []).append(index)
+            rows: List[Tuple[Optional[int], Optional[int]]] = []
+            for key, removed in groups1.items():
+                added = groups2.pop(key, [])
+                if added and (len(removed) > 1 or len(added) > 1):
+                    # A repeated key: unchanged rows pair up first, as without a key
+                    added_by_hash: Dict[int, List[int]] = {}
+                    for index2 in reversed(added):
+                        added_by_hash.setdefault(hashes2[index2], []).append(index2)
+                    equal1, equal2 = set(), set()
+                    for index1 in removed:
+                        matches = added_by_hash.get(hashes1[index1])
+                        if matches:
+                            index2 = matches.pop()
+                            rows.append((index1, index2))
+                            equal1.add(index1)
+                            equal2.add(index2)
+                    removed = [index1 for index1 in removed if index1 not in equal1]
+                    added = [index2 for index2 in added if index2 not in equal2]
+                paired = min(len(removed), len(added))
+                rows.extend(zip(removed[:paired], added[:paired]))
+                rows.extend((index1, None) for index1 in removed[paired:])
+                rows.extend((None, index2) for index2 in added[paired:])
+            rows.extend((None, index2) for added in groups2.values() for index2 in added)
+            return rows
+        
+        rows = []
+        blocks = []  # (removed, added) row indexes of each differing run
+        for tag, i1, i2, j1, j2 in diff_opcodes(hashes1, hashes2, self.diff_engine):
+            if tag == 'equal':
+                rows.extend(zip(range(i1, i2), range(j1, j2)))
+            else:
+                blocks.append((list(range(i1, i2)), list(range(j1, j2))))
+        
+        # Removed rows equal to an added row were moved (e.g. by sorting), not edited
+        added_by_hash: Dict[int, List[int]] = {}
+        for _, added in blocks:
+            for index2 in reversed(added):
+                added_by_hash.setdefault(hashes2[index2], []).append(index2)
+        moved1, moved2 = set(), set()
+        for removed, _ in blocks:
+            for index1 in removed:
+                matches = added_by_hash.get(hashes1[index1])
+                if matches:
+                    index2 = matches.pop()
+                    rows.append((index1, index2))
+                    moved1.add(index1)
+                    moved2.add(index2)
+        
+        # What is left of each run pairs up by position, as edited rows
+        for removed, added in blocks:
+            removed = [index1 for index1 in removed if index1 not in moved1]
+            added = [index2 for index2 in added if index2 not in moved2]
+            paired = min(len(removed), len(added))
+            rows.extend(zip(removed[:paired], added[:paired]))
+            rows.extend((index1, None) for index1 in removed[paired:])
+            rows.extend((None, index2) for index2 in added[paired:])
+        return rows
+    
+    def sheet_row_hashes(self, sheet1: SheetTable, sheet2: SheetTable,
+                         common: List[Tuple[int, int]]) -> Tuple[Sequence[int], Sequence[int]]:
+        """Row hashes of both sheets over the columns they have in common.
         
-        # Step 8: Generate HTML report
-        html_content = self.generate_html_report(
-            file1_path, file2_path, images1_b64, images2_b64, differences)
+        These are the stored row hashes, unless columns were added, removed or
+        moved; then only the common columns are hashed.
+        """
+        if all(col1 == col2 for col1, col2 in common) and \
+                len(common) == max(self._sheet_width(sheet1), self._sheet_width(sheet2)):
+            return sheet1.row_hashes, sheet2.row_hashes
+        return (self._projected_row_hashes(sheet1, [col1 for col1, _ in common]),
+                self._projected_row_hashes(sheet2, [col2 for _, col2 in common]))
+    
+    def changed_row_pairs(self, pairs: List[Tuple[int, int]],
+                          hashes: Tuple[Sequence[int], Sequence[int]]) -> List[Tuple[int, int]]:
+        """The aligned row pairs whose hashes over the common columns differ.
         
-        # Step 8: Save HTML report
-        report_path = self.comparison_dir / "comparison_report.html"
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        With numpy all pairs are checked in one vectorized comparison, so only
+        the rows that changed are ever split into cells.
+        """
+        if not pairs:
+            return []
+        if np is None:
+            return [(index1, index2) for index1, index2 in pairs if hashes[0][index1] != hashes[1][index2]]
+        indexes = np.array(pairs, dtype=np.int64)
+        hashes1 = np.asarray(hashes[0], dtype=np.int64)
+        hashes2 = np.asarray(hashes[1], dtype=np.int64)
+        differ = hashes1[indexes[:, 0]] != hashes2[indexes[:, 1]]
+        return [(int(index1), int(index2)) for index1, index2 in indexes[differ]]
+    
+    def compare_sheet_rows(self, sheet1: SheetTable, sheet2: SheetTable, pairs: List[Tuple[int, int]],
+                           common: List[Tuple[int, int]]) -> Iterator[Tuple[int, int, int, int, str, str]]:
+        """Yield (row index1, row index2, col1, col2, text1, text2) of every changed cell of the row pairs."""
+        for index1, index2 in pairs:
+            cells1, cells2 = sheet1.row_cells(index1), sheet2.row_cells(index2)
+            for col1, col2 in common:
+                text1 = cells1[col1] if col1 < len(cells1) else ''
+                text2 = cells2[col2] if col2 < len(cells2) else ''
+                if text1 != text2 and \
+                        self.normalize_text_for_comparison(text1) != self.normalize_text_for_comparison(text2):
+                    yield index1, index2, col1, col2, text1, text2
+    
+    def _sheet_key_columns(self, sheet1: SheetTable, sheet2: SheetTable,
+                           common: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        """Columns of sheet_key in both sheets: a header name, or a column letter of the original."""
+        if not self.sheet_key:
+            return None
+        from openpyxl.utils import column_index_from_string
+        
+        # A header name first, so a column named like a letter ('ID') still matches by name
+        header = sheet1.row_cells(0) if len(sheet1) else []
+        name = self.normalize_text_for_comparison(self.sheet_key)
+        key_columns = next(((col1, col2) for col1, col2 in common
+                            if col1 < len(header) and self.normalize_text_for_comparison(header[col1]) == name), None)
+        if key_columns is None and re.fullmatch(r'[A-Za-z]{1,3}', self.sheet_key):
+            key1 = column_index_from_string(self.sheet_key.upper()) - 1
+            key_columns = next(((col1, col2) for col1, col2 in common if col1 == key1), None)
+        if key_columns is None:
+            print(f"Key column '{self.sheet_key}' not in both versions of sheet '{sheet1.name}'; aligning rows by content")
+        return key_columns
+    
+    def _sheet_key(self, sheet: SheetTable, index: int, col: int) -> str:
+        """Normalized key cell of a row."""
+        cells = sheet.row_cells(index)
+        return self.normalize_text_for_comparison(cells[col]) if col < len(cells) else ''
+    
+    @staticmethod
+    def _projected_row_hashes(sheet: SheetTable, cols: List[int]) -> List[int]:
+        """Hash of each row over the given columns only."""
+        hashes = []
+        for index in range(len(sheet)):
+            cells = sheet.row_cells(index)
+            hashes.append(hash(tuple(cells[col] if col < len(cells) else '' for col in cols)))
+        return hashes
+    
+    @staticmethod
+    def _sheet_width(sheet: SheetTable) -> int:
+        """Number of columns of the widest row of a sheet."""
+        return max((row.count(SheetTable.CELL_SEPARATOR) + 1 for row in sheet.rows), default=0)
+    
+    @staticmethod
+    def _header_text(header: List[str], col: int) -> str:
+        return header[col] if col < len(header) and header[col].strip() else '(no header)'
+    
+    @staticmethod
+    def _sheet_row_item(sheet: SheetTable, index: int) -> OfficeItem:
+        """A whole row as one item, for added and removed rows."""
+        text = ' | '.join(cell for cell in sheet.row_cells(index) if cell.strip())
+        return OfficeItem(sheet.name, f"Row {sheet.row_numbers[index]}", text)
+    
+    def office_item_html(self, item: Optional[OfficeItem], differences: Dict) -> str:
+        """Escaped text of an item with its changed words highlighted."""
+        if item is None:
+            return ''
+        if item not in differences['word_level']:
+            return html.escape(item.text)
+        change_type, word_diffs, _ = differences['word_level'][item]
+        side = word_diffs[change_type]
+        words = []
+        for word_idx, word in enumerate(item.text.split()):
+            style = next((name for name in ('deletions', 'insertions', 'modifications')
+                          if word_idx in side.get(name, ())), None)
+            word = html.escape(word)
+            words.append(f'<span class="word-{style.rstrip("s")}">{word}</span>' if style else word)
+        return ' '.join(words)
+    
+    def generate_structural_report(self, file1_path: str, file2_path: str, differences: Dict) -> str:
+        """HTML report of a structural comparison: one table of changed items per section."""
+        html_content = self.report_header_html(file1_path, file2_path, self.count_differences(differences))
+        
+        changes = differences['changes']
+        sections: Dict[str, List[Tuple[str, Optional[OfficeItem], Optional[OfficeItem]]]] = {}
+        for change in changes[:STRUCTURAL_REPORT_MAX_CHANGES]:
+            item = change[1] or change[2]
+            sections.setdefault(item.section, []).append(change)
+        
+        if not changes:
+            html_content += """
+            <div class="unchanged-pages">No differences found</div>
+            """
         
-        print(f"\n{'='*60}")
-        print("DOCUMENT COMPARISON COMPLETE")
-        print(f"{'='*60}")
-        print(f"Comparison folder: {self.comparison_dir}")
-        print(f"Report saved: {report_path}")
-        print(f"Total changes found: {len(differences['deletions']) + len(differences['insertions']) + len([x for x in differences['modifications'] if x[0] == 'old'])}")
-        print(f"  - Deletions: {len(differences['deletions'])}")
-        print(f"  - Insertions: {len(differences['insertions'])}")
-        print(f"  - Modifications: {len([x for x in differences['modifications'] if x[0] == 'old'])}")
-        print(f"{'='*60}")
+        for section_idx, (section, section_changes) in enumerate(sections.items(), 1):
+            html_content += f"""
+            <div class="page-container" id="section-{section_idx}">
+                <div class="page-header">
+                    {html.escape(section)}: {len(section_changes)} change{'s' if len(section_changes) != 1 else ''}
+                </div>
+                <table class="change-table">
+                    <tr><th>Location</th><th>Original</th><th>Modified</th></tr>
+"""
+            for change_type, old, new in section_changes:
+                if old is None or new is None or old.location == new.location:
+                    location = html.escape((old or new).location)
+                else:
+                    location = f"{html.escape(old.location)} &rarr; {html.escape(new.location)}"
+                html_content += f"""
+                    <tr class="change-{change_type}">
+                        <td class="change-location">{location}</td>
+                        <td>{self.office_item_html(old, differences)}</td>
+                        <td>{self.office_item_html(new, differences)}</td>
+                    </tr>
+"""
+            html_content += """
+                </table>
+            </div>
+            """
+        
+        if len(changes) > STRUCTURAL_REPORT_MAX_CHANGES:
+            html_content += f"""
+            <div class="unchanged-pages">
+                {len(changes) - STRUCTURAL_REPORT_MAX_CHANGES} more change(s) are listed in {DIFF_NAME}
+            </div>
+            """
         
-        return str(report_path)
+        html_content += self.report_footer_html(
+            'Sections', [(f"section-{section_idx}", html.escape(section))
+                         for section_idx, section in enumerate(sections, 1)])
+        return html_content
+    
+    def structural_differences_to_json(self, file1_path: str, file2_path: str, differences: Dict) -> Dict:
+        """Structured form of a structural comparison, the counterpart of differences_to_json.
+        
+        Each change has its type, section, the 'original' and 'modified' item
+        ({location, text}, null for the missing side) and, for modifications,
+        the changed words of each side.
+        """
+        def item_json(item):
+            return None if item is None else {'location': item.location, 'text': item.text}
+        
+        changes = []
+        for change_type, old, new in differences['changes']:
+            change = {'type': change_type, 'section': (old or new).section,
+                      'original': item_json(old), 'modified': item_json(new)}
+            if change_type == 'modification':
+                change['words'] = [
+                    {'type': word_type.rstrip('s'), 'side': 'original' if side == 'old' else 'modified',
+                     'index': word_idx, 'text': item.text.split()[word_idx]}
+                    for side, item in (('old', old), ('new', new))
+                    for word_type, indices in sorted(differences['word_level'][item][1][side].items())
+                    for word_idx in sorted(indices)
+                ]
+            changes.append(change)
+        
+        return {
+            'original': os.path.basename(file1_path),
+            'modified': os.path.basename(file2_path),
+            'mode': 'structural',
+            'summary': self.count_differences(differences),
+            'changes': changes,
+        }
+    
+    def benchmark_diff_engines(self, file1_path: str, file2_path: str, repeat: int = 3) -> Dict[str, Dict]:
+        """Time line alignment of two documents with every diff engine and print a table."""
+        self._create_comparison_dir()
+        try:
+            _, blocks1 = self.load_document(file1_path, render=False)
+            _, blocks2 = self.load_document(file2_path, render=False)
+        finally:
+            shutil.rmtree(self.comparison_dir, ignore_errors=True)
+        
+        lines1, _ = self.flatten_blocks(blocks1)
+        lines2, _ = self.flatten_blocks(blocks2)
+        print(f"\nDiff engine benchmark: {len(lines1)} vs {len(lines2)} lines (best of {repeat})")
+        
+        results = {}
+        for engine in DIFF_ENGINES:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                opcodes = diff_opcodes(lines1, lines2, engine)
+                timings.append(time.perf_counter() - start)
+            matched = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+            results[engine] = {'seconds': min(timings), 'matched_lines': matched}
+            print(f"  {engine:<10} {min(timings) * 1000:10.1f} ms   {matched} matched lines")
+        return results
+
+
+def _load_document_job(comparator: DocumentComparator, file_path: str, render: bool
+                       ) -> Tuple[BlockTable, Optional[Tuple[str, List[Tuple[str, Tuple[int, int], int]]]], List[Dict]]:
+    """Load one document in a pool worker (see DocumentComparator.load_documents_concurrently).
+    
+    Returns the text blocks, a reference to the page pixels (the path of the
+    raw file they were spilled to and the layout of its pages, or None when
+    not rendered) and the stages recorded while loading.
+    """
+    comparator.metrics = StageMetrics()
+    try:
+        images, blocks = comparator.load_document(file_path, render)
+    finally:
+        if comparator.cache:
+            comparator.cache.release()
+    pages = None
+    if images is not None:
+        spill_path = str(comparator._converted_pdf_path(file_path).with_suffix('.pages'))
+        pages = (spill_path, _spill_pages(images, spill_path))
+    return blocks, pages, comparator.metrics.stages
+
+
+def _spill_pages(images: List[Image.Image], path: str) -> List[Tuple[str, Tuple[int, int], int]]:
+    """Write page images to a raw pixel file, dropping each page once written.
+    
+    Returns the (mode, size, byte length) of every page, in file order.
+    """
+    layout = []
+    with open(path, 'wb') as f:
+        for i, img in enumerate(images):
+            data = img.tobytes()
+            f.write(data)
+            layout.append((img.mode, img.size, len(data)))
+            images[i] = None
+    return layout
+
+
+def _read_spilled_pages(path: str, layout: List[Tuple[str, Tuple[int, int], int]]) -> List[Image.Image]:
+    """Read back the pages written by _spill_pages, one at a time, and delete the file."""
+    try:
+        with open(path, 'rb') as f:
+            return [Image.frombytes(mode, size, f.read(length)) for mode, size, length in layout]
+    finally:
+        os.remove(path)
+
+
+# Queue progress events of serve-mode jobs are put on (set in each worker by _init_worker)
+_progress_queue = None
+
+
+def _init_worker(progress_queue=None):
+    """Initialize a pooled worker process.
+
+    Progress messages from DocumentComparator go to stdout; in worker mode
+    stdout carries the JSON-lines protocol, so they are sent to stderr instead.
+    Progress events of jobs are put on progress_queue for the serving process
+    to write out.
+    """
+    global _progress_queue
+    sys.stdout = sys.stderr
+    _progress_queue = progress_queue
+
+
+def run_comparison_job(job: Dict, comparator_kwargs: Optional[Dict] = None) -> Dict:
+    """Run a single comparison job inside a worker and return a JSON-serializable result."""
+    job_id = job.get('id')
+    try:
+        file1, file2 = job['file1'], job['file2']
+        for file_path in (file1, file2):
+            if not Path(file_path).exists():
+                raise FileNotFoundError(f"File '{file_path}' not found.")
+
+        comparator = DocumentComparator(**(comparator_kwargs or {}))
+        if _progress_queue is not None:
+            comparator.progress_callback = lambda stage, done, total: _progress_queue.put(
+                {'id': job_id, 'event': 'progress', 'stage': stage, 'done': done, 'total': total})
+        comparator.compare_pdfs(file1, file2)
+        return {
+            'id': job_id,
+            'success': True,
+            'status': 'ok',
+            'reportPath': os.path.abspath(comparator.report_path) if comparator.report_path else None,
+            'diffPath': os.path.abspath(comparator.diff_path) if comparator.diff_path else None,
+            'comparisonDir': os.path.abspath(comparator.comparison_dir),
+            'counts': comparator.summary,
+            'cached': comparator.cache_hit,
+            'metrics': comparator.metrics.to_json(),
+        }
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _job_error(job_id, str(e))
+    finally:
+        # A pool worker's children must be gone before it exits, or exiting blocks
+        # joining them; the render pool lives for one job
+        _shutdown_process_pool()
+
+
+def _job_error(job_id: Optional[str], message: str) -> Dict:
+    """Result line of a serve-mode job that failed or could not be run."""
+    return {'id': job_id, 'success': False, 'status': 'error', 'error': message}
+
+
+def _validate_job(job) -> Optional[str]:
+    """Why a decoded serve-mode input line is not a valid job, or None if it is."""
+    if not isinstance(job, dict):
+        return f"expected a JSON object, got {type(job).__name__}"
+    if not isinstance(job.get('id'), str):
+        return "'id' must be a string"
+    for key in ('file1', 'file2'):
+        if not isinstance(job.get(key), str):
+            return f"'{key}' must be a string"
+    return None
+
+
+def serve(max_workers: int, comparator_kwargs: Optional[Dict] = None):
+    """Serve comparison jobs over stdin/stdout using a JSON-lines protocol.
+
+    Each input line is a job: {"id": ..., "file1": ..., "file2": ...}.
+    Each output line is the result of one job (in completion order), as
+    returned by run_comparison_job, or a progress event of a running job:
+    {"id": ..., "event": "progress", "stage": ..., "done": ..., "total": ...}
+    (stage is one of PROGRESS_STAGES; done and total count pages, documents
+    or page regions of the stage, or are null). A line that is not a valid job
+    gets an error result ("status": "error", with the job's id if it has one)
+    and the server keeps reading. Jobs are run by a bounded pool
+    of long-lived worker processes, so interpreter startup and the heavy
+    imports are paid once per worker rather than once per comparison.
+    """
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def emit(message: Dict):
+        with write_lock:
+            protocol_out.write(json.dumps(message) + "\n")
+            protocol_out.flush()
+
+    # Workers put progress events on a shared queue; a thread writes them out
+    progress_queue = multiprocessing.Queue()
+
+    def forward_progress():
+        for message in iter(progress_queue.get, None):
+            emit(message)
+
+    forwarder = threading.Thread(target=forward_progress, daemon=True)
+    forwarder.start()
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                   initargs=(progress_queue,))
+
+    pool = new_pool()
+    emit({'event': 'ready', 'workers': max_workers})
+
+    def on_done(job_id, future):
+        try:
+            emit(future.result())
+        except BrokenProcessPool as e:
+            emit(_job_error(job_id, f"Worker crashed: {e}"))
+        except Exception as e:
+            emit(_job_error(job_id, str(e)))
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit(_job_error(None, f"Invalid job: {e}"))
+            continue
+        problem = _validate_job(job)
+        if problem:
+            emit(_job_error(job.get('id') if isinstance(job, dict) else None, f"Invalid job: {problem}"))
+            continue
+
+        # A job that cannot be dispatched fails alone; the loop keeps serving
+        job_id = job['id']
+        try:
+            try:
+                future = pool.submit(run_comparison_job, job, comparator_kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); replace the pool and retry once
+                pool.shutdown(wait=False)
+                pool = new_pool()
+                future = pool.submit(run_comparison_job, job, comparator_kwargs)
+            future.add_done_callback(lambda f, job_id=job_id: on_done(job_id, f))
+        except Exception as e:
+            emit(_job_error(job_id, f"Could not start job: {e}"))
+
+    # stdin closed: finish outstanding jobs before exiting
+    pool.shutdown(wait=True)
+    progress_queue.put(None)
+    forwarder.join()
 
 
 def main():
@@ -1113,26 +3955,111 @@ Examples:
     python doc_compare.py spreadsheet1.xlsx spreadsheet2.xlsx
     python doc_compare.py presentation1.pptx presentation2.pptx
     python doc_compare.py file1.docx file2.pdf
-    
+    python doc_compare.py --serve --workers 4
+
 The tool will:
 1. Convert documents to PDF format if needed (DOCX, XLSX, PPTX)
 2. Convert PDFs to high-resolution images
 3. Extract text with position information
-4. Pad shorter document with empty pages
+4. Align the pages of both documents (inserted and deleted pages)
 5. Find content differences (ignoring layout-only changes)
 6. Mark changes on images with colors:
    - Red: Deletions
    - Green: Insertions  
    - Orange: Modifications
-7. Generate HTML report in temp/ directory
+7. Generate HTML report in temp/ directory, and the differences as JSON
+
+Reports are cached by the content hashes of both files, so comparing the
+same two versions again returns the existing report immediately.
+
+With --serve the tool runs as a long-lived worker: it reads comparison jobs
+as JSON lines on stdin ({"id": ..., "file1": ..., "file2": ...}) and writes
+one JSON result line per job to stdout, plus progress events of running jobs.
         """
     )
     
-    parser.add_argument('file1', help='Path to the first document file (original) - supports PDF, DOCX, XLSX, PPTX')
-    parser.add_argument('file2', help='Path to the second document file (modified) - supports PDF, DOCX, XLSX, PPTX')
+    parser.add_argument('file1', nargs='?', help='Path to the first document file (original) - supports PDF, DOCX, XLSX, PPTX')
+    parser.add_argument('file2', nargs='?', help='Path to the second document file (modified) - supports PDF, DOCX, XLSX, PPTX')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a long-lived worker reading JSON-lines jobs from stdin')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                        help='Number of worker processes in --serve mode (default: min(4, CPU count))')
+    parser.add_argument('--render-workers', type=int,
+                        help='Worker processes a comparison may use to render pages of large documents and '
+                             'to load both documents concurrently (default: min(4, CPU count); with --serve, '
+                             'per job, CPU count / --workers, so all jobs together use the CPUs once)')
+    parser.add_argument('--render-mode', choices=RENDER_MODES, default='all',
+                        help="'all' renders every page; 'changed' renders only pages with differences "
+                             "and collapses unchanged pages in the report")
+    parser.add_argument('--colorspace', choices=list(RENDER_COLORSPACES), default='rgb',
+                        help="Colorspace pages are rendered in; 'gray' is faster and pages with changes "
+                             "are still annotated in color (default: rgb)")
+    parser.add_argument('--image-format', choices=list(IMAGE_FORMATS), default='png',
+                        help='Format of the annotated page images (default: png)')
+    parser.add_argument('--embed-images', action='store_true',
+                        help='Inline page images into the HTML report as base64 instead of linking files')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Diff the text first, then render, annotate and write pages one at a time '
+                             '(bounded memory for very large documents)')
+    parser.add_argument('--diff-engine', choices=DIFF_ENGINES, default='patience',
+                        help="Line alignment algorithm: 'patience' (default), 'myers' or 'difflib' (SequenceMatcher)")
+    parser.add_argument('--visual-diff', choices=VISUAL_DIFF_MODES, default='auto',
+                        help="Pixel diff of page images (needs numpy): 'auto' (default) for pages without "
+                             "a text layer such as scans, 'on' for every page without text changes, 'off' to compare text only")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='both',
+                        help=f"'html' report, 'json' differences ({DIFF_NAME}, no page rendering) "
+                             "or 'both' (default)")
+    parser.add_argument('--office-mode', choices=OFFICE_MODES, default='render',
+                        help="'render' converts DOCX/XLSX/PPTX to PDF and compares pages (default); "
+                             "'structural' compares paragraphs, cells and slide shapes directly")
+    parser.add_argument('--sheet-key', metavar='COLUMN',
+                        help="With --office-mode structural, align spreadsheet rows on this key column "
+                             "(a letter such as A, or a header name) instead of by row content")
+    parser.add_argument('--benchmark-diff', action='store_true',
+                        help='Time every diff engine on the text of file1 and file2 instead of writing a report')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Load the two documents one after the other instead of concurrently '
+                             '(the default with 2 CPUs or fewer)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Write the wall time, CPU time, peak RSS and page/block counts of every "
+                             "comparison stage as JSON to FILE ('-' for stdout)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always run the comparison instead of reusing a cached report')
+    parser.add_argument('--cache-size-mb', type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help='Size limit of the report cache in temp/cache; least recently used reports are evicted')
     
     args = parser.parse_args()
     
+    cpus = os.cpu_count() or 1
+    render_workers = args.render_workers
+    if render_workers is None:
+        render_workers = max(1, cpus // max(1, args.workers)) if args.serve else max(1, min(4, cpus))
+    
+    comparator_kwargs = {
+        'use_cache': not args.no_cache,
+        'cache_max_bytes': args.cache_size_mb * 1024 * 1024,
+        'render_workers': render_workers,
+        # Concurrent loading only pays off with spare cores
+        'pipeline': not args.sequential and cpus > 2,
+        'render_mode': args.render_mode,
+        'image_format': args.image_format,
+        'embed_images': args.embed_images,
+        'diff_engine': args.diff_engine,
+        'streaming': args.streaming,
+        'colorspace': args.colorspace,
+        'visual_diff': args.visual_diff,
+        'output_format': args.output_format,
+        'office_mode': args.office_mode,
+        'sheet_key': args.sheet_key,
+    }
+    
+    if args.serve:
+        serve(max(1, args.workers), comparator_kwargs)
+        return
+    
+    if not args.file1 or not args.file2:
+        parser.error('file1 and file2 are required unless --serve is given')
+    
     # Validate input files
     if not Path(args.file1).exists():
         print(f"Error: File '{args.file1}' not found.")
@@ -1142,10 +4069,19 @@ The tool will:
         print(f"Error: File '{args.file2}' not found.")
         sys.exit(1)
     
+    if args.benchmark_diff:
+        DocumentComparator(**comparator_kwargs).benchmark_diff_engines(args.file1, args.file2)
+        return
+    
     try:
-        comparator = DocumentComparator()
+        comparator = DocumentComparator(**comparator_kwargs)
         report_path = comparator.compare_pdfs(args.file1, args.file2)
         print(f"\nOpen the report in your browser: file://{os.path.abspath(report_path)}")
+        if args.metrics == '-':
+            print(json.dumps(comparator.metrics.to_json(), indent=2))
+        elif args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                json.dump(comparator.metrics.to_json(), f, indent=2)
         
     except Exception as e:
         print(f"Error during comparison: {str(e)}")
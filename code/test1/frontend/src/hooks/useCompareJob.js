@@ -0,0 +1,118 @@
+import { useState, useEffect, useRef } from "react";
+import axios from "axios";
+
+const API_URL = 'http://localhost:5000';
+
+// Labels of the stages a running comparison job reports
+const STAGES = {
+    convert: 'Converting documents',
+    render: 'Rendering pages',
+    extract: 'Extracting text',
+    diff: 'Finding differences',
+    annotate: 'Annotating pages',
+    report: 'Writing report',
+};
+
+/**
+ * Comparison of two file versions, run as a backend comparison job.
+ *
+ * compare() submits the job, polls it every second for its progress and
+ * opens the report in a new tab once it is done. cancel() stops polling (the
+ * job itself keeps running on the backend); polling also stops when the
+ * component unmounts.
+ *
+ * @returns {{ running: boolean, progressText: string, compare: Function, cancel: Function }}
+ */
+export default function useCompareJob() {
+    const [running, setRunning] = useState(false);
+    const [job, setJob] = useState(null);
+    // Run of the current compare() call; set to null or replaced to stop it
+    const activeRun = useRef(null);
+
+    useEffect(() => () => {
+        activeRun.current = null;
+    }, []);
+
+    const cancel = () => {
+        activeRun.current = null;
+        setRunning(false);
+        setJob(null);
+    };
+
+    /**
+     * Compare two versions and open the report
+     *
+     * @param {Object} version1 - Original version (with its filePath)
+     * @param {Object} version2 - Modified version (with its filePath)
+     */
+    const compare = async (version1, version2) => {
+        const run = {};
+        activeRun.current = run;
+        const isActive = () => activeRun.current === run;
+
+        setRunning(true);
+        try {
+            // Submit the comparison as a job, then poll it for its progress
+            let response = await axios.post(`${API_URL}/api/compare-jobs`, {
+                pdf1Path: version1.filePath,
+                pdf2Path: version2.filePath,
+            }, {
+                headers: {
+                    'Content-Type': 'application/json'
+                }
+            });
+            let current = response.data.job;
+            while (isActive() && (current.status === 'queued' || current.status === 'running')) {
+                setJob(current);
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                if (!isActive()) {
+                    break;
+                }
+                response = await axios.get(`${API_URL}/api/compare-jobs/${current.id}`);
+                current = response.data.job;
+            }
+            if (!isActive()) {
+                return;  // Closed or unmounted while the job was running
+            }
+
+            if (current.status === 'done') {
+                // Only differences.json is written when the backend's output format is json
+                const reportPath = current.result.htmlPath || current.result.jsonPath;
+                if (!reportPath) {
+                    alert('The comparison finished but wrote no report.');
+                    return;
+                }
+                const newTab = window.open(`${API_URL}${reportPath}`, '_blank');
+                if (!newTab) {
+                    alert('Pop-up blocked. Please allow pop-ups and try again.');
+                }
+            } else {
+                alert('Failed to compare PDFs: ' + (current.error || 'Unknown error'));
+            }
+        } catch (error) {
+            if (isActive()) {
+                console.error('Error comparing PDFs:', error);
+                alert('An error occurred while comparing PDFs: ' + (error.response?.data?.message || error.message));
+            }
+        } finally {
+            if (isActive()) {
+                activeRun.current = null;
+                setRunning(false);
+                setJob(null);
+            }
+        }
+    };
+
+    // Progress line of the comparison job shown in the loading modal
+    let progressText;
+    if (!job) {
+        progressText = 'Submitting...';
+    } else if (job.status === 'queued') {
+        progressText = `Waiting in queue (position ${job.queuePosition})...`;
+    } else {
+        const stage = STAGES[job.stage] || 'Starting';
+        progressText = job.total ? `${stage} (${job.done} of ${job.total})...` : `${stage}...`;
+    }
+
+    return { running, progressText, compare, cancel };
+}
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import axios from "axios";
+import useCompareJob from "../hooks/useCompareJob";
 import "../css/file.css";
 
 function FilePageUser({ darkMode }) {
@@ -16,7 +17,7 @@ function FilePageUser({ darkMode }) {
     const [version1, setVersion1] = useState(null);
     const [version2, setVersion2] = useState(null);
     const [showVersionList, setShowVersionList] = useState(false);
-    const [showCompareLoading, setShowCompareLoading] = useState(false);
+    const compareJob = useCompareJob();
 
     // For development, use a hardcoded file URL
     // const sampleFileUrl = "http://localhost:5000/uploads/files/1744972682727-MDL_A4.pdf";
@@ -108,41 +109,13 @@ function FilePageUser({ darkMode }) {
         }
     };
 
-    const handleCompare = async () => {
+    const handleCompare = () => {
         if (!version1 || !version2) {
             alert('Please select two versions to compare.');
             return;
         }
 
-        setShowCompareLoading(true);
-        try {
-            const response = await axios.post('http://localhost:5000/api/compare-pdfs', {
-                pdf1Path: version1.filePath,
-                pdf2Path: version2.filePath,
-            }, {
-                headers: {
-                    'Content-Type': 'application/json'
-                }
-            });
-
-            if (response.data.success) {
-                const newTab = window.open(`http://localhost:5000${response.data.htmlPath}`, '_blank');
-                if (newTab) {
-                    newTab.onbeforeunload = () => {
-                        // Optionally notify the backend to delete the temp file
-                    };
-                } else {
-                    alert('Pop-up blocked. Please allow pop-ups and try again.');
-                }
-            } else {
-                alert('Failed to compare PDFs: ' + (response.data.message || 'Unknown error'));
-            }
-        } catch (error) {
-            console.error('Error comparing PDFs:', error);
-            alert('An error occurred while comparing PDFs: ' + (error.response?.data?.message || error.message));
-        } finally {
-            setShowCompareLoading(false);
-        }
+        compareJob.compare(version1, version2);
     };
 
     // Loading state
@@ -173,12 +146,13 @@ function FilePageUser({ darkMode }) {
     return (
         <div className={`file-container ${darkMode ? 'dark-mode' : ''}`}>
             {/* Compare Loading Modal */}
-            {showCompareLoading && (
+            {compareJob.running && (
                 <div className="compare-loading-modal">
                     <div className="compare-loading-content">
-                        <button className="close-modal-btn" onClick={() => setShowCompareLoading(false)} title="Close">&times;</button>
+                        <button className="close-modal-btn" onClick={compareJob.cancel} title="Close">&times;</button>
                         <div className="loading-spinner" style={{marginTop: '20px'}}></div>
                         <h3>Comparing versions...</h3>
+                        <p className="compare-progress">{compareJob.progressText}</p>
                         <p>This operation might take some time. You can continue working in other tabs.</p>
                     </div>
                 </div>